@@ -0,0 +1,137 @@
+#!coding=utf8
+"""
+Throughput and latency of zipserver under concurrent GET / Range requests.
+
+    python -m benchmark.http_load --clients 16 --seconds 10 --range 65536
+
+Serves a generated archive from an in-process ZipHTTPServer and reports
+requests per second, MB/s and latency percentiles. Give --url to load an
+already running server instead, --url may be repeated.
+"""
+import os
+import sys
+import time
+import random
+import urlparse
+import httplib
+import tempfile
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zippkg import ZipReader, ZipWriter
+from zipserver import ZipHTTPServer
+
+
+KB = 1 << 10
+
+
+def makeArchive(path, entries, size, store):
+    kws = {'compression_method': 0} if store else {}
+    names = []
+    with ZipWriter(path, **kws) as zipwriter:
+        for idx in range(entries):
+            name = 'entry-{}.bin'.format(idx)
+            # half random, half repeated, so deflate has some work to do
+            zipwriter.writestr(name, os.urandom(size // 2) + 'x' * (size - size // 2))
+            names.append(name)
+    return names
+
+
+def client(urls, range_size, deflate, deadline, results):
+    conns = {}
+    latencies, nbytes, errors = [], 0, 0
+    while time.time() < deadline:
+        url = urlparse.urlsplit(random.choice(urls))
+        conn = conns.get(url.netloc)
+        if conn is None:
+            conn = conns[url.netloc] = httplib.HTTPConnection(url.netloc)
+        headers = {}
+        if range_size:
+            start = random.randint(0, range_size * 8)
+            headers['Range'] = 'bytes={}-{}'.format(start, start + range_size - 1)
+        if deflate:
+            headers['Accept-Encoding'] = 'deflate'
+        start = time.time()
+        try:
+            conn.request('GET', url.path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+        except (httplib.HTTPException, IOError):
+            conns.pop(url.netloc).close()
+            errors += 1
+            continue
+        latencies.append(time.time() - start)
+        if response.status not in (200, 206):
+            errors += 1
+        nbytes += len(body)
+    for conn in conns.itervalues():
+        conn.close()
+    results.append((latencies, nbytes, errors))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * pct / 100.0), len(values) - 1)]
+
+
+def run(urls, clients, seconds, range_size, deflate):
+    results = []
+    deadline = time.time() + seconds
+    threads = [threading.Thread(target=client, args=(urls, range_size, deflate, deadline, results))
+               for _ in range(clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    latencies = sorted(l for result in results for l in result[0])
+    nbytes = sum(result[1] for result in results)
+    errors = sum(result[2] for result in results)
+    print('{} clients, {:.1f}s: {} requests, {} errors'.format(clients, elapsed, len(latencies), errors))
+    print('{:.1f} req/s, {:.2f} MB/s'.format(len(latencies) / elapsed, nbytes / elapsed / (1 << 20)))
+    print('latency ms: p50={:.2f} p90={:.2f} p99={:.2f} max={:.2f}'.format(
+        *[percentile(latencies, pct) * 1000 for pct in (50, 90, 99, 100)]))
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--url', action='append', default=[], help='load a running server')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--entries', type=int, default=32)
+    parser.add_argument('--size', type=int, default=1024, help='entry size in KB')
+    parser.add_argument('--range', type=int, default=0, help='request ranges of this many bytes')
+    parser.add_argument('--deflate', action='store_true', help='send Accept-Encoding: deflate')
+    parser.add_argument('--store', action='store_true', help='store entries without compression')
+    args = parser.parse_args(argv)
+
+    if args.url:
+        return 1 if run(args.url, args.clients, args.seconds, args.range, args.deflate) else 0
+
+    path = tempfile.mktemp(suffix='.zip')
+    names = makeArchive(path, args.entries, args.size * KB, args.store)
+    server = ZipHTTPServer(('127.0.0.1', 0), {'': ZipReader(path)})
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        host, port = server.server_address
+        urls = ['http://{}:{}/{}'.format(host, port, name) for name in names]
+        errors = run(urls, args.clients, args.seconds, args.range, args.deflate)
+    finally:
+        server.shutdown()
+        server.server_close()
+        for reader in server.readers.itervalues():
+            reader.close()
+        os.remove(path)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,249 @@
+#!coding=utf8
+"""
+Peak and steady-state memory of ZipReader / ZipWriter operations.
+
+    python -m benchmark.memory --sizes 1,4,16,64 --cryption AES_256
+
+Every measurement runs in a forked child. The peak is the kernel rss high water
+mark (reset through /proc/self/clear_refs), or sampled rss where that is not
+available. Operations which are expected to stay bounded are flagged when their
+peak grows linearly with the entry size.
+"""
+import os
+import re
+import gc
+import sys
+import time
+import shutil
+import pickle
+import tempfile
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zippkg import ZipReader, ZipWriter
+
+
+ENTRY_NAME = 'entry.bin'
+MB = 1 << 20
+# peak growth per entry byte above which an operation counts as linear
+LINEAR_SLOPE = 0.25
+
+
+def _status(key):
+    with open('/proc/self/status') as fd:
+        match = re.search(r'^%s:\s+(\d+) kB' % key, fd.read(), re.M)
+    return int(match.group(1)) * 1024 if match else None
+
+
+def rss():
+    return _status('VmRSS')
+
+
+class PeakMeter(object):
+    '''
+    peak rss of the current process between start() and stop()
+    '''
+    SAMPLE_INTERVAL = 0.001
+
+    def __init__(self):
+        self.peak = 0
+        self._thread = None
+        self._hwm = self._resetHighWaterMark()
+
+    def _resetHighWaterMark(self):
+        try:
+            with open('/proc/self/clear_refs', 'w') as fd:
+                fd.write('5')
+        except (IOError, OSError):
+            return False
+        return _status('VmHWM') is not None
+
+    def start(self):
+        self.peak = rss()
+        self._running = True
+        if not self._hwm:
+            self._thread = threading.Thread(target=self._sample)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _sample(self):
+        while self._running:
+            self.peak = max(self.peak, rss())
+            time.sleep(self.SAMPLE_INTERVAL)
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join()
+        if self._hwm:
+            self.peak = _status('VmHWM')
+        else:
+            self.peak = max(self.peak, rss())
+        return self.peak
+
+
+def makeContent(size, kind):
+    if kind == 'text':
+        line = 'The quick brown fox jumps over the lazy dog %d\n'
+        content = ''.join(line % i for i in xrange(size // len(line % 0) + 1))
+        return content[:size]
+    return os.urandom(size)
+
+
+# operations, each one gets a prepared workdir and returns nothing.
+# `bounded` tells whether the peak should be independent of the entry size.
+def opOpen(ctx):
+    ZipReader(ctx['archive'], password=ctx['password']).close()
+
+
+def opRead(ctx):
+    with ZipReader(ctx['archive'], password=ctx['password']) as zipreader:
+        zipreader.read(ENTRY_NAME)
+
+
+def opWrite(ctx):
+    with ZipWriter(os.path.join(ctx['workdir'], 'write.zip'), **ctx['writer_kws']) as zipwriter:
+        zipwriter.write(ctx['source'])
+
+
+def opExtract(ctx):
+    with ZipReader(ctx['archive'], password=ctx['password']) as zipreader:
+        zipreader.extract(ENTRY_NAME, os.path.join(ctx['workdir'], 'extract'))
+
+
+OPERATIONS = [
+    ('open', opOpen, True),
+    ('read', opRead, False),
+    ('write', opWrite, True),
+    ('extract', opExtract, True),
+]
+
+
+def forked(func, *args):
+    '''
+    run func(*args) in a forked child and return its result, so that the heap of
+    one measurement never leaks into the rss of the next one
+    '''
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        code = 0
+        try:
+            result = func(*args)
+        except BaseException as err:
+            result = err
+            code = 1
+        with os.fdopen(wfd, 'wb') as fd:
+            pickle.dump(result, fd, pickle.HIGHEST_PROTOCOL)
+        os._exit(code)
+
+    os.close(wfd)
+    with os.fdopen(rfd, 'rb') as fd:
+        result = pickle.load(fd)
+    os.waitpid(pid, 0)
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+def measure(func, ctx):
+    '''
+    returns (baseline, peak, steady) rss in bytes of func(ctx)
+    '''
+    gc.collect()
+    meter = PeakMeter()
+    baseline = rss()
+    meter.start()
+    func(ctx)
+    peak = meter.stop()
+    gc.collect()
+    return baseline, peak, rss()
+
+
+def prepare(workdir, size, kind, writer_kws):
+    '''
+    writes the entry file and its archive, both relative to the current directory
+    because ZipWriter.write names the entry with the given path
+    '''
+    with open(ENTRY_NAME, 'wb') as fd:
+        fd.write(makeContent(size, kind))
+    archive = os.path.join(workdir, 'archive.zip')
+    with ZipWriter(archive, **writer_kws) as zipwriter:
+        zipwriter.write(ENTRY_NAME)
+
+    return dict(
+        workdir=workdir,
+        source=ENTRY_NAME,
+        archive=archive,
+        password=writer_kws.get('password'),
+        writer_kws=writer_kws,
+    )
+
+
+def slope(points):
+    '''
+    growth of the peak per entry byte between the smallest and the largest size
+    '''
+    (size0, delta0), (size1, delta1) = points[0], points[-1]
+    if size1 == size0:
+        return 0.0
+    return float(delta1 - delta0) / (size1 - size0)
+
+
+def run(sizes, kind='random', writer_kws=None, out=sys.stdout):
+    writer_kws = writer_kws or {}
+    results = dict((name, []) for name, _, _ in OPERATIONS)
+
+    out.write('{:<8} {:>10} {:>12} {:>12} {:>12} {:>8}\n'.format(
+        'op', 'size(MB)', 'base(MB)', 'peak(MB)', 'steady(MB)', 'peak/sz'))
+    cwd = os.getcwd()
+    for size in sizes:
+        workdir = tempfile.mkdtemp(prefix='zippkg-memory-')
+        os.chdir(workdir)
+        try:
+            ctx = forked(prepare, workdir, size, kind, writer_kws)
+            for name, func, _ in OPERATIONS:
+                baseline, peak, steady = forked(measure, func, ctx)
+                results[name].append((size, peak - baseline, steady - baseline))
+                out.write('{:<8} {:>10.2f} {:>12.2f} {:>12.2f} {:>12.2f} {:>8.2f}\n'.format(
+                    name, float(size) / MB, float(baseline) / MB, float(peak) / MB,
+                    float(steady) / MB, float(peak - baseline) / size))
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir)
+
+    flagged = []
+    for name, _, bounded in OPERATIONS:
+        growth = slope([(size, delta) for size, delta, _ in results[name]])
+        if bounded and growth > LINEAR_SLOPE:
+            flagged.append(name)
+            out.write('FLAG {}: peak grows {:.2f} bytes per entry byte, expected bounded\n'.format(name, growth))
+    return results, flagged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sizes', default='1,4,16,64', help='entry sizes in MB, comma separated')
+    parser.add_argument('--data', default='random', choices=['random', 'text'])
+    parser.add_argument('--password', default=None)
+    parser.add_argument('--cryption', default=None, choices=['ZIP', 'AES_128', 'AES_192', 'AES_256'])
+    parser.add_argument('--store', action='store_true', help='store entries without compression')
+    args = parser.parse_args(argv)
+
+    writer_kws = {}
+    if args.password or args.cryption:
+        writer_kws['password'] = args.password or 'password'
+        writer_kws['cryption'] = args.cryption
+    if args.store:
+        writer_kws['compression_method'] = 0
+    sizes = [int(float(s) * MB) for s in args.sizes.split(',')]
+
+    _, flagged = run(sizes, args.data, writer_kws)
+    return 1 if flagged else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
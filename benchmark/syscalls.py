@@ -0,0 +1,67 @@
+#!coding=utf8
+"""
+Write calls ZipWriter issues on its output, with and without output buffering.
+
+    python -m benchmark.syscalls --entries 10000 --size 200
+
+The output is an unbuffered file (one write(2) per write call) wrapped in a
+counter, so the counts are the syscalls the writer makes on it.
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zippkg import ZipWriter
+
+
+class CountingFile(object):
+    def __init__(self, path):
+        self.fd = open(path, 'wb', 0)
+        self.name = path
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        self.fd.write(data)
+
+    def tell(self):
+        return self.fd.tell()
+
+    def close(self):
+        self.fd.close()
+
+
+def run(entries, size, buffer_size):
+    path = tempfile.mktemp(suffix='.zip')
+    out = CountingFile(path)
+    content = os.urandom(size // 2) + 'x' * (size - size // 2)
+    start = time.time()
+    with ZipWriter(out, buffer_size=buffer_size) as zipwriter:
+        for index in xrange(entries):
+            zipwriter.writestr('dir/entry-{}.bin'.format(index), content)
+    elapsed = time.time() - start
+    out.close()
+    archive_size = os.path.getsize(path)
+    os.remove(path)
+    return out.writes, archive_size, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--entries', type=int, default=10000)
+    parser.add_argument('--size', type=int, default=200, help='entry size in bytes')
+    parser.add_argument('--buffer-sizes', default='0,65536,1048576', help='comma separated, 0 is unbuffered')
+    args = parser.parse_args(argv)
+
+    print('{:>12} {:>10} {:>14} {:>10}'.format('buffer_size', 'writes', 'bytes/write', 'seconds'))
+    for buffer_size in [int(s) for s in args.buffer_sizes.split(',')]:
+        writes, archive_size, elapsed = run(args.entries, args.size, buffer_size)
+        print('{:>12} {:>10} {:>14.0f} {:>10.3f}'.format(buffer_size, writes, archive_size / float(writes), elapsed))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
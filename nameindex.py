@@ -0,0 +1,110 @@
+import re
+import bisect
+
+
+def translate(pattern):
+    '''
+    glob pattern to regex, `*` and `?` stay inside a path segment, `**` does not
+    '''
+    i, n = 0, len(pattern)
+    out = []
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+            continue
+        elif c == '*':
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            j = pattern.find(']', i + 1)
+            if j == -1:
+                out.append('\\[')
+            else:
+                chars = pattern[i + 1:j].replace('\\', '\\\\')
+                if chars.startswith('!'):
+                    chars = '^' + chars[1:]
+                out.append('[' + chars + ']')
+                i = j
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return '(?s)' + ''.join(out) + r'\Z'
+
+
+class NameIndex(object):
+    '''
+    hierarchical index of entry names. directories are the names ending with
+    `/`, plus the implicit parents of every name. `` is the root.
+
+    listdir and exists are dict lookups, glob bisects the sorted names to the
+    range of the literal prefix of the pattern.
+    '''
+    WILDCARDS = re.compile(r'[*?\[]')
+
+    def __init__(self, names):
+        self.names = sorted(set(names))
+        children = {'': set()}
+        for name in self.names:
+            parent = ''
+            parts = name.rstrip('/').split('/')
+            for index, part in enumerate(parts):
+                is_dir = index < len(parts) - 1 or name.endswith('/')
+                child = part + '/' if is_dir else part
+                children[parent].add(child)
+                if is_dir:
+                    parent += child
+                    children.setdefault(parent, set())
+        self.children = dict((path, sorted(names)) for path, names in children.iteritems())
+        self._names = set(self.names)
+
+    @staticmethod
+    def _dirpath(path):
+        path = path.strip('/')
+        return path + '/' if path else ''
+
+    def isdir(self, path):
+        return self._dirpath(path) in self.children
+
+    def exists(self, name):
+        return name in self._names or self.isdir(name)
+
+    def listdir(self, path=''):
+        '''
+        names of the children of path, directories end with `/`
+        '''
+        children = self.children.get(self._dirpath(path))
+        if children is None:
+            raise IOError('directory not found', path)
+        return list(children)
+
+    def walk(self, top=''):
+        '''
+        like os.walk top-down: yields (dirpath, dirnames, filenames), dirpath
+        ends with `/` except for the root
+        '''
+        stack = [self._dirpath(top)]
+        if stack[0] not in self.children:
+            return
+        while stack:
+            dirpath = stack.pop()
+            children = self.children[dirpath]
+            dirnames = [child[:-1] for child in children if child.endswith('/')]
+            filenames = [child for child in children if not child.endswith('/')]
+            yield dirpath, dirnames, filenames
+            stack.extend(dirpath + dirname + '/' for dirname in reversed(dirnames))
+
+    def iterPrefix(self, prefix):
+        index = bisect.bisect_left(self.names, prefix)
+        while index < len(self.names) and self.names[index].startswith(prefix):
+            yield self.names[index]
+            index += 1
+
+    def glob(self, pattern):
+        match = self.WILDCARDS.search(pattern)
+        if match is None:
+            return [pattern] if pattern in self._names else []
+        regex = re.compile(translate(pattern))
+        return [name for name in self.iterPrefix(pattern[:match.start()]) if regex.match(name)]
@@ -0,0 +1,183 @@
+#!coding=utf8
+"""
+Read-only entry index of a ZipReader in an mmapped file, for pre-fork worker
+pools: the parent exports it once, every worker attaches to it and shares its
+pages instead of parsing the central directory into its own ZipInfos.
+
+    zipreader.export_index('assets.zipindex')
+    ...
+    index = SharedIndex('assets.zipindex', 'assets.zip')  # in each worker
+    index.read('css/site.css')
+
+layout, little-endian:
+    header   HEADER: magic, version, entry count, archive size, central
+             directory offset, offsets of the records and the string table
+    records  RECORD per entry, sorted by utf8 name
+    strings  utf8 names and raw central directory headers
+"""
+import os
+import mmap
+import struct
+import tempfile
+
+from util import BadZipfile
+from util.stream import WindowStream
+from zipinfo import ZipInfo
+
+
+MAGIC = b'ZPKINDEX'
+VERSION = 1
+
+# magic, version, reserved, count, archive size, central directory offset,
+# records offset, strings offset
+HEADER = struct.Struct('<8sHHIQQQQ')
+# name offset, name length, header offset, header length, crc32, csize,
+# ucsize, data offset, local csize
+RECORD = struct.Struct('<QHQIIQQQQ')
+
+
+def exportIndex(zipreader, path):
+    '''
+    write the index of zipreader to path, atomically replacing an older one
+    '''
+    zipreader.resolveOffsets()
+    cd_offset = zipreader.end_central_dir.offset_start_central_dir
+
+    # later duplicates of a name win like in ZipReader.getinfo
+    entries = {}
+    for zinfo, header in zipreader.rawHeaders():
+        entries[zinfo.filename.encode('utf8')] = (zinfo, header)
+
+    names = sorted(entries)
+    records_offset = HEADER.size
+    strings_offset = records_offset + RECORD.size * len(names)
+    records, strings = [], []
+    position = 0
+    for name in names:
+        zinfo, header = entries[name]
+        strings.append(name)
+        strings.append(header)
+        records.append(RECORD.pack(
+            position, len(name), position + len(name), len(header),
+            zinfo.crc32, zinfo.csize, zinfo.ucsize, zinfo.data_offset, zinfo.local_csize or 0))
+        position += len(name) + len(header)
+
+    header = HEADER.pack(MAGIC, VERSION, 0, len(names), zipreader.size, cd_offset,
+                         records_offset, strings_offset)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(header)
+            out.write(''.join(records))
+            out.write(''.join(strings))
+        os.rename(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+
+class SharedIndex(object):
+    '''
+    attach to an index written by exportIndex. archive (path or file object)
+    is the zip it was exported from, attach after forking so every worker
+    has its own file handle.
+    '''
+
+    def __init__(self, path, archive, password=None):
+        self.password = password
+        with open(path, 'rb') as fd:
+            self.mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parseHeader(path)
+        except:
+            self.mm.close()
+            raise
+
+        self.file = archive
+        if isinstance(archive, basestring):
+            self.stream = open(archive, 'rb')
+        else:
+            self.stream = archive
+        self.stream.seek(0, os.SEEK_END)
+        if self.stream.tell() != self.archive_size:
+            self.close()
+            raise BadZipfile('index {} is stale, the archive size changed'.format(path))
+
+    def _parseHeader(self, path):
+        if len(self.mm) < HEADER.size:
+            raise BadZipfile('{} is not a zip index'.format(path))
+        magic, version, _, self.count, self.archive_size, self.cd_offset, \
+            self.records_offset, self.strings_offset = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise BadZipfile('{} is not a zip index'.format(path))
+        if version != VERSION:
+            raise BadZipfile('zip index version {} is not supported, expected {}'.format(version, VERSION))
+        if self.strings_offset != self.records_offset + RECORD.size * self.count:
+            raise BadZipfile('{} is truncated or corrupt'.format(path))
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, index):
+        return RECORD.unpack_from(self.mm, self.records_offset + RECORD.size * index)
+
+    def _name(self, record):
+        start = self.strings_offset + record[0]
+        return self.mm[start:start + record[1]]
+
+    def _find(self, name):
+        '''
+        record of name by binary search over the sorted records, or None
+        '''
+        if isinstance(name, unicode):
+            name = name.encode('utf8')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = self._record(mid)
+            key = self._name(record)
+            if key < name:
+                lo = mid + 1
+            elif key > name:
+                hi = mid
+            else:
+                return record
+        return None
+
+    def namelist(self):
+        '''
+        names in sorted order
+        '''
+        return [self._name(self._record(index)).decode('utf8') for index in xrange(self.count)]
+
+    def exists(self, name):
+        return self._find(name) is not None
+
+    def getinfo(self, name):
+        '''
+        ZipInfo of name, parsed from its raw central directory header
+        '''
+        record = self._find(name)
+        if record is None:
+            raise KeyError('There is no item named %r in the archive' % name)
+        start = self.strings_offset + record[2]
+        zinfo = ZipInfo(self.stream, password=self.password)
+        zinfo.readHeader(WindowStream(self.mm[start:start + record[3]]))
+        zinfo.data_offset = record[7]
+        zinfo.local_csize = record[8]
+        return zinfo
+
+    def read(self, name, password=None):
+        return self.getinfo(name).read(password=password or self.password)
+
+    def close(self):
+        if isinstance(self.file, basestring):
+            self.stream.close()
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
@@ -10,6 +10,7 @@ class Signature:
     CENTRAL_HEADER = b"PK\x01\x02"
 
     FILE_HEADER = b"PK\x03\x04"
+    DATA_DESCRIPTOR = b"PK\x07\x08"
 
     ZIP64_LOCATOR = b"PK\x06\x07"
     ZIP64_RECORD = b"PK\x06\x06"
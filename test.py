@@ -1,5 +1,15 @@
 #!coding=utf8
+import os
+import zlib
+import struct
+import tempfile
+from StringIO import StringIO
+
 from zippkg import ZipReader, ZipWriter
+from util import BadZipfile
+from zipstream import ZipStreamReader
+from zipinfo import ZipInfo
+from util.stats import Stats
 
 
 def test_zipreader_normal():
@@ -54,7 +64,1194 @@ def test_zipwriter():
             print name, len(zipreader.read(name))
 
 
+def _make_zip(files, **kws):
+    path = tempfile.mktemp(suffix='.zip')
+    with ZipWriter(path, **kws) as zipwriter:
+        for name, content in files:
+            zipwriter.writestr(name, content)
+    return path
+
+
+def test_stats():
+    stats = Stats()
+    events = []
+    stats.addHook(lambda event, zinfo, **info: events.append((event, zinfo.filename)))
+    path = tempfile.mktemp(suffix='.zip')
+    with ZipWriter(path, stats=stats, password='1234', cryption='AES_128') as zipwriter:
+        zipwriter.writestr('a.txt', 'a' * 1000)
+    with ZipReader(path, password='1234', stats=stats) as zipreader:
+        assert zipreader.read('a.txt') == 'a' * 1000
+    os.remove(path)
+
+    phases = stats.asDict()
+    for phase in ['_parseCentralDirectoryHeader', '_decrypt', '_decompress', 'checkCRC',
+                  '_compress', '_encrypt', 'close']:
+        assert phases[phase]['calls'] == 1, phase
+    assert phases['checkCRC']['bytes'] == 1000
+    assert events == [('write', 'a.txt'), ('header', 'a.txt'), ('read', 'a.txt')]
+
+    # the streaming path of testzip, open and extractall records the same phases
+    files = [('%d.txt' % i, str(i) * 1000) for i in range(4)]
+    path = _make_zip(files, password='1234', cryption='AES_128')
+    stats = Stats()
+    with ZipReader(path, password='1234', stats=stats) as zipreader:
+        assert zipreader.testzip() == []
+    phases = stats.asDict()
+    for phase in ['_decrypt', '_decompress', 'checkCRC']:
+        assert phases[phase]['calls'] == 4, phase
+    assert phases['_decompress']['bytes'] == phases['checkCRC']['bytes'] == 4000
+
+    # without stats nothing is timed
+    import zipinfo
+    calls = []
+
+    class Clock(object):
+        @staticmethod
+        def time():
+            calls.append(1)
+            return 0.0
+
+    zipinfo.time, clock = Clock, zipinfo.time
+    try:
+        with ZipReader(path, password='1234') as zipreader:
+            assert zipreader.testzip() == []
+    finally:
+        zipinfo.time = clock
+    os.remove(path)
+    assert calls == []
+
+    # counters shared by worker threads lose no update
+    import threading
+    stats = Stats()
+
+    def add():
+        for _ in range(10000):
+            stats.add('phase', 0.5, 2)
+    threads = [threading.Thread(target=add) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stats.asDict()['phase'] == {'calls': 80000, 'seconds': 40000.0, 'bytes': 160000}
+
+
+def test_testzip():
+    files = [('dir/%d.txt' % i, str(i) * 10000) for i in range(8)]
+    for kws in [{}, {'password': '1234'}, {'password': '1234', 'cryption': 'AES_256'}]:
+        path = _make_zip(files, **kws)
+        with ZipReader(path, password=kws.get('password')) as zipreader:
+            assert zipreader.testzip() == []
+            assert zipreader.testzip(workers=4) == []
+
+        # corrupt payload of the third entry
+        with ZipReader(path) as zipreader:
+            zinfo = zipreader.getinfo('dir/2.txt')
+            offset = zinfo.relative_offset_file_header + 30 + len('dir/2.txt') + zinfo.csize // 2
+        with open(path, 'r+b') as fd:
+            fd.seek(offset)
+            fd.write('\xff' * 2)
+        with ZipReader(path, password=kws.get('password')) as zipreader:
+            reports = zipreader.testzip(workers=4)
+        os.remove(path)
+        assert [report.filename for report in reports] == ['dir/2.txt']
+
+
+def test_read_many():
+    files = [('%03d.txt' % i, str(i) * (i * 100)) for i in range(50)]
+    path = _make_zip(files, password='1234')
+    with ZipReader(path, password='1234') as zipreader:
+        names = ['042.txt', '007.txt', '008.txt', '042.txt', '000.txt']
+        expect = [(name, dict(files)[name]) for name in names]
+        assert list(zipreader.read_many(names)) == expect
+        assert list(zipreader.read_many(names, order='offset', gap=0, max_read=1024)) == sorted(expect)
+        assert dict(zipreader.read_many(zipreader.namelist())) == dict(files)
+    os.remove(path)
+
+
+class _Pipe(object):
+    '''
+    non-seekable stream returning short reads
+    '''
+
+    def __init__(self, data):
+        self.stream = StringIO(data)
+
+    def read(self, size=-1):
+        return self.stream.read(min(size, 1000))
+
+
+def test_zipstream():
+    files = [('dir/%d.txt' % i, str(i) * (i * 30000)) for i in range(4)]
+    for kws in [{}, {'password': '1234'}, {'password': '1234', 'cryption': 'AES_192'}]:
+        path = _make_zip(files, **kws)
+        with open(path, 'rb') as fd:
+            data = fd.read()
+        os.remove(path)
+        entries = [(zinfo.filename, ''.join(chunks))
+                   for zinfo, chunks in ZipStreamReader(_Pipe(data), password=kws.get('password'))]
+        assert entries == files
+
+    # deflated entry followed by a data descriptor (general purpose flag bit 3)
+    content = 'data descriptor ' * 1000
+    cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    compressed = cmpr.compress(content) + cmpr.flush()
+    crc32 = zlib.crc32(content) & 0xffffffff
+    data = struct.pack('<4sHHHHHLLLHH', 'PK\x03\x04', 20, 0x8, 8, 0, 0, 0, 0, 0, 5, 0) + 'a.txt'
+    data += compressed + struct.pack('<4sLLL', 'PK\x07\x08', crc32, len(compressed), len(content))
+    data += 'PK\x05\x06' + '\x00' * 18
+    entries = [(zinfo.filename, ''.join(chunks), zinfo.crc32) for zinfo, chunks in ZipStreamReader(_Pipe(data))]
+    assert entries == [('a.txt', content, crc32)]
+
+
+def test_cache():
+    files = [('%d.txt' % i, str(i) * 1000) for i in range(10)]
+    path = _make_zip(files, password='1234')
+    with ZipReader(path, password='1234', cache_bytes=4000) as zipreader:
+        for name, content in files * 2:
+            assert zipreader.read(name) == content
+        assert zipreader.cache.asDict()['evictions'] == 16
+        assert zipreader.read('9.txt') == files[9][1]
+        with zipreader.open('9.txt') as fd:
+            assert fd.read(10) + fd.read() == files[9][1]
+        with zipreader.open('0.txt') as fd:
+            assert ''.join(fd) == files[0][1]
+        assert zipreader.read('0.txt') == files[0][1]
+        stats = zipreader.cache.asDict()
+        assert (stats['hits'], stats['misses'], stats['entries']) == (3, 21, 4)
+    os.remove(path)
+
+    # concurrent readers through a cache much smaller than the archive, off a
+    # path (private streams) and off a file object (the shared stream)
+    import threading
+    files = [('%d.bin' % i, os.urandom(500) * (i % 7 + 1)) for i in range(200)]
+    path = _make_zip(files)
+    for source in (path, open(path, 'rb')):
+        reads = []
+        with ZipReader(source, cache_bytes=1 << 16, stats=True) as zipreader:
+            zipreader.stats.addHook(lambda event, zinfo, **info: reads.append(zinfo.filename))
+            errors = []
+
+            def run(seed):
+                try:
+                    for i in range(len(files)):
+                        name, content = files[(i * 7 + seed) % len(files)]
+                        if i % 2:
+                            assert zipreader.read(name) == content
+                        else:
+                            with zipreader.open(name) as fd:
+                                assert fd.read() == content
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=run, args=(seed,)) for seed in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert errors == []
+
+            # threads missing the same entry at once decode it once
+            reads[:] = []
+            zipreader.cache.clear()
+            threads = [threading.Thread(target=zipreader.read, args=('6.bin',)) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert reads == ['6.bin']
+        if not isinstance(source, str):
+            source.close()
+    os.remove(path)
+
+
+def test_data_offsets():
+    files = [('%d.txt' % i, str(i) * 1000) for i in range(10)]
+    path = _make_zip(files, password='1234', cryption='AES_128')
+    with ZipReader(path, password='1234') as zipreader:
+        zipreader.resolveOffsets()
+        for name, content in files:
+            zinfo = zipreader.getinfo(name)
+            assert zinfo.data_offset == zinfo.relative_offset_file_header + 30 + len(name) + 11
+            assert zipreader.read(name) == content
+
+    # flip the general purpose bit flag of a local file header
+    with ZipReader(path) as zipreader:
+        offset = zipreader.getinfo('3.txt').relative_offset_file_header + 6
+    with open(path, 'r+b') as fd:
+        fd.seek(offset)
+        fd.write('\x00')
+    with ZipReader(path, password='1234') as zipreader:
+        assert zipreader.read('3.txt') == files[3][1]
+    with ZipReader(path, password='1234', check_local_header=True) as zipreader:
+        assert zipreader.read('2.txt') == files[2][1]
+        try:
+            zipreader.resolveOffsets()
+            assert False, 'local file header mismatch expected'
+        except BadZipfile:
+            pass
+    os.remove(path)
+
+
+def test_seekable():
+    content = ''.join('line %d %s\n' % (i, i * i) for i in range(30000))
+    for kws in [{}, {'password': '1234'}, {'password': '1234', 'cryption': 'AES_256'},
+                {'compression_method': 0}]:
+        path = _make_zip([('log.txt', content)], **kws)
+        with ZipReader(path, password=kws.get('password')) as zipreader:
+            with zipreader.open('log.txt', seekable=True, span=1 << 16, checkpoint_bytes=200 << 10) as fd:
+                for offset in [0, 400000, 10, len(content) - 5, 200000, 200001, 3, len(content) + 10]:
+                    fd.seek(offset)
+                    assert fd.read(100) == content[offset:offset + 100]
+                assert len(fd.index) <= fd.index.max_checkpoints
+                fd.seek(-20, os.SEEK_END)
+                assert fd.read() == content[-20:]
+        os.remove(path)
+
+
+def test_nameindex():
+    names = ['a/b/1.json', 'a/b/2.txt', 'a/c/', 'a/3.json', 'b.json', 'd/e/f/4.json']
+    path = _make_zip([(name, '') for name in names])
+    with ZipReader(path) as zipreader:
+        assert zipreader.listdir() == ['a/', 'b.json', 'd/']
+        assert zipreader.listdir('a') == ['3.json', 'b/', 'c/']
+        assert zipreader.listdir('a/c/') == []
+        assert zipreader.exists('d/e') and zipreader.exists('a/b/2.txt') and not zipreader.exists('a/b/3.txt')
+        assert zipreader.glob('a/*.json') == ['a/3.json']
+        assert zipreader.glob('a/**.json') == ['a/3.json', 'a/b/1.json']
+        assert zipreader.glob('*/b/[12].*') == ['a/b/1.json', 'a/b/2.txt']
+        assert list(zipreader.walk('d')) == [('d/', ['e'], []), ('d/e/', ['f'], []), ('d/e/f/', [], ['4.json'])]
+    os.remove(path)
+
+
+def test_iter_entries():
+    files = [('%03d.txt' % i, str(i) * (i * 100)) for i in range(100)]
+    path = _make_zip(files, password='1234', cryption='AES_128')
+    with ZipReader(path, password='1234') as zipreader:
+        assert [(zinfo.filename, content) for zinfo, content in zipreader.iter_entries(prefetch=2)] == files
+        # stop early, the pipeline threads go away
+        for index, (zinfo, content) in enumerate(zipreader.iter_entries(prefetch=1, decode_depth=1)):
+            if index == 3:
+                break
+    os.remove(path)
+
+
+def test_async():
+    import trollius as asyncio
+    from trollius import From, Return
+    from zipasync import AsyncZipReader, AsyncZipWriter
+
+    files = [('%d.txt' % i, os.urandom(100000)) for i in range(5)]
+    received = []
+
+    @asyncio.coroutine
+    def serve(reader, writer):
+        received.append((yield From(reader.read())))
+        writer.close()
+
+    @asyncio.coroutine
+    def run(path):
+        server = yield From(asyncio.start_server(serve, '127.0.0.1', 0))
+        port = server.sockets[0].getsockname()[1]
+        _, stream_writer = yield From(asyncio.open_connection('127.0.0.1', port))
+        zipwriter = AsyncZipWriter(stream_writer, password='1234', cryption='AES_256')
+        for name, content in files:
+            yield From(zipwriter.writestr(name, content))
+        yield From(zipwriter.close())
+        stream_writer.close()
+        while not received:
+            yield From(asyncio.sleep(0.01))
+        server.close()
+        with open(path, 'wb') as fd:
+            fd.write(received[0])
+
+        zipreader = yield From(AsyncZipReader.create(path, password='1234'))
+        contents = yield From(asyncio.gather(*[zipreader.read(name) for name in zipreader.namelist()]))
+        chunks = []
+        fd = zipreader.open('4.txt')
+        while True:
+            chunk = yield From(fd.next_chunk())
+            if not chunk:
+                break
+            chunks.append(chunk)
+        yield From(zipreader.close())
+        raise Return((contents, chunks))
+
+    path = tempfile.mktemp(suffix='.zip')
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        contents, chunks = loop.run_until_complete(run(path))
+    finally:
+        loop.close()
+        asyncio.set_event_loop(None)
+    assert contents == [content for _, content in files]
+    assert len(chunks) > 1 and ''.join(chunks) == files[4][1]
+
+    # entries streamed from one archive into others, spooled to disk past 64k
+    @asyncio.coroutine
+    def copy(kws, target):
+        zipreader = yield From(AsyncZipReader.create(path, password='1234'))
+        zipwriter = AsyncZipWriter(target, **kws)
+        zipwriter.writer.SPOOL_ENTRY_SIZE = 1 << 16
+        for name in zipreader.namelist():
+            yield From(zipwriter.writeiter('copy/' + name, zipreader.open(name)))
+        yield From(zipwriter.writestr('text.txt', u'\u6587' * 1000))
+        yield From(zipwriter.close())
+        yield From(zipreader.close())
+
+    for kws in [{}, {'password': 'pwd'}, {'password': 'pwd', 'cryption': 'AES_128'}]:
+        target = tempfile.mktemp(suffix='.zip')
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(copy(kws, target))
+        finally:
+            loop.close()
+            asyncio.set_event_loop(None)
+        try:
+            with ZipReader(target, password='pwd') as zipreader:
+                assert zipreader.testzip() == []
+                assert [zipreader.read('copy/' + name) for name, _ in files] == [content for _, content in files]
+                assert zipreader.read('text.txt') == u'\u6587'.encode('utf8') * 1000
+        finally:
+            os.remove(target)
+    os.remove(path)
+
+    # a slow peer behind a small transport buffer holds back the entry, the
+    # sink never holds more than a chunk of it
+    from zipinfo import ZipInfo
+    big = os.urandom(1 << 20)
+    peak = [0]
+
+    class Chunks(object):
+        def __init__(self):
+            self.position = 0
+
+        @asyncio.coroutine
+        def next_chunk(self):
+            chunk = big[self.position:self.position + 100000]
+            self.position += len(chunk)
+            raise Return(chunk)
+
+    @asyncio.coroutine
+    def slow(reader, writer):
+        parts = []
+        while True:
+            data = yield From(reader.read(1 << 14))
+            if not data:
+                break
+            parts.append(data)
+            yield From(asyncio.sleep(0.001))
+        received.append(''.join(parts))
+        writer.close()
+
+    @asyncio.coroutine
+    def send():
+        server = yield From(asyncio.start_server(slow, '127.0.0.1', 0))
+        port = server.sockets[0].getsockname()[1]
+        _, stream_writer = yield From(asyncio.open_connection('127.0.0.1', port))
+        stream_writer.transport.set_write_buffer_limits(high=1 << 14)
+        zipwriter = AsyncZipWriter(stream_writer)
+        sink_write = zipwriter.sink.write
+
+        def write(data):
+            sink_write(data)
+            peak[0] = max(peak[0], sum(len(part) for part in zipwriter.sink.parts))
+
+        zipwriter.sink.write = write
+        yield From(zipwriter.writeiter('big.bin', Chunks()))
+        yield From(zipwriter.close())
+        stream_writer.close()
+        while not received:
+            yield From(asyncio.sleep(0.01))
+        server.close()
+
+    received = []
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(send())
+    finally:
+        loop.close()
+        asyncio.set_event_loop(None)
+    assert peak[0] <= ZipInfo.CHUNK_SIZE
+    with ZipReader(StringIO(received[0])) as zipreader:
+        assert zipreader.read('big.bin') == big
+
+
+def test_zipserver():
+    import time
+    import httplib
+    import threading
+    from zipserver import ZipHTTPServer
+
+    content = os.urandom(50000) + 'x' * 50000
+    path = _make_zip([('dir/a.bin', content)])
+    stored = _make_zip([('b.txt', content)], compression_method=0)
+    server = ZipHTTPServer(('127.0.0.1', 0), {'': ZipReader(path), 'stored': ZipReader(stored)})
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    conn = httplib.HTTPConnection(*server.server_address)
+
+    def get(url, **headers):
+        conn.request('GET', url, headers=dict((k.replace('_', '-'), v) for k, v in headers.items()))
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+
+    try:
+        status, headers, body = get('/dir/a.bin')
+        assert status == 200 and body == content
+        etag = headers['etag']
+        assert get('/dir/a.bin', If_None_Match=etag)[0] == 304
+        assert get('/missing')[0] == 404
+
+        for url in ['/dir/a.bin', '/stored/b.txt']:
+            status, headers, body = get(url, Range='bytes=49990-50009')
+            assert status == 206 and body == content[49990:50010]
+            assert headers['content-range'] == 'bytes 49990-50009/100000'
+            assert get(url, Range='bytes=-10')[2] == content[-10:]
+            assert get(url, Range='bytes=100000-')[0] == 416
+            assert get(url, Range='bytes=0-9', If_Range='"stale"')[0] == 200
+
+        status, headers, body = get('/dir/a.bin', Accept_Encoding='gzip, deflate')
+        assert headers['content-encoding'] == 'deflate'
+        assert zlib.decompress(body) == content
+        # the deflate representation has an etag of its own
+        deflate_etag = headers['etag']
+        assert deflate_etag != etag
+        assert get('/dir/a.bin', Accept_Encoding='deflate', If_None_Match=deflate_etag)[0] == 304
+        status, headers, body = get('/dir/a.bin', Accept_Encoding='deflate', If_None_Match=etag)
+        assert status == 200 and zlib.decompress(body) == content
+        status, headers, body = get('/dir/a.bin', If_None_Match=deflate_etag)
+        assert status == 200 and body == content
+        assert 'content-encoding' not in get('/stored/b.txt', Accept_Encoding='deflate')[1]
+        assert get('/%ff')[0] == 400
+        assert get('/dir/a.bin')[2] == content
+    finally:
+        conn.close()
+        server.shutdown()
+        server.server_close()
+        for reader in server.readers.values():
+            reader.close()
+        os.remove(path)
+        os.remove(stored)
+
+    # an archive on a file object: range requests share the checkpoints of an
+    # entry, and a client which does not read holds up nobody else
+    import socket
+    big = ''.join('line %d\n' % i for i in range(2000000))
+    path = _make_zip([('big.txt', big), ('small.txt', 'small')])
+
+    class CountingFile(object):
+        def __init__(self, fd):
+            self.fd = fd
+            self.bytes = 0
+
+        def read(self, size=-1):
+            data = self.fd.read(size)
+            self.bytes += len(data)
+            return data
+
+        def __getattr__(self, name):
+            return getattr(self.fd, name)
+
+    source = CountingFile(open(path, 'rb'))
+    server = ZipHTTPServer(('127.0.0.1', 0), {'': ZipReader(source)})
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    conn = httplib.HTTPConnection(*server.server_address, timeout=10)
+    stalled = socket.create_connection(server.server_address)
+    try:
+        tail = 'bytes={}-'.format(len(big) - 100)
+        assert get('/big.txt', Range=tail)[2] == big[-100:]
+        zinfo = server.readers[''].getinfo('big.txt')
+        assert len(server.checkpointIndex(zinfo)) > 2
+        source.bytes = 0
+        assert get('/big.txt', Range=tail)[2] == big[-100:]
+        assert source.bytes < zinfo.csize // 2
+        assert get('/big.txt', Range='bytes=1000-1099')[2] == big[1000:1100]
+
+        stalled.sendall('GET /big.txt HTTP/1.1\r\nHost: x\r\n\r\n')
+        time.sleep(0.2)
+        assert get('/small.txt')[2] == 'small'
+    finally:
+        stalled.close()
+        conn.close()
+        server.shutdown()
+        server.server_close()
+        server.readers[''].close()
+        source.close()
+        os.remove(path)
+
+
+def test_bytesource():
+    import threading
+    import BaseHTTPServer
+    from zipserver import ZipHTTPServer
+    from util.bytesource import FileByteSource, HTTPByteSource, BlockCache
+
+    files = [('f%d.bin' % i, os.urandom(3000 * i)) for i in range(20)]
+    path = _make_zip(files)
+
+    with BlockCache(FileByteSource(path), block_size=4096, cache_bytes=1 << 20, read_ahead=2) as source:
+        with ZipReader(source) as zipreader:
+            assert [zipreader.read(name) for name, _ in files] == [content for _, content in files]
+            assert zipreader.testzip(workers=3) == []
+        stats = source.asDict()
+        assert stats['fetches'] < stats['misses'] and stats['hits'] > 0
+
+    # the stand-in http server serves the archive as a stored entry
+    outer = _make_zip([('inner.zip', open(path, 'rb').read())], compression_method=0)
+    server = ZipHTTPServer(('127.0.0.1', 0), {'': ZipReader(outer)})
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        url = 'http://{}:{}/inner.zip'.format(*server.server_address)
+        http = HTTPByteSource(url)
+        assert http.size == os.path.getsize(path)
+        with ZipReader(BlockCache(http, block_size=1 << 16)) as zipreader:
+            # the central directory and the end record come in one request
+            assert http.requests == 1
+            assert zipreader.namelist() == [name for name, _ in files]
+            assert zipreader.read('f19.bin') == files[19][1]
+
+        # every thread has a connection of its own, close closes them all
+        started = threading.Semaphore(0)
+        finish = threading.Event()
+
+        def fetch():
+            http.pread(0, 100)
+            started.release()
+            finish.wait()
+
+        threads = [threading.Thread(target=fetch) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            started.acquire()
+        connections = list(http._connections.values())
+        finish.set()
+        for t in threads:
+            t.join()
+        assert len(connections) == 4
+        http.close()
+        assert http._connections == {} and all(conn.sock is None for conn in connections)
+        assert http.pread(0, 4) == open(path, 'rb').read(4)
+        http.close()
+
+        class NoLengthHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        no_length = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), NoLengthHandler)
+        thread = threading.Thread(target=no_length.handle_request)
+        thread.start()
+        try:
+            HTTPByteSource('http://{}:{}/a.zip'.format(*no_length.server_address))
+        except IOError as e:
+            assert 'Content-Length' in str(e)
+        else:
+            assert False, 'IOError not raised'
+        thread.join()
+        no_length.server_close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        for reader in server.readers.values():
+            reader.close()
+        os.remove(path)
+        os.remove(outer)
+
+
+def test_sharedindex():
+    from sharedindex import SharedIndex
+
+    files = [(u'd/\u6587\u4ef6%d.txt' % i, os.urandom(100) * i) for i in range(30, 0, -1)]
+    for kws in [{}, {'password': 'pwd', 'cryption': 'AES_256'}]:
+        path = _make_zip(files, **kws)
+        index_path = path + 'index'
+        with ZipReader(path) as zipreader:
+            zipreader.export_index(index_path)
+
+        pid = os.fork()
+        if pid == 0:
+            # a worker attaches without parsing the archive
+            code = 1
+            try:
+                with SharedIndex(index_path, path, password=kws.get('password')) as index:
+                    if index.namelist() == sorted(name for name, _ in files) and \
+                            all(index.read(name) == content for name, content in files) and \
+                            not index.exists(u'd/missing'):
+                        code = 0
+            finally:
+                os._exit(code)
+        assert os.waitpid(pid, 0)[1] == 0
+
+        with open(index_path, 'r+b') as fd:
+            fd.write(struct.pack('<8sH', 'ZPKINDEX', 99))
+        try:
+            SharedIndex(index_path, path)
+            assert False
+        except BadZipfile as e:
+            assert 'version 99' in str(e)
+        os.remove(index_path)
+        os.remove(path)
+
+
+def test_central_dir_spool():
+    path = tempfile.mktemp(suffix='.zip')
+    names = ['dir/entry-%05d.txt' % i for i in range(500)]
+    zipwriter = ZipWriter(path)
+    zipwriter._central_dir = tempfile.SpooledTemporaryFile(max_size=4096)
+    for name in names:
+        zipwriter.writestr(name, name)
+    # the headers went to disk and no ZipInfo is kept
+    assert zipwriter._central_dir._rolled and zipwriter.entry_count == len(names)
+    assert not hasattr(zipwriter, '_fileInfos')
+    zipwriter.close()
+
+    with ZipReader(path) as zipreader:
+        assert zipreader.namelist() == names
+        assert zipreader.read(names[-1]) == names[-1]
+    os.remove(path)
+
+
+def test_concurrent_writer():
+    import threading
+
+    path = tempfile.mktemp(suffix='.zip')
+    files = dict(('t%d/%d.bin' % (t, i), os.urandom(500 * i) + 'x' * 20000) for t in range(8) for i in range(10))
+    zipwriter = ZipWriter(path, password='pwd', cryption='AES_128')
+    # the larger entries wait for their turn in the spool files
+    zipwriter.SPOOL_ENTRY_SIZE = 3000
+
+    def produce(t):
+        for i in range(10):
+            name = 't%d/%d.bin' % (t, i)
+            zipwriter.writestr(name, files[name])
+
+    threads = [threading.Thread(target=produce, args=(t,)) for t in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(zipwriter._spools) == 8
+    zipwriter.close()
+
+    with ZipReader(path, password='pwd') as zipreader:
+        assert sorted(zipreader.namelist()) == sorted(files)
+        assert zipreader.testzip() == []
+        for name, content in files.items():
+            assert zipreader.read(name) == content
+    os.remove(path)
+
+
+def test_buffered_writer():
+    class CountingFile(object):
+        name = None
+
+        def __init__(self):
+            self.parts = []
+
+        def write(self, data):
+            self.parts.append(data)
+
+        def tell(self):
+            return sum(len(part) for part in self.parts)
+
+    files = [('%d.txt' % i, 'content %d' % i) for i in range(100)]
+    files.append(('big.bin', os.urandom(5000)))
+    for buffer_size, max_writes in [(0, 204), (4096, 5)]:
+        out = CountingFile()
+        with ZipWriter(out, buffer_size=buffer_size) as zipwriter:
+            for name, content in files:
+                zipwriter.writestr(name, content)
+        assert len(out.parts) <= max_writes
+        with ZipReader(StringIO(''.join(out.parts))) as zipreader:
+            assert [(name, zipreader.read(name)) for name in zipreader.namelist()] == files
+
+
+def test_extractall():
+    import time
+    import shutil
+
+    stored = os.urandom(200000)
+    deflated = 'deflated ' * 5000
+    path = tempfile.mktemp(suffix='.zip')
+    with ZipWriter(path) as zipwriter:
+        zipwriter.writestr('a/b/deflated.txt', deflated, date_time=(2001, 2, 3, 4, 5, 6))
+        zipwriter.writestr('empty/', '', date_time=(2002, 1, 1, 0, 0, 0))
+        zipwriter.writestr('../escape.txt', 'x')
+    with ZipWriter(path + '.stored', compression_method=0) as zipwriter:
+        zipwriter.writestr('a/stored.bin', stored, date_time=(2003, 1, 1, 0, 0, 0))
+
+    root = tempfile.mkdtemp()
+    try:
+        with ZipReader(path) as zipreader:
+            targets = zipreader.extractall(root, workers=2, max_open=1)
+        assert targets[-1] == os.path.join(root, 'escape.txt')
+        assert open(os.path.join(root, 'a/b/deflated.txt')).read() == deflated
+        assert os.path.isdir(os.path.join(root, 'empty'))
+        mtime = os.path.getmtime(os.path.join(root, 'a/b/deflated.txt'))
+        assert time.localtime(mtime)[:6] == (2001, 2, 3, 4, 5, 6)
+        assert time.localtime(os.path.getmtime(os.path.join(root, 'empty')))[0] == 2002
+
+        with ZipReader(path + '.stored') as zipreader:
+            target = zipreader.extract('a/stored.bin', root)
+        assert open(target, 'rb').read() == stored
+        assert time.localtime(os.path.getmtime(target))[0] == 2003
+    finally:
+        shutil.rmtree(root)
+        os.remove(path)
+        os.remove(path + '.stored')
+
+
+def test_write_tree():
+    import shutil
+
+    root = tempfile.mkdtemp()
+    files = {'b.txt': 'b', 'a/z.py': 'z' * 1000, 'a/y.pyc': 'y', 'a/build/x.py': 'x', 'c/d/e.py': os.urandom(3000)}
+    for relpath, content in files.items():
+        if not os.path.isdir(os.path.join(root, os.path.dirname(relpath))):
+            os.makedirs(os.path.join(root, os.path.dirname(relpath)))
+        with open(os.path.join(root, relpath), 'wb') as fd:
+            fd.write(content)
+    os.makedirs(os.path.join(root, 'empty/inner'))
+    os.symlink(os.path.join(root, 'a'), os.path.join(root, 'link'))
+    os.symlink(os.path.join(root, 'missing'), os.path.join(root, 'c/broken'))
+
+    path = tempfile.mktemp(suffix='.zip')
+    try:
+        for workers in (1, 3):
+            with ZipWriter(path, password='pwd', cryption='AES_128') as zipwriter:
+                zipwriter.SPOOL_ENTRY_SIZE = 1000
+                zipwriter.write_tree(root, 'src', exclude=['**.pyc', 'a/build'], workers=workers)
+            with ZipReader(path, password='pwd') as zipreader:
+                assert zipreader.namelist() == ['src/a/z.py', 'src/b.txt', 'src/c/d/e.py', 'src/empty/inner/']
+                assert zipreader.testzip() == []
+                assert zipreader.read('src/c/d/e.py') == files['c/d/e.py']
+                assert zipreader.getinfo('src/empty/inner/').external_file_attributes == 0x10
+
+        # include applies to empty directories too, a directory left empty by
+        # the filters is not written
+        for include, names in [(['**.py'], ['a/build/x.py', 'a/z.py', 'c/d/e.py']),
+                               (['**.py', 'empty/**'], ['a/build/x.py', 'a/z.py', 'c/d/e.py', 'empty/inner/'])]:
+            with ZipWriter(path) as zipwriter:
+                zipwriter.write_tree(root, include=include)
+            with ZipReader(path) as zipreader:
+                assert zipreader.namelist() == names
+        os.makedirs(os.path.join(root, 'pyc'))
+        with open(os.path.join(root, 'pyc/x.pyc'), 'wb') as fd:
+            fd.write('x')
+        with ZipWriter(path) as zipwriter:
+            zipwriter.write_tree(root, exclude=['**.pyc', 'a/build'])
+        with ZipReader(path) as zipreader:
+            assert zipreader.namelist() == ['a/z.py', 'b.txt', 'c/d/e.py', 'empty/inner/']
+    finally:
+        shutil.rmtree(root)
+        os.remove(path)
+
+
+def test_cli():
+    import shutil
+    import zipcli
+
+    root = tempfile.mkdtemp()
+    try:
+        src = os.path.join(root, 'src')
+        os.makedirs(os.path.join(src, 'sub'))
+        files = {'a.txt': 'a' * 1000, 'sub/b.png': os.urandom(2000), 'sub/c.log': 'log\n' * 100}
+        for relpath, content in files.items():
+            with open(os.path.join(src, relpath), 'wb') as fd:
+                fd.write(content)
+        archive = os.path.join(root, 'out.zip')
+        cwd = os.getcwd()
+        os.chdir(root)
+        try:
+            assert zipcli.main(['create', '-j', '2', '--policy', 'auto', '--level', '9', archive, 'src']) == 0
+            assert zipcli.main(['append', archive, 'src/a.txt']) == 0
+        finally:
+            os.chdir(cwd)
+        with ZipReader(archive) as zipreader:
+            assert zipreader.namelist() == ['src/a.txt', 'src/sub/b.png', 'src/sub/c.log', 'src/a.txt']
+            assert zipreader.getinfo('src/sub/b.png').compression_method == 0
+        assert zipcli.main(['test', '-j', '2', archive]) == 0
+
+        filtered = os.path.join(root, 'filtered.zip')
+        assert zipcli.main(['copy', '--exclude', '**.log', archive, filtered]) == 0
+        with ZipReader(filtered) as zipreader:
+            assert sorted(set(zipreader.namelist())) == ['src/a.txt', 'src/sub/b.png']
+            assert zipreader.testzip() == []
+            assert zipreader.read('src/sub/b.png') == files['sub/b.png']
+
+        assert zipcli.main(['extract', '-d', os.path.join(root, 'ex'), filtered, 'src/sub/*']) == 0
+        assert open(os.path.join(root, 'ex/src/sub/b.png'), 'rb').read() == files['sub/b.png']
+
+        # --stats counts the bytes of the entries written, the broken symlink
+        # skipped by the writer is not counted
+        import sys
+        os.symlink(os.path.join(src, 'missing'), os.path.join(src, 'broken'))
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            assert zipcli.main(['--stats', 'create', os.path.join(root, 'stats.zip'), src]) == 0
+            output = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        assert output.startswith('{} bytes in '.format(sum(len(content) for content in files.values())))
+
+        with open(archive, 'r+b') as fd:
+            fd.seek(100)
+            fd.write('broken')
+        assert zipcli.main(['test', archive]) == 1
+        assert zipcli.main(['list', os.path.join(root, 'missing.zip')]) == 1
+    finally:
+        shutil.rmtree(root)
+
+
+def test_import_budget():
+    import sys
+    import json
+    import time
+    import subprocess
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+
+    def startup(code):
+        # the best of a few runs, whatever else the machine is busy with
+        best = None
+        for _ in range(3):
+            start = time.time()
+            subprocess.check_call([sys.executable, '-c', code], cwd=cwd)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    # a wide budget against the bare interpreter start on the same machine,
+    # the deferred imports keep `import zippkg` far below it
+    baseline = startup('pass')
+    assert startup('import zippkg') < 10 * baseline + 0.25
+
+    path = _make_zip([('a.txt', 'a' * 100)])
+    script = (
+        'import sys, json\n'
+        'def loaded(): return sorted(set(m.split(".")[0] for m in sys.modules if sys.modules[m] is not None))\n'
+        'import zippkg\n'
+        'after_import = loaded()\n'
+        'zippkg.ZipReader(sys.argv[1]).read("a.txt")\n'
+        'from util.crypt import PKWARECrypt\n'
+        'print(json.dumps([after_import, loaded(), PKWARECrypt.crctable is None]))\n'
+    )
+    try:
+        after_import, after_read, no_crctable = json.loads(subprocess.check_output(
+            [sys.executable, '-c', script, path], cwd=cwd))
+    finally:
+        os.remove(path)
+    # neither importing zippkg nor reading an unencrypted archive loads any of
+    # these, nor builds the PKWARE crc table
+    for modules in (after_import, after_read):
+        for heavy in ['Crypto', 'ctypes', 'httplib', 'ssl', 'mmap', 'tempfile', 'random', 'StringIO', 'scandir']:
+            assert heavy not in modules, heavy
+    assert no_crctable
+
+
+def test_recover():
+    import zipcli
+
+    inner = _make_zip([('inner.txt', 'inner')])
+    with open(inner, 'rb') as fd:
+        inner_data = fd.read()
+    os.remove(inner)
+    files = [('a.txt', 'a' * 5000), ('inner.zip', inner_data), ('b.bin', os.urandom(3000)), ('c.txt', 'c' * 5000)]
+    path = _make_zip(files, compression_method=0)
+    with ZipReader(path) as zipreader:
+        cut = zipreader.getinfo('c.txt').relative_offset_file_header + 100
+    with open(path, 'rb') as fd:
+        data = fd.read()
+
+    # deflated entry with a data descriptor without signature, stored entry
+    # with a data descriptor with signature. the content inflates to more than
+    # the chunk size of the scan
+    content = 'data descriptor ' * 200000
+    cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    compressed = cmpr.compress(content) + cmpr.flush()
+    crc32 = zlib.crc32(content) & 0xffffffff
+    tail = struct.pack('<4sHHHHHLLLHH', 'PK\x03\x04', 20, 0x8, 8, 0, 0, 0, 0, 0, 5, 0) + 'd.txt'
+    tail += compressed + struct.pack('<LLL', crc32, len(compressed), len(content))
+    tail += struct.pack('<4sHHHHHLLLHH', 'PK\x03\x04', 20, 0x8, 0, 0, 0, 0, 0, 0, 5, 0) + 'e.txt'
+    tail += content + struct.pack('<4sLLL', 'PK\x07\x08', crc32, len(content), len(content))
+    with open(path, 'wb') as fd:
+        fd.write(data[:cut - 100] + tail + data[cut - 100:cut])
+    repaired = tempfile.mktemp(suffix='.zip')
+    try:
+        with ZipReader(path, recover=True) as zipreader:
+            # the entries of the stored inner.zip are skipped, c.txt is cut off
+            assert zipreader.namelist() == ['a.txt', 'inner.zip', 'b.bin', 'd.txt', 'e.txt']
+            for name, expected in files[:3]:
+                assert zipreader.read(name) == expected
+            assert zipreader.read('d.txt') == zipreader.read('e.txt') == content
+            assert zipreader.testzip() == []
+
+        assert zipcli.main(['recover', path, repaired]) == 0
+        with ZipReader(repaired) as zipreader:
+            assert zipreader.namelist() == ['a.txt', 'inner.zip', 'b.bin', 'd.txt', 'e.txt']
+            assert zipreader.testzip() == []
+            assert zipreader.read('d.txt') == content
+        with open(path, 'wb') as fd:
+            fd.write('garbage')
+        assert zipcli.main(['recover', path]) == 1
+
+        # a damaged entry in the middle whose sizes run past the end of the
+        # file, or whose data descriptor is missing, hides none behind it
+        names = ['a.txt', 'b.txt', 'c.txt', 'd.txt', 'e.txt']
+        stored = _make_zip([(name, name * 100) for name in names], compression_method=0)
+        with ZipReader(stored) as zipreader:
+            c_offset = zipreader.getinfo('c.txt').relative_offset_file_header
+            cd_offset = zipreader.end_central_dir.offset_start_central_dir
+        with open(stored, 'rb') as fd:
+            data = fd.read()[:cd_offset]
+        os.remove(stored)
+        for field_offset, value in [(18, struct.pack('<L', 0x7fffff00)), (6, struct.pack('<H', 0x8))]:
+            with open(path, 'wb') as fd:
+                fd.write(data[:c_offset + field_offset] + value + data[c_offset + field_offset + len(value):])
+            with ZipReader(path, recover=True) as zipreader:
+                assert zipreader.namelist() == ['a.txt', 'b.txt', 'd.txt', 'e.txt']
+                assert zipreader.read('e.txt') == 'e.txt' * 100
+    finally:
+        os.remove(path)
+        if os.path.exists(repaired):
+            os.remove(repaired)
+
+
+def test_diff():
+    import sys
+    import zipcli
+    from zippkg import diff
+
+    def build(files):
+        path = tempfile.mktemp(suffix='.zip')
+        with ZipWriter(path) as zipwriter:
+            for name, content, date_time in files:
+                zipwriter.writestr(name, content, date_time=date_time)
+        return path
+
+    day1, day2 = (2020, 1, 1, 0, 0, 0), (2020, 1, 2, 0, 0, 0)
+    old = build([('same.txt', 'same', day1), ('touched.txt', 't', day1), ('changed.txt', 'v1', day1),
+                 ('gone.txt', 'gone', day1), ('moved.txt', 'moved' * 100, day1), ('empty', '', day1)])
+    # the same entries at other offsets do not count as modified
+    new = build([('new.txt', 'new', day1), ('same.txt', 'same', day1), ('touched.txt', 't', day2),
+                 ('changed.txt', 'v2', day1), ('sub/moved.txt', 'moved' * 100, day1), ('empty2', '', day1)])
+    try:
+        with ZipReader(old) as old_reader, ZipReader(new) as new_reader:
+            changes = diff(old_reader, new_reader)
+            assert [zinfo.filename for zinfo in changes.added] == ['new.txt', 'empty2']
+            assert [zinfo.filename for zinfo in changes.removed] == ['gone.txt', 'empty']
+            assert [(a.filename, b.filename) for a, b in changes.modified] == \
+                [('touched.txt', 'touched.txt'), ('changed.txt', 'changed.txt')]
+            assert [(a.filename, b.filename) for a, b in changes.renamed] == [('moved.txt', 'sub/moved.txt')]
+            same = diff(new_reader, new_reader)
+            assert (same.added, same.removed, same.modified, same.renamed) == ([], [], [], [])
+
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            assert zipcli.main(['diff', old, new]) == 0
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        assert 'R moved.txt -> sub/moved.txt\n' in output
+        assert output.endswith('2 added, 2 removed, 2 modified, 1 renamed\n')
+    finally:
+        os.remove(old)
+        os.remove(new)
+
+
+def test_search():
+    import re
+    import sys
+    import zipcli
+    from zippkg import _grepChunks
+
+    log = ''.join('line %d %s\n' % (i, 'ERROR disk full' if i % 1000 == 999 else 'ok') for i in range(10000))
+    files = [('a.log', log), ('b.txt', 'ERROR in txt'), ('c.log', 'no match\n'), ('d/', ''), ('e.log', log)]
+    path = _make_zip(files, password='1234')
+    try:
+        with ZipReader(path, password='1234') as zipreader:
+            for workers in (1, 3):
+                matches = zipreader.search('ERROR', workers=workers)
+                assert len(matches) == 21
+                first = matches[0]
+                assert (first.filename, first.line_number, first.line) == ('a.log', 1000, 'line 999 ERROR disk full')
+                assert log[first.offset:first.offset + 5] == 'ERROR'
+                assert (matches[10].filename, matches[10].line) == ('b.txt', 'ERROR in txt')
+            # matches spanning the chunk boundaries of a small chunk size
+            zipreader.getinfo('a.log').CHUNK_SIZE = 7
+            matches = zipreader.search(r'^line 5999 ERROR disk full$', members='a.log')
+            assert [m.line_number for m in matches] == [6000]
+            assert [m.filename for m in zipreader.search('ERROR', members=['*.log'], workers=2)] == \
+                ['a.log'] * 10 + ['e.log'] * 10
+            matches = zipreader.search('ERROR', workers=2, max_count=12)
+            assert [m.filename for m in matches] == ['a.log'] * 10 + ['b.txt', 'e.log']
+            assert zipreader.search('nothing') == []
+
+        # empty matches neither show up at chunk boundaries nor depend on them
+        for chunks in (['aa\nbb\n', 'cc\n', 'dd\n'], ['aa\nbb\ncc\ndd\n'], ['a', 'a\n', 'bb\ncc', '\ndd\n']):
+            assert list(_grepChunks(chunks, re.compile('^$', re.M), 100)) == []
+            assert [m[1] for m in _grepChunks(chunks, re.compile('^', re.M), 100)] == [1, 2, 3, 4]
+        chunks = ['aa\n', '\nbb\n', '\n']
+        assert list(_grepChunks(chunks, re.compile('^$', re.M), 100)) == [(3, 2, ''), (7, 4, '')]
+        assert [m[:2] for m in _grepChunks(['ab', 'cd'], re.compile('$', re.M), 3)] == [(4, 1)]
+
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            assert zipcli.main(['grep', '-i', '-m', '1', '--password', '1234', 'error in', path]) == 0
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        assert output == 'b.txt:1:ERROR in txt\n'
+    finally:
+        os.remove(path)
+
+
+def test_limits():
+    import shutil
+    from util.limits import Limits, LimitError
+
+    def raises(func):
+        try:
+            func()
+        except LimitError as e:
+            return e
+        assert False, 'LimitError not raised'
+
+    class CountingFile(object):
+        def __init__(self, path):
+            self.fd = open(path, 'rb')
+            self.reads = 0
+            self.name = path
+
+        def read(self, size=-1):
+            self.reads += 1
+            return self.fd.read(size)
+
+        def __getattr__(self, name):
+            return getattr(self.fd, name)
+
+    bomb = '\x00' * (10 << 20)
+    path = _make_zip([('small.txt', 'small' * 100), ('bomb', bomb)])
+    root = tempfile.mkdtemp()
+    try:
+        # ratio and size of the central directory are checked before any read
+        fd = CountingFile(path)
+        with ZipReader(fd, limits=Limits(max_ratio=100)) as zipreader:
+            reads = fd.reads
+            raises(lambda: zipreader.read('bomb'))
+            raises(lambda: zipreader.open('bomb', seekable=True))
+            raises(lambda: zipreader.open('bomb'))
+            raises(lambda: list(zipreader.read_many(['bomb'])))
+            raises(lambda: list(zipreader.read_many(['bomb'], order='offset')))
+            assert fd.reads == reads
+            assert zipreader.read('small.txt') == 'small' * 100
+        fd.fd.close()
+        fd = CountingFile(path)
+        with ZipReader(fd, limits=Limits(max_ratio=1)) as zipreader:
+            reads = fd.reads
+            reports = zipreader.testzip()
+            assert [report.filename for report in reports] == ['small.txt', 'bomb']
+            assert all(isinstance(report.exception, LimitError) for report in reports)
+            raises(lambda: list(zipreader.iter_entries()))
+            assert fd.reads == reads
+        fd.fd.close()
+        with ZipReader(path, limits=Limits(max_entry_size=1 << 20)) as zipreader:
+            raises(lambda: zipreader.extractall(root))
+            assert os.listdir(root) == []
+        raises(lambda: ZipReader(path, limits=Limits(max_entries=1)))
+
+        limits = Limits(max_total_size=900)
+        with ZipReader(path, limits=limits) as zipreader:
+            assert zipreader.read('small.txt') == 'small' * 100
+            raises(lambda: zipreader.read('small.txt'))
+            assert limits.total_size == 500
+        with ZipReader(path, limits=Limits(max_decode_seconds=1e-9)) as zipreader:
+            raises(lambda: zipreader.read('bomb'))
+        with ZipReader(path, limits=Limits(max_ratio=2000, max_entry_size=20 << 20)) as zipreader:
+            assert zipreader.read('bomb') == bomb
+            with zipreader.open('bomb', seekable=True) as fd:
+                fd.seek(5 << 20)
+                assert fd.read(10) == bomb[:10]
+
+        # a central directory which understates the size: decoding stops after
+        # the first bounded piece
+        with ZipReader(path) as zipreader:
+            zinfo = zipreader.getinfo('bomb')
+            local_offset = zinfo.relative_offset_file_header
+            central_offset = zipreader.end_central_dir.offset_start_central_dir + \
+                len(zipreader.rawHeaders()[0][1])
+        with open(path, 'r+b') as fd:
+            for offset in (local_offset + 22, central_offset + 24):
+                fd.seek(offset)
+                fd.write(struct.pack('<L', 1000))
+        with ZipReader(path, limits=Limits()) as zipreader:
+            error = raises(lambda: zipreader.read('bomb'))
+            assert 'exceeds 1000 bytes' in str(error)
+            raises(lambda: zipreader.open('bomb', seekable=True).read())
+    finally:
+        shutil.rmtree(root)
+        os.remove(path)
+
+    # streamed entry with a data descriptor, its ratio is checked against the
+    # bytes consumed so far
+    cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    compressed = cmpr.compress(bomb) + cmpr.flush()
+    data = struct.pack('<4sHHHHHLLLHH', 'PK\x03\x04', 20, 0x8, 8, 0, 0, 0, 0, 0, 4, 0) + 'bomb'
+    data += compressed + struct.pack('<4sLLL', 'PK\x07\x08', zlib.crc32(bomb) & 0xffffffff,
+                                     len(compressed), len(bomb))
+    data += 'PK\x05\x06' + '\x00' * 18
+
+    def stream():
+        for zinfo, chunks in ZipStreamReader(StringIO(data), limits=Limits(max_ratio=100)):
+            for chunk in chunks:
+                assert len(chunk) <= ZipInfo.CHUNK_SIZE
+    raises(stream)
+    entries = [(zinfo.filename, len(''.join(chunks))) for zinfo, chunks in
+               ZipStreamReader(StringIO(data), limits=Limits(max_ratio=2000))]
+    assert entries == [('bomb', len(bomb))]
+
+
 if __name__ == '__main__':
     test_zipreader_normal()
     test_zipreader_crypt()
     test_zipwriter()
+    test_stats()
+    test_testzip()
+    test_read_many()
+    test_zipstream()
+    test_cache()
+    test_data_offsets()
+    test_seekable()
+    test_nameindex()
+    test_iter_entries()
+    test_async()
+    test_zipserver()
+    test_bytesource()
+    test_sharedindex()
+    test_central_dir_spool()
+    test_concurrent_writer()
+    test_buffered_writer()
+    test_extractall()
+    test_write_tree()
+    test_cli()
+    test_import_budget()
+    test_recover()
+    test_diff()
+    test_search()
+    test_limits()
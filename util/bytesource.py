@@ -0,0 +1,248 @@
+import os
+import threading
+
+from util.cache import LRUCache
+
+
+class ByteSource(object):
+    '''
+    random access to the bytes of an archive, wherever they are stored.
+    subclasses set `size` and implement pread(offset, n), which returns less
+    than n bytes only at the end of the source. pread is called from several
+    threads at once.
+    '''
+    size = 0
+    name = None
+
+    def pread(self, offset, n):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+class FileByteSource(ByteSource):
+    '''
+    local file, given as a path or a seekable file object
+    '''
+
+    def __init__(self, file):
+        self.file = file
+        if isinstance(file, basestring):
+            self.stream = open(file, 'rb')
+            self.name = file
+        else:
+            self.stream = file
+            self.name = getattr(file, 'name', None)
+        self.stream.seek(0, os.SEEK_END)
+        self.size = self.stream.tell()
+        self._lock = threading.Lock()
+
+    def pread(self, offset, n):
+        with self._lock:
+            self.stream.seek(offset, os.SEEK_SET)
+            return self.stream.read(n)
+
+    def close(self):
+        if isinstance(self.file, basestring):
+            self.stream.close()
+
+
+class HTTPByteSource(ByteSource):
+    '''
+    file behind an http(s) url which supports Range requests. every thread
+    keeps its own persistent connection, close closes them all.
+    '''
+
+    def __init__(self, url, timeout=30, headers=None):
+        # not needed by local sources, imported here
+        import httplib
+        import urlparse
+
+        self.url = url
+        self.name = url
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+        parts = urlparse.urlsplit(url)
+        self._connection_class = httplib.HTTPSConnection if parts.scheme == 'https' else httplib.HTTPConnection
+        self._netloc = parts.netloc
+        self._path = parts.path + ('?' + parts.query if parts.query else '')
+        self._errors = (httplib.HTTPException, IOError)
+        self._lock = threading.Lock()
+        # {thread ident: connection}
+        self._connections = {}
+        self.requests = 0
+        self.bytes = 0
+
+        response, _ = self._request('HEAD')
+        length = response.getheader('content-length')
+        if response.status != 200 or length is None:
+            self.close()
+            if response.status != 200:
+                raise IOError('HEAD {} returned {} {}'.format(url, response.status, response.reason))
+            raise IOError('HEAD {} returned no Content-Length'.format(url))
+        self.size = int(length)
+
+    def pread(self, offset, n):
+        end = min(offset + n, self.size)
+        if offset >= end:
+            return ''
+        response, data = self._request('GET', Range='bytes={}-{}'.format(offset, end - 1))
+        if response.status != 206:
+            raise IOError('range request to {} returned {} {}'.format(self.url, response.status, response.reason))
+        if len(data) != end - offset:
+            raise IOError('range request to {} returned {} bytes instead of {}'.format(
+                self.url, len(data), end - offset))
+        with self._lock:
+            self.requests += 1
+            self.bytes += len(data)
+        return data
+
+    def _request(self, method, **headers):
+        headers.update(self.headers)
+        # a kept-alive connection may have been closed by the server since
+        # the last request, reconnect once
+        for retry in (False, True):
+            conn = self._connection(reconnect=retry)
+            try:
+                conn.request(method, self._path, headers=headers)
+                response = conn.getresponse()
+                return response, response.read()
+            except self._errors:
+                conn.close()
+                if retry:
+                    raise
+
+    def _connection(self, reconnect=False):
+        ident = threading.current_thread().ident
+        with self._lock:
+            conn = self._connections.get(ident)
+            if conn is None or reconnect:
+                conn = self._connections[ident] = self._connection_class(self._netloc, timeout=self.timeout)
+        return conn
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, {}
+        for conn in connections.itervalues():
+            conn.close()
+
+    def asDict(self):
+        return {'requests': self.requests, 'bytes': self.bytes}
+
+
+class BlockCache(ByteSource):
+    '''
+    caches another ByteSource in aligned blocks of block_size bytes.
+    the missing blocks of a pread are fetched with one source.pread per run of
+    adjacent blocks, and a run reaching the end of the request is extended by
+    read_ahead blocks. preads larger than the cache go to the source directly.
+    '''
+
+    def __init__(self, source, block_size=1 << 16, cache_bytes=1 << 24, read_ahead=0):
+        self.source = source
+        self.name = source.name
+        self.size = source.size
+        self.block_size = block_size
+        self.read_ahead = read_ahead
+        self.cache = LRUCache(cache_bytes, max_entry_bytes=block_size)
+        self.fetches = 0
+        self._lock = threading.Lock()
+
+    def pread(self, offset, n):
+        end = min(offset + n, self.size)
+        if offset >= end:
+            return ''
+        if end - offset > self.cache.max_bytes:
+            return self.source.pread(offset, end - offset)
+
+        block_size = self.block_size
+        first, last = offset // block_size, (end - 1) // block_size
+        blocks = {}
+        missing = []
+        for index in xrange(first, last + 1):
+            block = self.cache.get(index)
+            if block is None:
+                missing.append(index)
+            else:
+                blocks[index] = block
+
+        for start, stop in self._runs(missing):
+            if stop == last + 1:
+                stop = min(stop + self.read_ahead, (self.size - 1) // block_size + 1)
+            data = self.source.pread(start * block_size, (stop - start) * block_size)
+            with self._lock:
+                self.fetches += 1
+            for index in xrange(start, stop):
+                block = data[(index - start) * block_size:(index - start + 1) * block_size]
+                if not block:
+                    break
+                self.cache.put(index, block)
+                if index <= last:
+                    blocks[index] = block
+
+        data = ''.join(blocks.get(index, '') for index in xrange(first, last + 1))
+        skip = offset - first * block_size
+        return data[skip:skip + end - offset]
+
+    def _runs(self, indexes):
+        '''
+        (start, stop) of every run of consecutive block indexes
+        '''
+        runs = []
+        for index in indexes:
+            if runs and runs[-1][1] == index:
+                runs[-1][1] = index + 1
+            else:
+                runs.append([index, index + 1])
+        return runs
+
+    def close(self):
+        self.cache.clear()
+        self.source.close()
+
+    def asDict(self):
+        stats = self.cache.asDict()
+        stats['fetches'] = self.fetches
+        return stats
+
+
+class ByteSourceStream(object):
+    '''
+    file-like view of a ByteSource for ZipReader, streams on the same source
+    keep their own positions
+    '''
+
+    def __init__(self, source):
+        self.source = source
+        self.name = source.name
+        self.pos = 0
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET:
+            self.pos = pos
+        elif whence == os.SEEK_CUR:
+            self.pos += pos
+        elif whence == os.SEEK_END:
+            self.pos = self.source.size + pos
+        if self.pos < 0:
+            raise IOError('negative seek position {}'.format(self.pos))
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.source.size - self.pos
+        data = self.source.pread(self.pos, size)
+        self.pos += len(data)
+        return data
+
+    def close(self):
+        pass
@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    '''
+    thread-safe LRU cache of strings with a byte budget.
+    values larger than max_entry_bytes (default: a quarter of the budget) are
+    not admitted, so a single huge entry can not flush all the hot small ones.
+    '''
+
+    def __init__(self, max_bytes, max_entry_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes // 4 if max_entry_bytes is None else max_entry_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def admits(self, size):
+        return size <= self.max_entry_bytes and size <= self.max_bytes
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.pop(key, None)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items[key] = value
+            self.hits += 1
+            return value
+
+    def peek(self, key):
+        '''
+        get without counting a hit or miss nor refreshing key
+        '''
+        with self._lock:
+            return self._items.get(key)
+
+    def put(self, key, value):
+        if not self.admits(len(value)):
+            return False
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def asDict(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._items),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+        }
@@ -1,10 +1,32 @@
 import zlib
+import time
 
 
 class CompressError(Exception):
     pass
 
 
+def inflate(decompressor, data, max_length, budget=None):
+    '''
+    yields the output of decompressor for data in pieces of at most max_length
+    bytes, so no single call can expand a hostile input in memory. each piece is
+    counted against budget (an util.limits.EntryBudget) before it is yielded.
+    '''
+    while data:
+        start = time.time()
+        out = decompressor.decompress(data, max_length)
+        tail = decompressor.unconsumed_tail
+        if budget is not None:
+            budget.add(len(out), len(data) - len(tail), time.time() - start)
+        if out:
+            yield out
+        if decompressor.unused_data:
+            # python 2 leaves the input behind the end of the stream in
+            # unconsumed_tail as well
+            return
+        data = tail
+
+
 class _Com(object):
     def __init__(self):
         pass
@@ -15,11 +37,46 @@ class _Com(object):
     def decompress(self, content):
         raise NotImplementedError("need rewrite")
 
+    def decompressobj(self):
+        raise NotImplementedError("need rewrite")
+
+    def compressobj(self):
+        raise NotImplementedError("need rewrite")
+
+
+class _StoreDecompressObj(object):
+    '''
+    zlib.decompressobj like interface for stored data
+    '''
+    unused_data = ''
+    unconsumed_tail = ''
+
+    def decompress(self, content, max_length=0):
+        return content
+
+    def flush(self):
+        return ''
+
+    def copy(self):
+        return self
+
+
+class _StoreCompressObj(object):
+    '''
+    zlib.compressobj like interface for stored data
+    '''
+
+    def compress(self, content):
+        return content
+
+    def flush(self):
+        return ''
+
 
 class _StoreCompressor(_Com):
     key = 0
 
-    def __init__(self):
+    def __init__(self, level=None):
         super(_StoreCompressor, self).__init__()
 
     def compress(self, content):
@@ -28,14 +85,20 @@ class _StoreCompressor(_Com):
     def decompress(self, content):
         return content
 
+    def decompressobj(self):
+        return _StoreDecompressObj()
+
+    def compressobj(self):
+        return _StoreCompressObj()
+
 
 class _DeflatedCompressor(_Com):
     key = 8
 
-    def __init__(self):
+    def __init__(self, level=None):
         super(_DeflatedCompressor, self).__init__()
-        self.cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
-                                     zlib.DEFLATED, -15)
+        self.level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+        self.cmpr = self.compressobj()
 
     def compress(self, content):
         return self.cmpr.compress(content) + self.cmpr.flush()
@@ -43,6 +106,12 @@ class _DeflatedCompressor(_Com):
     def decompress(self, content):
         return zlib.decompress(content, -15)
 
+    def decompressobj(self):
+        return zlib.decompressobj(-15)
+
+    def compressobj(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, -15)
+
 
 class Compressor:
     ZIP_STORE = _StoreCompressor.key
@@ -54,13 +123,25 @@ class Compressor:
         _DeflatedCompressor.key: _DeflatedCompressor,
     }
 
-    def __init__(self, method):
+    def __init__(self, method, level=None):
+        '''
+        level: zlib compression level for deflate, the zlib default if None
+        '''
         if not self._dict_.get(method):
             raise CompressError("compression method `{}` is not supported".format(method))
-        self.handler = self._dict_.get(method)()
+        self.handler = self._dict_.get(method)(level)
 
     def compress(self, content):
         return self.handler.compress(content)
 
     def decompress(self, content):
         return self.handler.decompress(content)
+
+    def decompressobj(self):
+        return self.handler.decompressobj()
+
+    def compressobj(self):
+        '''
+        incremental compressor with the compress / flush of zlib.compressobj
+        '''
+        return self.handler.compressobj()
@@ -1,20 +1,37 @@
-import random
-
-from Crypto.Cipher import AES
-from Crypto.Hash import HMAC, SHA
-from Crypto.Util import Counter
-from Crypto.Protocol.KDF import PBKDF2
+import copy
 
 
 class CryptError(Exception):
     pass
 
 
+_crypto = None
+
+
+def crypto():
+    '''
+    (AES, HMAC, SHA, Counter, PBKDF2) of pycryptodome, imported on first use
+    so that archives without AES entries never load it
+    '''
+    global _crypto
+    if _crypto is None:
+        try:
+            from Crypto.Cipher import AES
+            from Crypto.Hash import HMAC, SHA
+            from Crypto.Util import Counter
+            from Crypto.Protocol.KDF import PBKDF2
+        except ImportError as e:
+            raise CryptError('AES encryption needs pycryptodome: {}'.format(e))
+        _crypto = AES, HMAC, SHA, Counter, PBKDF2
+    return _crypto
+
+
 class BadPassword(Exception):
     pass
 
 
 def random_salt(length):
+    import random
     salt = ''
     for i in range(length):
         salt += chr(int(random.random() * 255))
@@ -57,31 +74,48 @@ class AESCrypt(Crypt):
         super(AESCrypt, self).__init__(password)
 
     def encrypt(self, contents, encrypt_strength):
+        header, encrypter = self.encrypter(encrypt_strength)
+        encrypted_data = encrypter.encrypt(contents)
+        return header + encrypted_data + encrypter.authenticationCode()
+
+    def encrypter(self, encrypt_strength):
+        '''
+        returns the salt and password verification value to put in front of
+        the encrypted data, and an AESEncrypter for the data
+        '''
+        PBKDF2 = crypto()[4]
         salt_len, key_len = self.encryption_params[encrypt_strength]
         salt = random_salt(salt_len)
         keys = PBKDF2(self.password, salt, dkLen=key_len * 2 + self.PASSWD_VERIF_LEN, count=self.PBKDF2_ITER)
         password_verification_value = keys[-2:]
 
         aes_key, hmac_key = keys[:key_len], keys[key_len:key_len + key_len]
+        return salt + password_verification_value, AESEncrypter(aes_key, hmac_key)
 
-        ctr = Counter.new(nbits=self.NUM_COUNTER_BITS, initial_value=1, little_endian=True)
-        encrypted_data = AES.new(aes_key, AES.MODE_CTR, counter=ctr).encrypt(contents)
+    def decrypt(self, contents, encrypt_strength):
+        salt_len, key_len = self.encryption_params[encrypt_strength]
+        tell = salt_len + self.PASSWD_VERIF_LEN
+        decrypter = self.decrypter(contents[:tell], encrypt_strength)
 
-        myhmac = HMAC.new(hmac_key, encrypted_data, SHA).digest()
-        authentication_code = myhmac[:10]
+        encrypted_data = contents[tell:-self.AUTH_CODE_LEN]
+        compressed_data = decrypter.decrypt(encrypted_data)
+        decrypter.verify(contents[-self.AUTH_CODE_LEN:])
 
-        return salt + password_verification_value + encrypted_data + authentication_code
+        return compressed_data
 
-    def decrypt(self, contents, encrypt_strength):
+    @classmethod
+    def headerLength(cls, encrypt_strength):
+        return cls.encryption_params[encrypt_strength][0] + cls.PASSWD_VERIF_LEN
 
+    def decrypter(self, header, encrypt_strength):
+        '''
+        header is the salt and the password verification value in front of
+        encrypted data, returns an AESDecrypter for the following data.
+        '''
+        PBKDF2 = crypto()[4]
         salt_len, key_len = self.encryption_params[encrypt_strength]
-        salt = contents[:salt_len]
-        password_verification_value = contents[salt_len:salt_len+self.PASSWD_VERIF_LEN]
-
-        tell = salt_len + self.PASSWD_VERIF_LEN
-        compressed_file_size = len(contents) - (tell + self.AUTH_CODE_LEN)
-        encrypted_data = contents[tell:tell+compressed_file_size]
-        authentication_code = contents[tell+compressed_file_size:]
+        salt = header[:salt_len]
+        password_verification_value = header[salt_len:salt_len+self.PASSWD_VERIF_LEN]
 
         # If prf is not specified, PBKDF2 uses HMAC-SHA1
         keys = PBKDF2(self.password, salt, dkLen=key_len * 2 + self.PASSWD_VERIF_LEN, count=self.PBKDF2_ITER)
@@ -89,14 +123,70 @@ class AESCrypt(Crypt):
             raise BadPassword("Bad password")
 
         aes_key, hmac_key = keys[:key_len], keys[key_len:key_len + key_len]
-        myhmac = HMAC.new(hmac_key, encrypted_data, SHA).digest()
-        if myhmac[:10] != authentication_code:
+        return AESDecrypter(aes_key, hmac_key)
+
+
+class AESDecrypter(object):
+    '''
+    incremental AES-CTR decryption, authenticates the encrypted data as it goes.
+    '''
+
+    BLOCK_SIZE = 16
+
+    def __init__(self, aes_key, hmac_key, position=0):
+        '''
+        position: offset in the encrypted data to start decryption at
+        '''
+        AES, HMAC, SHA, Counter, _ = crypto()
+        self.aes_key = aes_key
+        self.hmac_key = hmac_key
+        self.position = position
+        ctr = Counter.new(nbits=AESCrypt.NUM_COUNTER_BITS, initial_value=1 + position // self.BLOCK_SIZE,
+                          little_endian=True)
+        self.cipher = AES.new(aes_key, AES.MODE_CTR, counter=ctr)
+        if position % self.BLOCK_SIZE:
+            self.cipher.decrypt('\x00' * (position % self.BLOCK_SIZE))
+        self.hmac = HMAC.new(hmac_key, digestmod=SHA)
+
+    def decrypt(self, contents, authenticate=True):
+        '''
+        authenticate=False leaves it to the caller to `authenticate` the data,
+        when the end of the encrypted data is not known in advance
+        '''
+        if authenticate:
+            self.hmac.update(contents)
+        self.position += len(contents)
+        return self.cipher.decrypt(contents)
+
+    def copy(self):
+        other = AESDecrypter(self.aes_key, self.hmac_key, self.position)
+        other.hmac = self.hmac.copy()
+        return other
+
+    def authenticate(self, contents):
+        self.hmac.update(contents)
+
+    def verify(self, authentication_code):
+        if self.hmac.digest()[:AESCrypt.AUTH_CODE_LEN] != authentication_code:
             raise CryptError("Bad auth code")
 
-        ctr = Counter.new(nbits=self.NUM_COUNTER_BITS, initial_value=1, little_endian=True)
-        compressed_data = AES.new(aes_key, AES.MODE_CTR, counter=ctr).decrypt(encrypted_data)
 
-        return compressed_data
+class AESEncrypter(AESDecrypter):
+    '''
+    incremental AES-CTR encryption, authenticates the encrypted data as it goes.
+    '''
+
+    def encrypt(self, contents):
+        data = self.cipher.encrypt(contents)
+        self.hmac.update(data)
+        self.position += len(contents)
+        return data
+
+    def authenticationCode(self):
+        '''
+        the code to put behind the encrypted data
+        '''
+        return self.hmac.digest()[:AESCrypt.AUTH_CODE_LEN]
 
 
 class PKWARECrypt(Crypt):
@@ -111,6 +201,7 @@ class PKWARECrypt(Crypt):
         plain_text = map(zd, cypher_text)
     """
 
+    @staticmethod
     def _generateCRCTable():
         """Generate a CRC-32 table.
         ZIP encryption uses the CRC32 one-byte primitive for scrambling some
@@ -128,7 +219,8 @@ class PKWARECrypt(Crypt):
                     crc = ((crc >> 1) & 0x7FFFFFFF)
             table[i] = crc
         return table
-    crctable = _generateCRCTable()
+    # built by the first instance
+    crctable = None
 
     def _crc32(self, ch, crc):
         """Compute the CRC32 primitive on one byte."""
@@ -136,6 +228,8 @@ class PKWARECrypt(Crypt):
 
     def __init__(self, password):
         super(PKWARECrypt, self).__init__(password)
+        if PKWARECrypt.crctable is None:
+            PKWARECrypt.crctable = self._generateCRCTable()
 
         self.key0 = 305419896
         self.key1 = 591751049
@@ -143,6 +237,9 @@ class PKWARECrypt(Crypt):
         for p in password:
             self._updateKeys(p)
 
+    def copy(self):
+        return copy.copy(self)
+
     def _updateKeys(self, c):
         self.key0 = self._crc32(c, self.key0)
         self.key1 = (self.key1 + (self.key0 & 255)) & 4294967295
@@ -171,3 +268,9 @@ class PKWARECrypt(Crypt):
             data.append(c)
 
         return "".join(data)
+
+    def authenticationCode(self):
+        '''
+        PKWARE encrypted data has no authentication code behind it
+        '''
+        return ''
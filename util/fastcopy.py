@@ -0,0 +1,116 @@
+'''
+kernel side copies and preallocation through libc, python 2 has neither
+os.copy_file_range, os.sendfile nor os.posix_fallocate. every call falls back
+to plain reads and writes (or does nothing) where the call is missing or not
+supported by the file systems involved.
+'''
+import os
+import errno
+
+COPY_SIZE = 1 << 20
+# errors meaning the call can not be used for these files, try the next way
+_UNSUPPORTED = (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.ESPIPE)
+
+# imported by _load, extraction is the only user
+ctypes = None
+_libc = None
+_copy_file_range = None
+_sendfile = None
+_posix_fallocate = None
+
+
+def _load():
+    global ctypes, _libc, _copy_file_range, _sendfile, _posix_fallocate
+    if _libc is not None:
+        return
+    import ctypes
+    import ctypes.util
+    try:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except OSError:
+        _libc = False
+        return
+    loff_p = ctypes.POINTER(ctypes.c_int64)
+    _copy_file_range = getattr(_libc, 'copy_file_range', None)
+    if _copy_file_range is not None:
+        _copy_file_range.argtypes = [ctypes.c_int, loff_p, ctypes.c_int, loff_p, ctypes.c_size_t, ctypes.c_uint]
+        _copy_file_range.restype = ctypes.c_ssize_t
+    _sendfile = getattr(_libc, 'sendfile64', None) or getattr(_libc, 'sendfile', None)
+    if _sendfile is not None:
+        _sendfile.argtypes = [ctypes.c_int, ctypes.c_int, loff_p, ctypes.c_size_t]
+        _sendfile.restype = ctypes.c_ssize_t
+    _posix_fallocate = getattr(_libc, 'posix_fallocate64', None) or getattr(_libc, 'posix_fallocate', None)
+    if _posix_fallocate is not None:
+        _posix_fallocate.argtypes = [ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+        _posix_fallocate.restype = ctypes.c_int
+
+
+def copyRange(src_fd, offset, dst_fd, length):
+    '''
+    copy length bytes at offset of src_fd to the position of dst_fd, with
+    copy_file_range, then sendfile, then read / write. returns the name of the
+    way used.
+    '''
+    _load()
+    if length > 0:
+        for name in ('copy_file_range', 'sendfile'):
+            if _kernelCopy(name, src_fd, offset, dst_fd, length):
+                return name
+
+    remain = length
+    while remain > 0:
+        os.lseek(src_fd, offset, os.SEEK_SET)
+        data = os.read(src_fd, min(remain, COPY_SIZE))
+        if not data:
+            raise IOError('unexpected end of file at {}'.format(offset))
+        os.write(dst_fd, data)
+        offset += len(data)
+        remain -= len(data)
+    return 'read'
+
+
+def _kernelCopy(name, src_fd, offset, dst_fd, length):
+    '''
+    False when the call is not available for these descriptors, before any
+    byte was copied
+    '''
+    global _copy_file_range, _sendfile
+    func = _copy_file_range if name == 'copy_file_range' else _sendfile
+    if func is None:
+        return False
+    position = ctypes.c_int64(offset)
+    remain = length
+    while remain > 0:
+        count = min(remain, 1 << 30)
+        if name == 'copy_file_range':
+            copied = func(src_fd, ctypes.byref(position), dst_fd, None, count, 0)
+        else:
+            copied = func(dst_fd, src_fd, ctypes.byref(position), count)
+        if copied < 0:
+            error = ctypes.get_errno()
+            if error == errno.EINTR:
+                continue
+            if error in _UNSUPPORTED and remain == length:
+                if error == errno.ENOSYS:
+                    # not in this kernel, stop trying it
+                    if name == 'copy_file_range':
+                        _copy_file_range = None
+                    else:
+                        _sendfile = None
+                return False
+            raise OSError(error, os.strerror(error))
+        if copied == 0:
+            raise IOError('unexpected end of file at {}'.format(position.value))
+        remain -= copied
+    return True
+
+
+def preallocate(fd, size):
+    '''
+    reserve size bytes for fd, so the file is laid out in one go. returns
+    whether it was done.
+    '''
+    _load()
+    if _posix_fallocate is None or size <= 0:
+        return False
+    return _posix_fallocate(fd, 0, size) == 0
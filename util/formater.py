@@ -187,10 +187,7 @@ class Container(object):
         return size
 
     def pack(self):
-        content = ''
-        for group in self.__struct__.fields_groups:
-            content += group.pack(self)
-        return content
+        return ''.join([group.pack(self) for group in self.__struct__.fields_groups])
 
     def __eq__(self, other):
         for f in self.__fields__:
@@ -306,7 +303,7 @@ class _FormatGroup(object):
         return struct.pack(self.code, *vals)
 
     def _packBytes(self, params):
-        content = ''
+        content = []
         for f in self.fields:
             val = getattr(params, f.name) or ''
             f.validate(val)
@@ -326,11 +323,11 @@ class _FormatGroup(object):
             elif define_size != len(val):
                 raise FormatError("bytes `{}` length is not correct".format(f.name))
 
-            content += val
-        return content
+            content.append(val)
+        return ''.join(content)
 
     def _packConst(self, params):
-        content = ''
+        content = []
         for f in self.fields:
             val = getattr(params, f.name)
             if val is not None:
@@ -338,8 +335,8 @@ class _FormatGroup(object):
 
             if val and val != f.value:
                 raise FormatError("const `{}` got wrong value".format(f.name))
-            content += f.value
-        return content
+            content.append(f.value)
+        return ''.join(content)
 
     def pack(self, params):
         if self.type == _FormatGroup.NORMAL:
@@ -416,7 +413,4 @@ class Struct(object):
 
     def pack(self, **kws):
         params = DictObject(kws)
-        content = ''
-        for group in self.fields_groups:
-            content += group.pack(params)
-        return content
+        return ''.join([group.pack(params) for group in self.fields_groups])
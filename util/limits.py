@@ -0,0 +1,114 @@
+import threading
+
+from util import BadZipfile
+
+
+class LimitError(BadZipfile):
+    pass
+
+
+class Limits(object):
+    '''
+    resource limits of a ZipReader or ZipStreamReader against hostile archives
+    (zip bombs), None disables a limit:
+
+        max_entry_size: uncompressed bytes of an entry
+        max_ratio: uncompressed / compressed bytes of an entry
+        max_entries: entries of the archive
+        max_total_size: uncompressed bytes decoded by the reader, all entries
+            and reads together
+        max_decode_seconds: time spent decoding an entry
+
+    the counts and sizes of the central directory are checked before anything
+    is read, the decoded bytes while they are decoded, see `budget`.
+
+    usage:
+        limits = Limits(max_entry_size=1 << 30, max_ratio=200, max_entries=100000)
+        with ZipReader('upload.zip', limits=limits) as zipreader:
+            ...
+    '''
+
+    def __init__(self, max_entry_size=None, max_ratio=None, max_entries=None,
+                 max_total_size=None, max_decode_seconds=None):
+        self.max_entry_size = max_entry_size
+        self.max_ratio = max_ratio
+        self.max_entries = max_entries
+        self.max_total_size = max_total_size
+        self.max_decode_seconds = max_decode_seconds
+        # uncompressed bytes decoded so far
+        self.total_size = 0
+        self._lock = threading.Lock()
+
+    def checkEntries(self, count):
+        if self.max_entries is not None and count > self.max_entries:
+            raise LimitError('{} entries exceed the limit of {}'.format(count, self.max_entries))
+
+    def checkEntry(self, zinfo):
+        '''
+        check the sizes zinfo was given by the central directory (or the local
+        file header, unless they follow in a data descriptor)
+        '''
+        csize, ucsize = zinfo.csize, zinfo.ucsize
+        if not csize and not ucsize and zinfo.general_purpose_bit_flag & 0x8:
+            return
+        if self.max_entry_size is not None and ucsize > self.max_entry_size:
+            raise LimitError('size {} exceeds the limit of {}'.format(ucsize, self.max_entry_size), zinfo.filename)
+        if self.max_ratio is not None and ucsize > self.max_ratio * csize:
+            raise LimitError('compression ratio of {} to {} exceeds the limit of {}'.format(
+                ucsize, csize, self.max_ratio), zinfo.filename)
+        self.checkTotal(ucsize, zinfo.filename)
+
+    def checkTotal(self, ucsize, filename=None):
+        '''
+        check that ucsize more bytes can be decoded
+        '''
+        if self.max_total_size is not None and self.total_size + ucsize > self.max_total_size:
+            raise LimitError('total size exceeds the limit of {}'.format(self.max_total_size), filename)
+
+    def budget(self, zinfo):
+        '''
+        check zinfo and return the budget its decoding is counted against
+        '''
+        self.checkEntry(zinfo)
+        return EntryBudget(self, zinfo)
+
+    def addTotal(self, nbytes, filename=None):
+        with self._lock:
+            self.total_size += nbytes
+            total_size = self.total_size
+        if self.max_total_size is not None and total_size > self.max_total_size:
+            raise LimitError('total size exceeds the limit of {}'.format(self.max_total_size), filename)
+
+
+class EntryBudget(object):
+    '''
+    counts the decoding of an entry, see `util.compress.inflate`. the content may
+    not outgrow the declared size, the entry size limit, nor the compression
+    ratio limit applied to the compressed size (or to the bytes consumed so far
+    when the size is not known yet).
+    '''
+
+    def __init__(self, limits, zinfo):
+        self.limits = limits
+        self.filename = zinfo.filename
+        self.size = 0
+        self.consumed = 0
+        self.seconds = 0.0
+        self.csize = zinfo.csize
+        self.max_size = limits.max_entry_size
+        if zinfo.csize or zinfo.ucsize or not zinfo.general_purpose_bit_flag & 0x8:
+            self.max_size = min(self.max_size, zinfo.ucsize) if self.max_size is not None else zinfo.ucsize
+
+    def add(self, produced, consumed, seconds):
+        self.size += produced
+        self.consumed += consumed
+        self.seconds += seconds
+        limits = self.limits
+        if self.max_size is not None and self.size > self.max_size:
+            raise LimitError('content exceeds {} bytes'.format(self.max_size), self.filename)
+        if limits.max_ratio is not None and self.size > limits.max_ratio * max(self.csize, self.consumed):
+            raise LimitError('compression ratio exceeds the limit of {}'.format(limits.max_ratio), self.filename)
+        if limits.max_decode_seconds is not None and self.seconds > limits.max_decode_seconds:
+            raise LimitError('decoding exceeds {} seconds'.format(limits.max_decode_seconds), self.filename)
+        limits.addTotal(produced, self.filename)
+
@@ -0,0 +1,110 @@
+import time
+import functools
+import threading
+
+
+class Stats(object):
+    '''
+    cumulative timers and byte counters for reader / writer phases,
+    plus per-entry event hooks for tracing.
+
+    usage:
+        stats = Stats()
+        stats.addHook(lambda event, zinfo, **info: log(event, zinfo.filename, info))
+        with ZipReader('test.zip', stats=stats) as zipreader:
+            ...
+        print stats.asDict()
+    '''
+
+    def __init__(self):
+        self.phases = {}
+        self.hooks = []
+        # worker pools and parallel writers add from several threads
+        self._lock = threading.Lock()
+
+    def add(self, phase, elapsed, nbytes=0):
+        with self._lock:
+            counter = self.phases.get(phase)
+            if counter is None:
+                counter = self.phases[phase] = [0, 0.0, 0]
+            counter[0] += 1
+            counter[1] += elapsed
+            counter[2] += nbytes
+
+    def timer(self, phase, nbytes=0):
+        return _Timer(self, phase, nbytes)
+
+    def addHook(self, callback):
+        '''
+        callback(event, zinfo, **info) is called for every entry event
+        '''
+        self.hooks.append(callback)
+
+    def removeHook(self, callback):
+        self.hooks.remove(callback)
+
+    def emit(self, event, zinfo, **info):
+        for callback in self.hooks:
+            callback(event, zinfo, **info)
+
+    def reset(self):
+        with self._lock:
+            self.phases = {}
+
+    def asDict(self):
+        with self._lock:
+            return dict((phase, {'calls': calls, 'seconds': seconds, 'bytes': nbytes})
+                        for phase, (calls, seconds, nbytes) in self.phases.iteritems())
+
+    def __repr__(self):
+        out = ['Stats:']
+        for phase in sorted(self.phases):
+            calls, seconds, nbytes = self.phases[phase]
+            out.append('{}{} calls={} seconds={:.6f} bytes={}'.format(' ' * 4, phase, calls, seconds, nbytes))
+        return '\n'.join(out)
+
+
+class _Timer(object):
+    def __init__(self, stats, phase, nbytes):
+        self.stats = stats
+        self.phase = phase
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.stats.add(self.phase, time.time() - self.start, self.nbytes)
+
+
+def makeStats(stats):
+    '''
+    stats argument of ZipReader / ZipWriter: None, False, True or a Stats instance
+    '''
+    if stats is True:
+        return Stats()
+    return stats or None
+
+
+def _resultSize(self, result):
+    return len(result) if isinstance(result, str) else 0
+
+
+def timed(phase, size=_resultSize):
+    '''
+    method decorator, accumulates call time and `size(self, result)` bytes into
+    `self.stats`. costs a single attribute check when stats is disabled.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kws):
+            stats = self.stats
+            if stats is None:
+                return func(self, *args, **kws)
+            start = time.time()
+            result = func(self, *args, **kws)
+            stats.add(phase, time.time() - start, size(self, result))
+            return result
+        return wrapper
+    return decorator
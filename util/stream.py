@@ -0,0 +1,112 @@
+import os
+
+
+class WindowStream(object):
+    '''
+    read-only file-like view of `data`, which was read at `offset` of another
+    stream. positions are the ones of the original stream.
+    '''
+
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.offset = offset
+        self.pos = 0
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET:
+            self.pos = pos - self.offset
+        elif whence == os.SEEK_CUR:
+            self.pos += pos
+        elif whence == os.SEEK_END:
+            self.pos = len(self.data) + pos
+        if self.pos < 0:
+            raise IOError('position {} is before the window at {}'.format(self.tell(), self.offset))
+
+    def tell(self):
+        return self.offset + self.pos
+
+    def read(self, size=-1):
+        start = self.pos
+        if size is None or size < 0:
+            end = len(self.data)
+        else:
+            end = min(start + size, len(self.data))
+        self.pos = max(start, end)
+        return self.data[start:end]
+
+    def close(self):
+        self.data = ''
+
+
+class PushbackStream(object):
+    '''
+    forward-only reader over a readable stream (pipe, socket, http body), bytes
+    read too far can be given back with `unread`. read(size) returns less than
+    size bytes only at the end of the stream.
+    '''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.pending = ''
+        self.position = 0
+
+    def read(self, size):
+        parts = []
+        if self.pending:
+            parts.append(self.pending[:size])
+            self.pending = self.pending[size:]
+            size -= len(parts[0])
+        while size > 0:
+            data = self.stream.read(size)
+            if not data:
+                break
+            parts.append(data)
+            size -= len(data)
+        data = ''.join(parts)
+        self.position += len(data)
+        return data
+
+    def unread(self, data):
+        self.pending = data + self.pending
+        self.position -= len(data)
+
+    def tell(self):
+        return self.position
+
+
+class BufferedWriter(object):
+    '''
+    gathers small writes (headers, small entries) into writes of at least
+    flush_size bytes. data of flush_size or more bytes is written through
+    after the pending bytes, without being copied into the buffer.
+    '''
+
+    def __init__(self, stream, flush_size=1 << 20):
+        self.stream = stream
+        self.flush_size = flush_size
+        self.name = getattr(stream, 'name', None)
+        self.parts = []
+        self.pending = 0
+        self.position = stream.tell()
+
+    def write(self, data):
+        if not data:
+            return
+        self.position += len(data)
+        if len(data) >= self.flush_size:
+            self.flush()
+            self.stream.write(data)
+            return
+        self.parts.append(data)
+        self.pending += len(data)
+        if self.pending >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            self.stream.write(''.join(self.parts))
+            self.parts = []
+            self.pending = 0
+
+    def tell(self):
+        return self.position
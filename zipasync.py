@@ -0,0 +1,267 @@
+#!coding=utf8
+"""
+asyncio counterparts of ZipReader and ZipWriter, on trollius for Python 2.
+
+Parsing, decryption and decompression stay in ZipReader / ZipWriter / ZipInfo,
+they run on an executor (the loop's default one unless given), so file I/O,
+inflate and AES never block the event loop.
+
+    @asyncio.coroutine
+    def handler():
+        reader = yield From(AsyncZipReader.create('test.zip', password='pwd'))
+        content = yield From(reader.read('file.txt'))
+        fd = reader.open('big.log')
+        while True:
+            chunk = yield From(fd.next_chunk())
+            if not chunk:
+                break
+        yield From(reader.close())
+"""
+import threading
+
+import trollius as asyncio
+from trollius import From, Return
+
+from zippkg import ZipReader, ZipWriter
+
+
+class AsyncZipReader(object):
+
+    def __init__(self, reader, executor=None, loop=None):
+        '''
+        reader: a ZipReader, see `create` to build it off the event loop
+        '''
+        self.reader = reader
+        self.executor = executor
+        self.loop = loop or asyncio.get_event_loop()
+        self._local = threading.local()
+        self._streams = []
+
+    @classmethod
+    @asyncio.coroutine
+    def create(cls, file, executor=None, loop=None, **kws):
+        '''
+        kws are the ones of ZipReader
+        '''
+        loop = loop or asyncio.get_event_loop()
+        reader = yield From(loop.run_in_executor(executor, lambda: ZipReader(file, **kws)))
+        raise Return(cls(reader, executor=executor, loop=loop))
+
+    def _run(self, func, *args):
+        return self.loop.run_in_executor(self.executor, func, *args)
+
+    def _withStream(self, func):
+        '''
+        calls func(stream) on the executor thread's private stream, or on the
+        shared stream of the reader while holding its lock
+        '''
+        stream = getattr(self._local, 'stream', None)
+        if stream is None:
+            stream = self._local.stream = self.reader._openWorkerStream()
+            if stream is not self.reader.stream:
+                self._streams.append(stream)
+        if stream is self.reader.stream:
+            with self.reader._lock:
+                return func(stream)
+        return func(stream)
+
+    def namelist(self):
+        return self.reader.namelist()
+
+    def infolist(self):
+        return self.reader.infolist()
+
+    def getinfo(self, name):
+        return self.reader.getinfo(name)
+
+    @asyncio.coroutine
+    def read(self, item, password=None):
+        zinfo = self.reader._getItem(item)
+        password = password or self.reader.password
+        content = yield From(self._run(self._withStream, lambda stream: zinfo.read(password=password, stream=stream)))
+        raise Return(content)
+
+    def open(self, item, password=None):
+        '''
+        returns an AsyncZipExtFile, whose next_chunk() coroutine yields the
+        content chunk by chunk
+        '''
+        zinfo = self.reader._getItem(item)
+        stream = self.reader._openWorkerStream()
+        lock = self.reader._lock if stream is self.reader.stream else None
+        chunks = zinfo.iterContent(password=password or self.reader.password, stream=stream)
+        return AsyncZipExtFile(self, chunks, stream, lock)
+
+    @asyncio.coroutine
+    def close(self):
+        streams, self._streams = self._streams, []
+        for stream in streams:
+            stream.close()
+        yield From(self._run(self.reader.close))
+
+
+class AsyncZipExtFile(object):
+
+    def __init__(self, owner, chunks, stream, lock=None):
+        self.owner = owner
+        self._chunks = chunks
+        self._stream = stream
+        self._lock = lock
+
+    def _next(self):
+        if self._lock is None:
+            return next(self._chunks, '')
+        with self._lock:
+            return next(self._chunks, '')
+
+    @asyncio.coroutine
+    def next_chunk(self):
+        '''
+        returns the next chunk of content, '' at the end
+        '''
+        chunk = yield From(self.owner._run(self._next))
+        if not chunk:
+            self.close()
+        raise Return(chunk)
+
+    @asyncio.coroutine
+    def read(self):
+        parts = []
+        while True:
+            chunk = yield From(self.next_chunk())
+            if not chunk:
+                break
+            parts.append(chunk)
+        raise Return(''.join(parts))
+
+    def close(self):
+        self._chunks = iter(())
+        if self._lock is None and self._stream is not None:
+            self._stream.close()
+        self._stream = None
+
+
+class _Sink(object):
+    '''
+    file-like buffer between ZipWriter and an asyncio StreamWriter
+    '''
+    name = None
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        self.parts.append(data)
+        self.position += len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data = ''.join(self.parts)
+        self.parts = []
+        return data
+
+
+class AsyncZipWriter(object):
+    '''
+    writes to a path or file object on the executor, or to an asyncio
+    StreamWriter, which is drained after every chunk of an entry
+    '''
+
+    def __init__(self, file, executor=None, loop=None, **kws):
+        '''
+        kws are the ones of ZipWriter, note that ZipWriter opens a path for
+        writing right away
+        '''
+        self.executor = executor
+        self.loop = loop or asyncio.get_event_loop()
+        self.stream_writer = None
+        if isinstance(file, asyncio.StreamWriter):
+            self.stream_writer = file
+            # the sink holds a header or a chunk of an entry until it is drained
+            file = self.sink = _Sink()
+            kws['buffer_size'] = 0
+        self.writer = ZipWriter(file, **kws)
+        self._lock = asyncio.Lock(loop=self.loop)
+
+    def _run(self, func, *args):
+        return self.loop.run_in_executor(self.executor, func, *args)
+
+    @asyncio.coroutine
+    def _drain(self):
+        if self.stream_writer is not None:
+            self.stream_writer.write(self.sink.take())
+            yield From(self.stream_writer.drain())
+
+    @asyncio.coroutine
+    def writestr(self, filename, content, **kws):
+        '''
+        kws are the ones of ZipWriter.writestr. content is compressed and
+        encrypted while other entries are written, see `_commit`
+        '''
+        encoder = self.writer._encoder(filename, **kws)
+
+        def encode():
+            try:
+                encoder.write(content)
+            except BaseException:
+                encoder.abort()
+                raise
+            return encoder.close()
+
+        data = yield From(self._run(encode))
+        yield From(self._commit(encoder, data))
+
+    @asyncio.coroutine
+    def writeiter(self, filename, chunks, **kws):
+        '''
+        chunks: an AsyncZipExtFile or any object whose next_chunk() coroutine
+        returns '' at the end. every chunk is compressed as it comes, the entry
+        waits in a spool file instead of in memory, see `zipinfo.EntryEncoder`
+        '''
+        encoder = self.writer._encoder(filename, **kws)
+        try:
+            while True:
+                chunk = yield From(chunks.next_chunk())
+                if not chunk:
+                    break
+                yield From(self._run(encoder.write, chunk))
+        except BaseException:
+            encoder.abort()
+            raise
+        data = yield From(self._run(encoder.close))
+        yield From(self._commit(encoder, data))
+
+    @asyncio.coroutine
+    def _commit(self, encoder, data):
+        '''
+        append the entry data of encoder, entries take turns here only
+        '''
+        try:
+            with (yield From(self._lock)):
+                if self.stream_writer is None:
+                    yield From(self._run(self.writer._commit, encoder.zipinfo, data))
+                else:
+                    yield From(self._send(encoder.zipinfo, data))
+        finally:
+            data.close()
+
+    @asyncio.coroutine
+    def _send(self, zipinfo, data):
+        '''
+        commit zipinfo to the StreamWriter a chunk at a time, the chunks are
+        read from data on the executor and drained one by one, so a slow peer
+        holds back the entry instead of letting it pile up in memory
+        '''
+        steps = zipinfo.iterCommit(data)
+        while (yield From(self._run(next, steps, False))) is not False:
+            yield From(self._drain())
+        self.writer._addCentralDirHeader(zipinfo)
+
+    @asyncio.coroutine
+    def close(self):
+        with (yield From(self._lock)):
+            yield From(self._run(self.writer.close))
+            yield From(self._drain())
@@ -0,0 +1,311 @@
+#!coding=utf8
+"""
+Command line interface of zippkg, run as `python -m zippkg`.
+
+    python -m zippkg list -l archive.zip
+    python -m zippkg extract -j 4 -d out archive.zip
+    python -m zippkg create -j 8 --level 6 --policy auto archive.zip src/
+    python -m zippkg test -j 4 archive.zip
+    python -m zippkg append archive.zip notes.txt
+    python -m zippkg copy --exclude '**.log' archive.zip filtered.zip
+    python -m zippkg recover truncated.zip repaired.zip
+    python -m zippkg diff build-1.zip build-2.zip
+    python -m zippkg grep -j 4 -i 'timeout|refused' logs.zip '**.log'
+
+exit status: 0 on success, 1 when the archive is broken, an entry fails its
+check or a file can not be read or written, 2 on usage errors.
+"""
+import os
+import re
+import sys
+import time
+import argparse
+
+from util import BadZipfile
+from util.stats import Stats
+from nameindex import translate
+from zippkg import ZipReader, ZipWriter, diff
+
+
+# suffixes of already compressed formats, stored by `create --policy auto`
+STORED_SUFFIXES = [
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.zst', '.lz4',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.mp3', '.mp4', '.mkv', '.mov',
+    '.avi', '.ogg', '.flac', '.jar', '.whl', '.docx', '.xlsx', '.pptx',
+]
+
+METHODS = {0: 'Stored', 8: 'Defl'}
+
+
+class CommandError(Exception):
+    pass
+
+
+def _arcname(path):
+    '''
+    entry name of a path given on the command line
+    '''
+    path = os.path.normpath(path).replace(os.sep, '/')
+    while path.startswith('../'):
+        path = path[3:]
+    return path.lstrip('/') if path not in ('.', '..') else ''
+
+
+def _matcher(include, exclude):
+    include = [re.compile(translate(pattern)) for pattern in include or []]
+    exclude = [re.compile(translate(pattern)) for pattern in exclude or []]
+
+    def match(name):
+        if include and not any(regex.match(name) for regex in include):
+            return False
+        return not any(regex.match(name) for regex in exclude)
+    return match
+
+
+def _writerKws(args):
+    kws = {}
+    if args.password:
+        kws['password'] = args.password
+        kws['cryption'] = args.cryption
+    if args.level is not None:
+        kws['compression_level'] = args.level
+    if args.policy == 'store':
+        kws['compression_method'] = 0
+    elif args.policy == 'auto':
+        kws['store_suffixes'] = STORED_SUFFIXES
+    return kws
+
+
+def _addPaths(zipwriter, paths, workers):
+    '''
+    add files and directory trees, returns the number of bytes of the entries
+    written when the writer keeps stats, 0 otherwise
+    '''
+    total = [0]
+
+    def count(event, zinfo, ucsize=0, **info):
+        if event == 'write':
+            total[0] += ucsize
+
+    if zipwriter.stats is not None:
+        zipwriter.stats.addHook(count)
+    try:
+        for path in paths:
+            arcname = _arcname(path)
+            if os.path.isdir(path):
+                zipwriter.write_tree(path, arcname, workers=workers)
+            else:
+                st = os.stat(path)
+                with open(path, 'rb') as fd:
+                    content = fd.read()
+                zipwriter.writestr(arcname, content, date_time=time.localtime(st.st_mtime)[:6])
+    finally:
+        if zipwriter.stats is not None:
+            zipwriter.stats.removeHook(count)
+    return total[0]
+
+
+def cmdList(args, stats):
+    total = 0
+    with ZipReader(args.archive, stats=stats) as zipreader:
+        infos = zipreader.infolist()
+        if not args.long:
+            for zinfo in infos:
+                print(zinfo.filename.encode('utf8'))
+            return sum(zinfo.ucsize for zinfo in infos)
+        print(' Length   Method    Size  Cmpr    Date    Time   CRC-32   Name')
+        print('--------  ------  ------- ---- ---------- ----- --------  ----')
+        for zinfo in infos:
+            method = METHODS.get(zinfo.compression_method, str(zinfo.compression_method))
+            if zinfo.is_encrypted:
+                method += '*'
+            ratio = 100 - 100 * zinfo.csize // zinfo.ucsize if zinfo.ucsize else 0
+            print('{:>8}  {:<6} {:>8} {:>3}% {:04}-{:02}-{:02} {:02}:{:02} {:08x}  {}'.format(
+                zinfo.ucsize, method, zinfo.csize, ratio,
+                *(zinfo.date_time[:5] + (zinfo.crc32, zinfo.filename.encode('utf8')))))
+            total += zinfo.ucsize
+        print('--------          -------                            ----')
+        print('{:>8}          {:>7}                            {} files'.format(
+            total, sum(zinfo.csize for zinfo in infos), len(infos)))
+    return total
+
+
+def cmdExtract(args, stats):
+    with ZipReader(args.archive, password=args.password, stats=stats) as zipreader:
+        members = None
+        if args.members:
+            match = _matcher(args.members, None)
+            members = [name for name in zipreader.namelist() if match(name)]
+            if not members:
+                raise CommandError('no entry matches {}'.format(' '.join(args.members)))
+        zipreader.extractall(args.directory, members, workers=args.jobs)
+        infos = zipreader.infolist() if members is None else [zipreader.getinfo(name) for name in members]
+        return sum(zinfo.ucsize for zinfo in infos)
+
+
+def cmdCreate(args, stats):
+    with ZipWriter(args.archive, stats=stats, **_writerKws(args)) as zipwriter:
+        return _addPaths(zipwriter, args.paths, args.jobs)
+
+
+def cmdAppend(args, stats):
+    with ZipWriter(args.archive, stats=stats, mode='a', **_writerKws(args)) as zipwriter:
+        return _addPaths(zipwriter, args.paths, args.jobs)
+
+
+def cmdTest(args, stats):
+    with ZipReader(args.archive, password=args.password, stats=stats) as zipreader:
+        bad = zipreader.testzip(workers=args.jobs)
+        for entry in bad:
+            print('{}: {}'.format(entry.filename.encode('utf8'), entry.error))
+        if bad:
+            raise CommandError('{} of {} entries failed'.format(len(bad), len(zipreader.infolist())))
+        print('{} entries ok'.format(len(zipreader.infolist())))
+        return sum(zinfo.ucsize for zinfo in zipreader.infolist())
+
+
+def cmdCopy(args, stats):
+    match = _matcher(args.include, args.exclude)
+    with ZipReader(args.source) as zipreader:
+        members = [name for name in zipreader.namelist() if match(name)]
+        with ZipWriter(args.target, stats=stats) as zipwriter:
+            zipwriter.copy_from(zipreader, members)
+        return sum(zipreader.getinfo(name).csize for name in members)
+
+
+def cmdRecover(args, stats):
+    with ZipReader(args.source, stats=stats, recover=True) as zipreader:
+        infos = zipreader.infolist()
+        if not infos:
+            raise CommandError('no entry found in {}'.format(args.source))
+        if args.target:
+            with ZipWriter(args.target, stats=stats) as zipwriter:
+                zipwriter.copy_from(zipreader)
+        print('{} entries recovered'.format(len(infos)))
+        return zipreader.size
+
+
+def cmdDiff(args, stats):
+    with ZipReader(args.old, stats=stats) as old, ZipReader(args.new, stats=stats) as new:
+        changes = diff(old, new)
+        lines = []
+        lines.extend('A {}'.format(zinfo.filename.encode('utf8')) for zinfo in changes.added)
+        lines.extend('D {}'.format(zinfo.filename.encode('utf8')) for zinfo in changes.removed)
+        lines.extend('M {}'.format(new_zinfo.filename.encode('utf8')) for _, new_zinfo in changes.modified)
+        lines.extend('R {} -> {}'.format(old_zinfo.filename.encode('utf8'), new_zinfo.filename.encode('utf8'))
+                     for old_zinfo, new_zinfo in changes.renamed)
+        if not args.summary and lines:
+            sys.stdout.write('\n'.join(lines) + '\n')
+        print('{} added, {} removed, {} modified, {} renamed'.format(
+            len(changes.added), len(changes.removed), len(changes.modified), len(changes.renamed)))
+        return old.end_central_dir.size_central_dir + new.end_central_dir.size_central_dir
+
+
+def cmdGrep(args, stats):
+    flags = re.MULTILINE | (re.IGNORECASE if args.ignore_case else 0)
+    try:
+        pattern = re.compile(args.pattern, flags)
+    except re.error as e:
+        raise CommandError('bad pattern {!r}: {}'.format(args.pattern, e))
+    with ZipReader(args.archive, password=args.password, stats=stats) as zipreader:
+        matches = zipreader.search(pattern, members=args.members or None, workers=args.jobs,
+                                   max_count=args.max_count)
+        for match in matches:
+            sys.stdout.write('{}:{}:{}\n'.format(match.filename.encode('utf8'), match.line_number, match.line))
+        return sum(len(match.line) for match in matches)
+
+
+def buildParser():
+    parser = argparse.ArgumentParser(prog='python -m zippkg', description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--stats', action='store_true', help='report timings and throughput on stderr')
+    commands = parser.add_subparsers(dest='command')
+
+    def command(name, func, help):
+        sub = commands.add_parser(name, help=help)
+        sub.set_defaults(func=func)
+        return sub
+
+    def jobs(sub):
+        sub.add_argument('-j', '--jobs', type=int, default=1, help='worker threads')
+
+    def password(sub):
+        sub.add_argument('--password', default=None)
+
+    sub = command('list', cmdList, 'list entries from the central directory')
+    sub.add_argument('-l', '--long', action='store_true', help='sizes, method, date and crc32')
+    sub.add_argument('archive')
+
+    sub = command('extract', cmdExtract, 'extract entries')
+    sub.add_argument('-d', '--directory', default='.', help='output directory')
+    jobs(sub)
+    password(sub)
+    sub.add_argument('archive')
+    sub.add_argument('members', nargs='*', help='names or glob patterns, default all')
+
+    for name, func, help in [('create', cmdCreate, 'create an archive from files and directories'),
+                             ('append', cmdAppend, 'add files and directories to an archive')]:
+        sub = command(name, func, help)
+        jobs(sub)
+        password(sub)
+        sub.add_argument('--cryption', default='AES_256', choices=['ZIP', 'AES_128', 'AES_192', 'AES_256'])
+        sub.add_argument('--level', type=int, choices=range(-1, 10), default=None, help='deflate level')
+        sub.add_argument('--policy', default='deflate', choices=['deflate', 'store', 'auto'],
+                         help='auto stores already compressed formats')
+        sub.add_argument('archive')
+        sub.add_argument('paths', nargs='+')
+
+    sub = command('test', cmdTest, 'check crc32 and authentication codes of all entries')
+    jobs(sub)
+    password(sub)
+    sub.add_argument('archive')
+
+    for name in ('copy', 'filter'):
+        sub = command(name, cmdCopy, 'copy entries to a new archive without recompressing them')
+        sub.add_argument('--include', action='append', help='glob pattern, may be repeated')
+        sub.add_argument('--exclude', action='append', help='glob pattern, may be repeated')
+        sub.add_argument('source')
+        sub.add_argument('target')
+
+    sub = command('recover', cmdRecover, 'rebuild the central directory of a truncated or damaged archive')
+    sub.add_argument('source')
+    sub.add_argument('target', nargs='?', help='repaired archive, default only count the entries')
+
+    sub = command('diff', cmdDiff, 'compare the central directories of two archives')
+    sub.add_argument('-s', '--summary', action='store_true', help='print the counts only')
+    sub.add_argument('old')
+    sub.add_argument('new')
+
+    sub = command('grep', cmdGrep, 'search the content of entries for a regular expression')
+    jobs(sub)
+    password(sub)
+    sub.add_argument('-i', '--ignore-case', action='store_true')
+    sub.add_argument('-m', '--max-count', type=int, default=None, help='stop after this many matching lines')
+    sub.add_argument('pattern')
+    sub.add_argument('archive')
+    sub.add_argument('members', nargs='*', help='names or glob patterns, default all')
+    return parser
+
+
+def main(argv=None):
+    args = buildParser().parse_args(argv)
+    stats = Stats() if args.stats else None
+    start = time.time()
+    try:
+        nbytes = args.func(args, stats)
+    except (BadZipfile, CommandError, IOError, OSError) as e:
+        sys.stderr.write('zippkg: {}\n'.format(e))
+        return 1
+    except Exception as e:
+        # crypt and compress errors, wrong passwords
+        sys.stderr.write('zippkg: {}: {}\n'.format(type(e).__name__, e))
+        return 1
+    if stats is not None:
+        elapsed = time.time() - start
+        sys.stderr.write('{} bytes in {:.3f}s, {:.2f} MB/s\n'.format(
+            nbytes, elapsed, nbytes / max(elapsed, 1e-9) / (1 << 20)))
+        sys.stderr.write('{!r}\n'.format(stats))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,250 @@
+import os
+import bisect
+import threading
+
+from util import BadZipfile
+from util.limits import LimitError
+
+
+class ZipExtFile(object):
+    '''
+    file-like object of an entry's content, returned by ZipReader.open.
+    iterating over it yields the content in chunks.
+    '''
+
+    def __init__(self, chunks, zinfo):
+        self.zinfo = zinfo
+        self.name = zinfo.filename
+        self._chunks = iter(chunks)
+        self._buffer = ''
+        self.closed = False
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = self._buffer + ''.join(self._chunks)
+            self._buffer = ''
+            return data
+
+        parts = [self._buffer]
+        length = len(self._buffer)
+        while length < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            parts.append(chunk)
+            length += len(chunk)
+        data = ''.join(parts)
+        self._buffer = data[size:]
+        return data[:size]
+
+    def __iter__(self):
+        if self._buffer:
+            data, self._buffer = self._buffer, ''
+            yield data
+        for chunk in self._chunks:
+            yield chunk
+
+    def close(self):
+        self._chunks = iter(())
+        self._buffer = ''
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+class SeekableZipExtFile(object):
+    '''
+    seekable reader of an entry, returned by ZipReader.open(seekable=True).
+
+    decoding records a checkpoint of the decompressor and decrypter state about
+    every `span` bytes of content, seek() resumes from the nearest checkpoint in
+    front of the target instead of the start of the entry. it is zlib's zran,
+    except that the 32k window lives inside the copied decompress object.
+    when the checkpoints exceed checkpoint_bytes, every other one is dropped and
+    the span doubles. the checkpoints are kept in a CheckpointIndex, which the
+    files of an entry can share.
+    '''
+    # a checkpoint holds the 32k window and the inflate state
+    CHECKPOINT_COST = 48 << 10
+    SPAN = 1 << 20
+    CHECKPOINT_BYTES = 16 << 20
+    # compressed bytes decoded at once, the granularity of checkpoints
+    READ_SIZE = 16 << 10
+    # content decoded at once at most, whatever the compression ratio
+    DECODE_SIZE = 1 << 20
+
+    def __init__(self, zinfo, stream, password=None, span=None, checkpoint_bytes=None, index=None):
+        '''
+        index: a CheckpointIndex of zinfo and password shared with other files
+            of it, which may be on other threads, span and checkpoint_bytes
+            are the ones of the index then
+        '''
+        self.zinfo = zinfo
+        self.name = zinfo.filename
+        self.size = zinfo.ucsize
+        if index is None:
+            index = CheckpointIndex(span or self.SPAN, checkpoint_bytes or self.CHECKPOINT_BYTES)
+        self.index = index
+        self.closed = False
+        self._stream = stream
+        if zinfo.limits is not None:
+            # checked against the central directory before any read
+            zinfo.limits.checkEntry(zinfo)
+
+        data_offset = zinfo.dataOffset(stream)
+        header_length, trailer_length = zinfo._cryptLengths()
+        if not index.checkpoints:
+            decrypter = None
+            if zinfo.is_encrypted:
+                stream.seek(data_offset, os.SEEK_SET)
+                decrypter = zinfo._openDecrypter(stream.read(header_length), password)
+            index.add(0, 0, zinfo.compressor.decompressobj(), decrypter)
+        self._data_offset = data_offset + header_length
+        self._data_size = (zinfo.csize or zinfo.local_csize) - header_length - trailer_length
+
+        self._restore(index.nearest(0))
+        self._position = 0
+
+    def _restore(self, checkpoint):
+        self._raw, self._pos, decompressor, decrypter = checkpoint
+        self._decompressor = decompressor.copy()
+        self._decrypter = decrypter.copy() if decrypter else None
+        # decoded content starting at self._pos
+        self._pending = ''
+        self._eof = False
+
+    def _checkpoint(self):
+        pos = self._pos + len(self._pending)
+        if self.index.due(self._raw, pos):
+            self.index.add(self._raw, pos, self._decompressor, self._decrypter)
+
+    def _fill(self):
+        # input left over by the last bounded decompress comes first, python 2
+        # keeps it after the end of the stream, where it is unused_data
+        data = self._decompressor.unconsumed_tail
+        if not data or self._decompressor.unused_data:
+            if self._raw >= self._data_size:
+                self._pending += self._decompressor.flush()
+                self._eof = True
+                return
+            self._stream.seek(self._data_offset + self._raw, os.SEEK_SET)
+            data = self._stream.read(min(self.READ_SIZE, self._data_size - self._raw))
+            if not data:
+                raise BadZipfile('unexpected end of file', self.name)
+            self._raw += len(data)
+            if self._decrypter:
+                data = self._decrypter.decrypt(data)
+        self._pending += self._decompressor.decompress(data, self.DECODE_SIZE)
+        if self.zinfo.limits is not None and self._pos + len(self._pending) > self.size:
+            raise LimitError('content exceeds {} bytes'.format(self.size), self.name)
+        self._checkpoint()
+
+    def _moveTo(self, target):
+        '''
+        decode until target is inside self._pending, or the end is reached
+        '''
+        checkpoint = self.index.nearest(target)
+        if target < self._pos or checkpoint[1] > self._pos + len(self._pending):
+            self._restore(checkpoint)
+        while self._pos + len(self._pending) <= target and not self._eof:
+            self._pos += len(self._pending)
+            self._pending = ''
+            self._fill()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = max(self.size - self._position, 0)
+        parts = []
+        while size > 0:
+            self._moveTo(self._position)
+            offset = self._position - self._pos
+            data = self._pending[offset:offset + size]
+            if not data:
+                break
+            parts.append(data)
+            self._position += len(data)
+            size -= len(data)
+        # keep what is left behind the read position only
+        offset = self._position - self._pos
+        if 0 < offset <= len(self._pending):
+            self._pending = self._pending[offset:]
+            self._pos += offset
+        return ''.join(parts)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise IOError('negative seek position {}'.format(offset))
+        self._position = offset
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        self._pending = ''
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+class CheckpointIndex(object):
+    '''
+    checkpoints (data position, content position, decompressor, decrypter) of
+    the decoding of an entry, about every span bytes of content. they are
+    never changed, only copied, so SeekableZipExtFiles on several threads can
+    share them. at most checkpoint_bytes worth are kept, see
+    SeekableZipExtFile.
+    '''
+
+    def __init__(self, span, checkpoint_bytes):
+        self.span = span
+        self.max_checkpoints = max(2, checkpoint_bytes // SeekableZipExtFile.CHECKPOINT_COST)
+        self.checkpoints = []
+        self._lock = threading.Lock()
+
+    def due(self, raw, pos):
+        '''
+        whether a checkpoint at data position raw and content position pos
+        would be added
+        '''
+        checkpoints = self.checkpoints
+        if not checkpoints:
+            return True
+        last_raw, last_pos = checkpoints[-1][:2]
+        return raw > last_raw and pos >= last_pos + self.span
+
+    def add(self, raw, pos, decompressor, decrypter):
+        '''
+        add copies of decompressor and decrypter when due
+        '''
+        checkpoint = (raw, pos, decompressor.copy(), decrypter.copy() if decrypter else None)
+        with self._lock:
+            if not self.due(raw, pos):
+                return
+            self.checkpoints.append(checkpoint)
+            if len(self.checkpoints) > self.max_checkpoints:
+                self.checkpoints = self.checkpoints[::2]
+                self.span *= 2
+
+    def nearest(self, target):
+        '''
+        the last checkpoint at or in front of content position target
+        '''
+        checkpoints = self.checkpoints
+        index = bisect.bisect_right([checkpoint[1] for checkpoint in checkpoints], target) - 1
+        return checkpoints[max(index, 0)]
+
+    def __len__(self):
+        return len(self.checkpoints)
+
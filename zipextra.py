@@ -0,0 +1,72 @@
+import struct
+
+from struct_def import *
+from util.stream import WindowStream
+
+
+def dropExtra(extra_field, signature):
+    '''
+    raw extra_field without the records of signature
+    '''
+    parts = []
+    position = 0
+    while position + 4 <= len(extra_field):
+        length = struct.unpack('<H', extra_field[position + 2:position + 4])[0]
+        if extra_field[position:position + 2] != signature:
+            parts.append(extra_field[position:position + 4 + length])
+        position += 4 + length
+    return ''.join(parts)
+
+
+class ZipExtra:
+
+    AES = Signature.EXTRA_AES
+    UPEF = Signature.EXTRA_UPEF  # Unicode Path Extra Field
+    ZIP64 = Signature.EXTRA_ZIP64
+
+    @property
+    def structs(self):
+        return {
+            self.AES: struct_extra_aes,
+            self.UPEF: struct_extra_upef,
+            self.ZIP64: struct_extra_zip64,
+        }
+
+    def __init__(self, bytes):
+        self.parsed_extra = {}
+        self.all_extra = {}
+
+        self.bytes = bytes
+        self.stream = WindowStream(bytes)
+        self.parse()
+
+    def parse(self):
+        length = len(self.bytes)
+        last_tell = self.stream.tell()
+        while last_tell < length:
+            extra = struct_extra_header.parseStream(self.stream)
+            self.all_extra[extra.signature] = extra
+            struct_detail = self.structs.get(extra.signature)
+            if struct_detail:
+                self.stream.seek(last_tell)
+                self.parsed_extra[extra.signature] = struct_detail.parseStream(self.stream)
+            else:
+                self.stream.seek(last_tell + extra.size() + extra.data_length)
+            last_tell = self.stream.tell()
+
+    def getExtra(self, signature):
+        return self.parsed_extra.get(signature)
+
+    def pack(self):
+        content = ''
+        for _, extra in self.parsed_extra.iteritems():
+            content += extra.pack()
+        return content
+
+    def __repr__(self):
+        out = ['ZipExtra:']
+        for _, extra in self.parsed_extra.iteritems():
+            lines = extra.__repr__().split('\n')
+            out += [' ' * 4 + line for line in lines]
+
+        return '\n'.join(out)
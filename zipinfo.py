@@ -1,16 +1,22 @@
 import os
 import zlib
 import time
-from StringIO import StringIO
+import struct
 
 from util import DictObject, BadZipfile, expect
 from util import crypt
 from struct_def import *
-from util.compress import Compressor
+from util.compress import Compressor, inflate
+from util.stats import timed
 from zipextra import ZipExtra
 
 ZIP64_FILESIZE_LIMIT = (1 << 31) - 1
 
+# fixed part of the local file header, in front of filename and extra field
+LOCAL_FIXED_HEADER = struct.Struct('<4sHHHHHLLLHH')
+# fixed part of the central directory header, see struct_central_dir_header
+CENTRAL_FIXED_HEADER = struct.Struct('<4sHHHHHHLLLHHHHHLL')
+
 
 def checkCRC(crc32, content):
     if crc32 != 0 and crc32 != (zlib.crc32(content) & 0xffffffff):
@@ -19,19 +25,44 @@ def checkCRC(crc32, content):
         return True
 
 
+def localSizes(file_header):
+    '''
+    (csize, ucsize) of local file header, resolved from its zip64 extra field
+    '''
+    csize, ucsize = file_header.csize, file_header.ucsize
+    if 0xFFFFFFFFL in (csize, ucsize):
+        zip64_extra = ZipExtra(file_header.extra_field).getExtra(ZipExtra.ZIP64)
+        if zip64_extra:
+            # the local zip64 extra field must include both sizes
+            counts = unpack_zip64_data(zip64_extra.data)
+            ucsize, csize = counts[0], counts[1]
+    return csize, ucsize
+
+
 class ZipInfo(object):
     # Read from compressed files in 4k blocks.
     MIN_READ_SIZE = 4096
+    # Stream entries in 64k blocks, a multiple of the AES block size.
+    CHUNK_SIZE = 1 << 16
+    # util.stats.Stats instance shared with the owner ZipReader / ZipWriter
+    stats = None
+    # compare the local file header against the central directory when the
+    # data offset is resolved, set by the owner ZipReader
+    check_local_header = False
+    # util.limits.Limits of the owner ZipReader / ZipStreamReader
+    limits = None
     KWS_DEFAULT = dict(
         password=None,
         comment='',
         cryption=None,
-        compression_method=Compressor.ZIP_DEFLATED
+        compression_method=Compressor.ZIP_DEFLATED,
+        compression_level=None,
     )
     KWS_EXPECT = expect.ExpectDict({
         'password': expect.ExpectStr(noneable=True),
         'cryption': expect.ExpectStr(enum=crypt.Crypt.types, noneable=True),
         'compression_method': expect.ExpectInt(),
+        'compression_level': expect.ExpectInt(min=-1, max=10, noneable=True),
         'comment': expect.ExpectStr(noneable=True),
     }, strict=True)
 
@@ -42,10 +73,16 @@ class ZipInfo(object):
             comment='',
             cryption=None,
             compression_method=Compressor.AES_ENCRYPTED,
+            compression_level=None,
         '''
         self.stream = stream
         self.is_encrypted = False
         self.extra = None
+        # offset of the data behind the local file header, see dataOffset
+        self.data_offset = None
+        self.local_csize = None
+        # dir_header values between prepare and commit
+        self._pack_vals = None
 
         default = self.KWS_DEFAULT.copy()
         default.update(kws)
@@ -53,8 +90,24 @@ class ZipInfo(object):
         for k, v in default.iteritems():
             setattr(self, k, v)
 
-    def readHeader(self):
-        self.dir_header = struct_central_dir_header.parseStream(self.stream)
+    def readHeader(self, stream=None):
+        '''
+        parse the central directory header at the position of stream, which
+        defaults to self.stream
+        '''
+        self.dir_header = struct_central_dir_header.parseStream(stream or self.stream)
+        self._readHeader()
+
+    def readLocalInfo(self, file_header, offset):
+        '''
+        set up from a local file header at offset, for readers without central directory
+        '''
+        file_header.relative_offset_file_header = offset
+        file_header.file_comment = ''
+        self.dir_header = file_header
+        self._readHeader()
+
+    def _readHeader(self):
         self.is_encrypted = self.dir_header.general_purpose_bit_flag & 0x1
         self._parseExtra()
 
@@ -91,6 +144,7 @@ class ZipInfo(object):
             if dir_header.relative_offset_file_header == 0xFFFFFFFFL:
                 dir_header.relative_offset_file_header = counts[idx]
                 idx += 1
+        self.orig_filename = dir_header.filename
         # unicode path extra field
         upef_extra = self.extra.getExtra(ZipExtra.UPEF)
         if dir_header.general_purpose_bit_flag & 0x800:
@@ -102,6 +156,15 @@ class ZipInfo(object):
             # Historical ZIP filename encoding
             dir_header.filename = dir_header.filename.decode('cp437')
 
+    @property
+    def date_time(self):
+        '''
+        (year, month, day, hour, minute, second) of last_mod_dos_datetime
+        '''
+        dostime, dosdate = self.dir_header.last_mod_dos_datetime
+        return ((dosdate >> 9) + 1980, (dosdate >> 5) & 0xF, dosdate & 0x1F,
+                dostime >> 11, (dostime >> 5) & 0x3F, (dostime & 0x1F) * 2)
+
     def __getattr__(self, key):
         if hasattr(self.dir_header, key):
             return getattr(self.dir_header, key)
@@ -109,9 +172,41 @@ class ZipInfo(object):
             raise AttributeError("attribute `{}` is not exist".format(key))
 
     def write(self, filename, content='', isdir=False, date_time=(1980, 1, 1, 0, 0, 0)):
-        self.is_encrypted = True if self.password else False
+        self.commit(self.prepare(filename, content, isdir=isdir, date_time=date_time))
+
+    def prepare(self, filename, content='', isdir=False, date_time=(1980, 1, 1, 0, 0, 0)):
+        '''
+        compress and encrypt content without touching the stream, returns the
+        entry data for commit. safe to run on several threads at once.
+        '''
+        if type(content) == unicode:
+            content = content.encode('utf8')
+        packVals = self._packVals(filename, isdir, date_time)
+        compressed_data = ''
+
+        if not isdir:
+            packVals.crc32 = zlib.crc32(content) & 0xffffffff
+            # compress
+            compressed_data = self._compress(content)
+
+            # encrypt
+            if self.password:
+                compressed_data = self._encrypt(compressed_data, crc32=packVals.crc32)
+
+            packVals.ucsize = len(content)
+            packVals.csize = len(compressed_data)
+
+        self._pack_vals = packVals
+        return compressed_data
+
+    def _packVals(self, filename, isdir, date_time):
+        '''
+        the header fields of an entry but its crc32 and sizes
+        '''
+        # directories have no data to compress or encrypt
+        self.is_encrypted = True if self.password and not isdir else False
         # extra AES
-        is_aes_cryption = self.password and self.cryption and self.cryption.startswith('AES')
+        is_aes_cryption = self.is_encrypted and self.cryption and self.cryption.startswith('AES')
 
         # set dir_header
         # ===============================================================
@@ -120,12 +215,10 @@ class ZipInfo(object):
         # create file header
         flags = 0x800  # unicode file
 
-        if self.password:
+        if self.is_encrypted:
             flags = flags | 0x1
         if type(filename) == unicode:
             filename = filename.encode('utf8')
-        if type(content) == unicode:
-            content = content.encode('utf8')
 
         packVals = DictObject({})
         packVals.last_mod_dos_datetime = (dostime, dosdate)
@@ -134,27 +227,36 @@ class ZipInfo(object):
         packVals.filename = filename
         packVals.file_comment = self.comment
 
-        packVals.compression_method = Compressor.AES_ENCRYPTED if is_aes_cryption else self.compression_method
+        if is_aes_cryption:
+            packVals.compression_method = Compressor.AES_ENCRYPTED
+        else:
+            packVals.compression_method = Compressor.ZIP_STORE if isdir else self.compression_method
         packVals.file_comment_length = len(self.comment)
         # packVals.external_file_attributes = (st[0] & 0xFFFF) << 16L      # Unix attributes
         packVals.internal_file_attributes = 0
-        compressed_data = ''
 
         if isdir:
             packVals.crc32 = 0
-            packVals.external_file_attributes |= 0x10
-        else:
-            packVals.crc32 = zlib.crc32(content) & 0xffffffff
-            # compress
-            compressed_data = self._compress(content)
+            # MS-DOS directory attribute
+            packVals.external_file_attributes = 0x10
+        return packVals
 
-            # encrypt
-            if self.password:
-                compressed_data = self._encrypt(compressed_data, crc32=packVals.crc32)
-
-            packVals.ucsize = len(content)
-            packVals.csize = len(compressed_data)
+    def commit(self, data):
+        '''
+        write local file header and data, which is the string returned by
+        prepare or a file holding it, at the current position of the stream
+        '''
+        for _ in self.iterCommit(data):
+            pass
 
+    def iterCommit(self, data):
+        '''
+        commit step by step, yields after the local file header and after
+        every chunk of data written, so the writes can be drained in between
+        '''
+        packVals, self._pack_vals = self._pack_vals, None
+        ucsize, csize = packVals.ucsize or 0, packVals.csize or 0
+        is_aes_cryption = self.is_encrypted and self.cryption and self.cryption.startswith('AES')
         packVals.relative_offset_file_header = self.stream.tell()
 
         # add zip64 fields
@@ -208,29 +310,49 @@ class ZipInfo(object):
         )
         # write file header
         self.stream.write(file_header.pack())
+        yield
         # write file data
-        self.stream.write(compressed_data)
-
-    def read(self, size=None, password=None):
-        stream = self.stream
-        stream.seek(self.dir_header.relative_offset_file_header, os.SEEK_SET)
-        file_header = struct_local_file_header.parseStream(stream)
-        csize = self.dir_header.csize or file_header.csize
+        if isinstance(data, str):
+            self.stream.write(data)
+        else:
+            while True:
+                chunk = data.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.stream.write(chunk)
+                yield
+        if self.stats is not None:
+            self.stats.emit('write', self, ucsize=ucsize, csize=csize)
+
+    def read(self, size=None, password=None, stream=None):
+        if self.limits is not None:
+            # decoded in bounded pieces and checked as it goes
+            return ''.join(self.iterContent(password=password, stream=stream))
+        stream = stream or self.stream
+        stream.seek(self.dataOffset(stream), os.SEEK_SET)
+        csize = self.dir_header.csize or self.local_csize
         if size is not None:
             size = max(size, self.MIN_READ_SIZE)
 
         if size is None or size > csize:
-            content = self._decompress(self._decrypt(csize, password))
-            if not checkCRC(self.crc32, content):
-                raise BadZipfile('crc32 check failed')
+            content = self._checkCRC(self._decompress(self._decrypt(csize, password, stream)))
+            if self.stats is not None:
+                self.stats.emit('read', self, ucsize=len(content), csize=csize)
             return content
         # TODO... read large file as stream
 
-    def _decrypt(self, csize, password=None):
+    @timed('checkCRC')
+    def _checkCRC(self, content):
+        if not checkCRC(self.crc32, content):
+            raise BadZipfile('crc32 check failed')
+        return content
+
+    @timed('_decrypt')
+    def _decrypt(self, csize, password=None, stream=None):
         if password == None:
             password = self.password
 
-        stream = self.stream
+        stream = stream or self.stream
 
         if self.is_encrypted:
             if not password:
@@ -241,103 +363,330 @@ class ZipInfo(object):
             if aes_extra:
                 return crypt.AESCrypt(password).decrypt(data, aes_extra.encrypt_strength)
             else:
-                # The first 12 bytes in the cypher stream is an encryption header
-                #  used to strengthen the algorithm. The first 11 bytes are
-                #  completely random, while the 12th contains the MSB of the CRC,
-                #  or the MSB of the file time depending on the header type
-                #  and is used to check the correctness of the password.
-                encryption_header = data[:crypt.PKWARECrypt.ENCRYPTION_HEADER_LENGTH]
-                _crypt = crypt.PKWARECrypt(password)
-                h = _crypt.decrypt(encryption_header)
-                if self.general_purpose_bit_flag & 0x8:
-                    # compare against the file type from extended local headers
-                    check_byte = (self.last_mod_dos_datetime[0] >> 8) & 0xff
-                else:
-                    # compare against the CRC otherwise
-                    check_byte = (self.crc32 >> 24) & 0xff
-                if ord(h[-1]) != check_byte:
-                    raise crypt.BadPassword("Bad password for file", self.filename)
+                _crypt = self._pkwareCrypt(data[:crypt.PKWARECrypt.ENCRYPTION_HEADER_LENGTH], password)
                 return _crypt.decrypt(data[crypt.PKWARECrypt.ENCRYPTION_HEADER_LENGTH:])
         else:
             return stream.read(csize)
 
+    def _pkwareCrypt(self, encryption_header, password):
+        # The first 12 bytes in the cypher stream is an encryption header
+        #  used to strengthen the algorithm. The first 11 bytes are
+        #  completely random, while the 12th contains the MSB of the CRC,
+        #  or the MSB of the file time depending on the header type
+        #  and is used to check the correctness of the password.
+        _crypt = crypt.PKWARECrypt(password)
+        h = _crypt.decrypt(encryption_header)
+        if self.general_purpose_bit_flag & 0x8:
+            # compare against the file type from extended local headers
+            check_byte = (self.last_mod_dos_datetime[0] >> 8) & 0xff
+        else:
+            # compare against the CRC otherwise
+            check_byte = (self.crc32 >> 24) & 0xff
+        if ord(h[-1]) != check_byte:
+            raise crypt.BadPassword("Bad password for file", self.filename)
+        return _crypt
+
+    def _openDecrypter(self, encryption_header, password):
+        '''
+        returns a decrypter with incremental `decrypt(chunk)` for data following
+        `encryption_header`, see `_cryptLengths`
+        '''
+        if not password:
+            raise RuntimeError("password required for extraction", self.filename)
+
+        aes_extra = self.extra.getExtra(ZipExtra.AES)
+        if aes_extra:
+            return crypt.AESCrypt(password).decrypter(encryption_header, aes_extra.encrypt_strength)
+        return self._pkwareCrypt(encryption_header, password)
+
+    def _cryptLengths(self):
+        '''
+        (encryption header length, authentication code length) around encrypted data
+        '''
+        if not self.is_encrypted:
+            return 0, 0
+        aes_extra = self.extra.getExtra(ZipExtra.AES)
+        if aes_extra:
+            return crypt.AESCrypt.headerLength(aes_extra.encrypt_strength), crypt.AESCrypt.AUTH_CODE_LEN
+        return crypt.PKWARECrypt.ENCRYPTION_HEADER_LENGTH, 0
+
+    def readLocalHeader(self, stream=None):
+        stream = stream or self.stream
+        stream.seek(self.dir_header.relative_offset_file_header, os.SEEK_SET)
+        return struct_local_file_header.parseStream(stream)
+
+    def dataOffset(self, stream=None):
+        '''
+        offset of the data behind the local file header, which is parsed (and
+        checked if check_local_header is set) only on the first call
+        '''
+        if self.data_offset is None:
+            stream = stream or self.stream
+            file_header = self.readLocalHeader(stream)
+            if self.check_local_header:
+                mismatched = self.checkLocalHeader(file_header)
+                if mismatched:
+                    raise BadZipfile('local file header mismatch: ' + ', '.join(mismatched), self.filename)
+            self.local_csize = localSizes(file_header)[0]
+            self.data_offset = stream.tell()
+        return self.data_offset
+
+    def setFixedLocalHeader(self, data):
+        '''
+        resolve the data offset from the fixed part of the local file header
+        without parsing filename and extra field, see LOCAL_FIXED_HEADER
+        '''
+        fields = LOCAL_FIXED_HEADER.unpack(data)
+        if fields[0] != Signature.FILE_HEADER:
+            raise BadZipfile('bad local file header signature', self.filename)
+        self.local_csize = fields[7]
+        self.data_offset = self.dir_header.relative_offset_file_header + LOCAL_FIXED_HEADER.size + fields[9] + fields[10]
+
+    def checkLocalHeader(self, file_header):
+        '''
+        compare local file header against central directory header, returns names
+        of the mismatched fields
+        '''
+        fields = ['version_needed_to_extract', 'general_purpose_bit_flag', 'compression_method']
+        mismatched = [f for f in fields if getattr(file_header, f) != getattr(self.dir_header, f)]
+        if file_header.filename != self.orig_filename:
+            mismatched.append('filename')
+
+        # sizes and crc32 are in the data descriptor when bit 3 is set
+        if not file_header.general_purpose_bit_flag & 0x8:
+            csize, ucsize = localSizes(file_header)
+            if file_header.crc32 != self.dir_header.crc32:
+                mismatched.append('crc32')
+            if csize != self.dir_header.csize:
+                mismatched.append('csize')
+            if ucsize != self.dir_header.ucsize:
+                mismatched.append('ucsize')
+        return mismatched
+
+    def iterContent(self, password=None, stream=None, chunk_size=None):
+        '''
+        yields the content in chunks, streamed through decrypt and decompress.
+        crc32 and AES authentication code are checked after the last chunk.
+        the stream is re-positioned for every chunk, so it can be shared.
+        '''
+        if password == None:
+            password = self.password
+        stream = stream or self.stream
+        chunk_size = chunk_size or self.CHUNK_SIZE
+        # checked against the central directory before any read
+        budget = self.limits.budget(self) if self.limits is not None else None
+
+        position = self.dataOffset(stream)
+        csize = self.dir_header.csize or self.local_csize
+        header_length, trailer_length = self._cryptLengths()
+        # seconds and bytes of the phases of read(), added to stats once per
+        # entry, also when the consumer stops early. without stats nothing is
+        # timed at all
+        stats = self.stats
+        spent = {'_decrypt': [0.0, 0], '_decompress': [0.0, 0], 'checkCRC': [0.0, 0]}
+        decrypter = None
+        if self.is_encrypted:
+            stream.seek(position, os.SEEK_SET)
+            encryption_header = stream.read(header_length)
+            start = time.time() if stats is not None else 0
+            decrypter = self._openDecrypter(encryption_header, password)
+            if stats is not None:
+                spent['_decrypt'][0] += time.time() - start
+            position += header_length
+        remain = csize - header_length - trailer_length
+        decompressor = self.compressor.decompressobj()
+        crc = 0
+        ucsize = 0
+        try:
+            while remain > 0:
+                stream.seek(position, os.SEEK_SET)
+                data = stream.read(min(chunk_size, remain))
+                if not data:
+                    raise BadZipfile('unexpected end of file', self.filename)
+                position += len(data)
+                remain -= len(data)
+                if stats is None:
+                    if decrypter:
+                        data = decrypter.decrypt(data)
+                    for data in inflate(decompressor, data, chunk_size, budget):
+                        crc = zlib.crc32(data, crc)
+                        ucsize += len(data)
+                        yield data
+                    continue
+
+                if decrypter:
+                    start = time.time()
+                    data = decrypter.decrypt(data)
+                    spent['_decrypt'][0] += time.time() - start
+                    spent['_decrypt'][1] += len(data)
+                pieces = inflate(decompressor, data, chunk_size, budget)
+                while True:
+                    start = time.time()
+                    data = next(pieces, None)
+                    spent['_decompress'][0] += time.time() - start
+                    if data is None:
+                        break
+                    spent['_decompress'][1] += len(data)
+                    crc = self._updateCRC(data, crc, spent)
+                    ucsize += len(data)
+                    yield data
+
+            start = time.time() if stats is not None else 0
+            data = decompressor.flush()
+            if stats is not None:
+                spent['_decompress'][0] += time.time() - start
+                spent['_decompress'][1] += len(data)
+            if data:
+                if budget is not None:
+                    budget.add(len(data), 0, 0)
+                crc = self._updateCRC(data, crc, spent) if stats is not None else zlib.crc32(data, crc)
+                ucsize += len(data)
+                yield data
+
+            if trailer_length:
+                stream.seek(position, os.SEEK_SET)
+                start = time.time() if stats is not None else 0
+                decrypter.verify(stream.read(trailer_length))
+                if stats is not None:
+                    spent['_decrypt'][0] += time.time() - start
+            if self.crc32 != 0 and self.crc32 != crc & 0xffffffff:
+                raise BadZipfile('crc32 check failed')
+        finally:
+            if stats is not None:
+                for phase, (seconds, nbytes) in spent.iteritems():
+                    if phase != '_decrypt' or decrypter:
+                        stats.add(phase, seconds, nbytes)
+        if stats is not None:
+            stats.emit('read', self, ucsize=ucsize, csize=csize)
+
+    def _updateCRC(self, data, crc, spent):
+        start = time.time()
+        crc = zlib.crc32(data, crc)
+        spent['checkCRC'][0] += time.time() - start
+        spent['checkCRC'][1] += len(data)
+        return crc
+
+    @timed('_encrypt')
     def _encrypt(self, data, password=None, crc32=None):
         if password == None:
             password = self.password
 
         if password:
-            if self.cryption and self.cryption.startswith('AES'):
-                return crypt.AESCrypt(password).encrypt(data, self.cryption)
-            else:
-                # normal zip cryption
-                _crypt = crypt.PKWARECrypt(password)
-                encryption_header = crypt.random_salt(crypt.PKWARECrypt.ENCRYPTION_HEADER_LENGTH - 1)
-                encryption_header += chr((crc32 >> 24) & 0xff)
-                encryption_header = _crypt.encrypt(encryption_header)
-                return encryption_header + _crypt.encrypt(data)
+            encryption_header, encrypter = self._encrypter(password, crc32)
+            return encryption_header + encrypter.encrypt(data) + encrypter.authenticationCode()
         else:
             return data
 
+    def _encrypter(self, password, crc32):
+        '''
+        (encryption header, encrypter) of data whose content has crc32, the
+        encrypter has incremental `encrypt(chunk)` and `authenticationCode()`
+        for behind the data
+        '''
+        if self.cryption and self.cryption.startswith('AES'):
+            return crypt.AESCrypt(password).encrypter(self.cryption)
+        # normal zip cryption
+        _crypt = crypt.PKWARECrypt(password)
+        encryption_header = crypt.random_salt(crypt.PKWARECrypt.ENCRYPTION_HEADER_LENGTH - 1)
+        encryption_header += chr((crc32 >> 24) & 0xff)
+        return _crypt.encrypt(encryption_header), _crypt
+
     @property
     def compressor(self):
-        return Compressor(self.compression_method)
+        return Compressor(self.compression_method, self.compression_level)
 
+    @timed('_compress')
     def _compress(self, data):
         return self.compressor.compress(data)
 
+    @timed('_decompress')
     def _decompress(self, data):
         return self.compressor.decompress(data)
 
 
-class ZipExtra:
-
-    AES = Signature.EXTRA_AES
-    UPEF = Signature.EXTRA_UPEF  # Unicode Path Extra Field
-    ZIP64 = Signature.EXTRA_ZIP64
-
-    @property
-    def structs(self):
-        return {
-            self.AES: struct_extra_aes,
-            self.UPEF: struct_extra_upef,
-            self.ZIP64: struct_extra_zip64,
-        }
-
-    def __init__(self, bytes):
-        self.parsed_extra = {}
-        self.all_extra = {}
-
-        self.bytes = bytes
-        self.stream = StringIO(bytes)
-        self.parse()
-
-    def parse(self):
-        length = len(self.bytes)
-        last_tell = self.stream.tell()
-        while last_tell < length:
-            extra = struct_extra_header.parseStream(self.stream)
-            self.all_extra[extra.signature] = extra
-            struct_detail = self.structs.get(extra.signature)
-            if struct_detail:
-                self.stream.seek(last_tell)
-                self.parsed_extra[extra.signature] = struct_detail.parseStream(self.stream)
-            else:
-                self.stream.seek(last_tell + extra.size() + extra.data_length)
-            last_tell = self.stream.tell()
-
-    def getExtra(self, signature):
-        return self.parsed_extra.get(signature)
-
-    def pack(self):
-        content = ''
-        for _, extra in self.parsed_extra.iteritems():
-            content += extra.pack()
-        return content
-
-    def __repr__(self):
-        out = ['ZipExtra:']
-        for _, extra in self.parsed_extra.iteritems():
-            lines = extra.__repr__().split('\n')
-            out += [' ' * 4 + line for line in lines]
+class EntryEncoder(object):
+    '''
+    ZipInfo.prepare for content coming in chunks: write compresses every chunk
+    into a spool file as it comes, close encrypts the compressed data into a
+    second one (the PKWARE encryption header holds a byte of the crc32 of the
+    whole content) and returns it as the entry data for ZipInfo.commit.
+    spools stay in memory up to spool_size bytes.
+    '''
+
+    def __init__(self, zipinfo, filename, date_time, spool_size):
+        self.zipinfo = zipinfo
+        self.stats = zipinfo.stats
+        self.spool_size = spool_size
+        self._pack_vals = zipinfo._packVals(filename, False, date_time)
+        self._compressobj = zipinfo.compressor.compressobj()
+        self._spool = self._newSpool()
+        self._crc32 = 0
+        self._ucsize = 0
+
+    def _newSpool(self):
+        # imported by writers only, readers do without
+        import tempfile
+        return tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+
+    def write(self, chunk):
+        if type(chunk) == unicode:
+            chunk = chunk.encode('utf8')
+        self._crc32 = zlib.crc32(chunk, self._crc32)
+        self._ucsize += len(chunk)
+        self._spool.write(self._compress(chunk))
+
+    def close(self):
+        '''
+        returns the entry data, a file at its start which the caller closes
+        '''
+        compressed, self._spool = self._spool, None
+        compressed.write(self._compress(None))
+        packVals = self._pack_vals
+        packVals.crc32 = self._crc32 & 0xffffffff
+        packVals.ucsize = self._ucsize
+        data = compressed
+        if self.zipinfo.password:
+            compressed.seek(0, os.SEEK_SET)
+            data = self._newSpool()
+            try:
+                self._encrypt(compressed, data, packVals.crc32)
+            except BaseException:
+                data.close()
+                raise
+            finally:
+                compressed.close()
+        packVals.csize = data.tell()
+        data.seek(0, os.SEEK_SET)
+        self.zipinfo._pack_vals = packVals
+        return data
+
+    def abort(self):
+        '''
+        drop the data written so far
+        '''
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+    @timed('_compress')
+    def _compress(self, chunk):
+        if chunk is None:
+            return self._compressobj.flush()
+        return self._compressobj.compress(chunk)
+
+    @timed('_encrypt', size=lambda self, result: result)
+    def _encrypt(self, compressed, out, crc32):
+        '''
+        encrypt the file compressed into out, returns the bytes written
+        '''
+        zipinfo = self.zipinfo
+        encryption_header, encrypter = zipinfo._encrypter(zipinfo.password, crc32)
+        out.write(encryption_header)
+        while True:
+            chunk = compressed.read(zipinfo.CHUNK_SIZE)
+            if not chunk:
+                break
+            out.write(encrypter.encrypt(chunk))
+        out.write(encrypter.authenticationCode())
+        return out.tell()
 
-        return '\n'.join(out)
@@ -3,15 +3,28 @@
 Read and write ZIP files.
 """
 import os
+import re
+import sys
 import stat
 import zlib
+import struct
 import time
+import Queue
+import itertools
+import threading
 
 from util import DictObject, BadZipfile, expect
+from util.cache import LRUCache
 from util.compress import Compressor
 from util.crypt import Crypt
-from zipextra import ZipExtra
-from zipinfo import ZipInfo
+from util.stats import makeStats, timed
+from util.stream import WindowStream, BufferedWriter
+from util.bytesource import ByteSource, ByteSourceStream
+from util.fastcopy import copyRange, preallocate
+from zipextfile import ZipExtFile, SeekableZipExtFile
+from nameindex import NameIndex, translate
+from zipextra import ZipExtra, dropExtra
+from zipinfo import ZipInfo, EntryEncoder, LOCAL_FIXED_HEADER, CENTRAL_FIXED_HEADER
 
 from struct_def import *
 
@@ -21,13 +34,46 @@ ZIP_MAX_COMMENT = (1 << 16) - 1
 
 
 class ZipReader(object):
+    # read_many: holes up to READ_MANY_GAP bytes are read through instead of
+    # seeking over them, and a coalesced read is split at READ_MANY_MAX bytes
+    READ_MANY_GAP = 1 << 16
+    READ_MANY_MAX = 1 << 24
+    # output files extractall keeps open at once
+    EXTRACT_MAX_OPEN = 64
+    # search: lines are put together across chunks up to this many bytes
+    SEARCH_MAX_LINE = 1 << 20
 
-    def __init__(self, file, password=None):
+    def __init__(self, file, password=None, stats=None, cache_bytes=0, check_local_header=False,
+                 recover=False, limits=None):
+        '''
+        stats: True or an util.stats.Stats instance, enables per-phase
+               timers and per-entry hooks
+        cache_bytes: budget of the LRU cache of decompressed entries behind
+               read() and open(), see `self.cache.asDict()` for its statistics
+        check_local_header: compare every local file header against the central
+               directory, once, when the data offset of the entry is resolved
+        recover: ignore the central directory and rebuild it from the local file
+               headers, for truncated uploads and damaged archives. entries cut
+               off or without a readable end are left out, see ziprecover.py.
+               `ZipWriter.copy_from` of such a reader writes the repaired archive
+        limits: an util.limits.Limits, entry count, sizes, compression ratio and
+               decode time allowed for untrusted archives
+
+        file is a path, a seekable file object or an util.bytesource.ByteSource,
+        e.g. BlockCache(HTTPByteSource(url), read_ahead=4) for remote archives
+        '''
         self.file = file
         self.password = password
+        self.check_local_header = check_local_header
+        self.limits = limits
+        self.stats = makeStats(stats)
+        self.cache = LRUCache(cache_bytes) if cache_bytes else None
         if isinstance(file, basestring):
             self.stream = open(file, 'rb')
             self.filename = file
+        elif isinstance(file, ByteSource):
+            self.stream = ByteSourceStream(file)
+            self.filename = file.name
         else:
             self.stream = file
             self.filename = getattr(file, 'name', None)
@@ -40,7 +86,21 @@ class ZipReader(object):
 
         self._fileInfos = []
         self._fileInfosDict = {}
-        self._parse()
+        self._entry_ends = None
+        self._name_index = None
+        # central directory headers rebuilt by recover
+        self._raw_headers = None
+        # the tail read while searching the end of central directory record
+        self._tail = None
+        # serializes worker threads which share self.stream
+        self._lock = threading.Lock()
+        # {cache key: threading.Event} of the entries being read into the cache
+        self._loading = {}
+        self._loading_lock = threading.Lock()
+        if recover:
+            self._recover()
+        else:
+            self._parse()
 
     def _parse(self):
         stream = self.stream
@@ -57,6 +117,7 @@ class ZipReader(object):
         if end_central_dir_offset == -1:
             raise BadZipfile("File is not a Zip archive")
 
+        self._tail = WindowStream(footer, self.size - len(footer))
         stream.seek(stream.tell() - len(footer) + end_central_dir_offset)
         end_central_dir = struct_end_central_dir_record.parseStream(stream)
         self.end_central_dir = end_central_dir
@@ -64,9 +125,12 @@ class ZipReader(object):
         if self.is_zip64:
             self._parseZip64()
         self.zipfile_comment = end_central_dir.zipfile_comment
+        if self.limits is not None:
+            self.limits.checkEntries(end_central_dir.total_entries_central_dir)
 
         if end_central_dir.size_central_dir > 0:
             self._parseCentralDirectoryHeader()
+        self._tail = None
 
     def _parseZip64(self):
         # parse zip64 end of central directory locator
@@ -100,28 +164,91 @@ class ZipReader(object):
                     return True
         return False
 
+    @timed('_parseCentralDirectoryHeader', lambda self, result: self.end_central_dir.size_central_dir)
     def _parseCentralDirectoryHeader(self):
-        stream = self.stream
+        # parse from a single read of the whole central directory, or from the
+        # tail when it is in there already: one request for remote sources
+        offset = self.end_central_dir.offset_start_central_dir
+        size = self.end_central_dir.size_central_dir
+        tail = self._tail
+        if tail.offset <= offset and offset + size <= tail.offset + len(tail.data):
+            window = tail
+        else:
+            self.stream.seek(offset, os.SEEK_SET)
+            window = WindowStream(self.stream.read(size), offset)
+        window.seek(offset, os.SEEK_SET)
 
         index = 0
-        offset = self.end_central_dir.offset_start_central_dir
         while index < self.end_central_dir.total_entries_central_dir:
-            stream.seek(offset, os.SEEK_SET)
-
-            zinfo = ZipInfo(stream, password=self.password)
-            zinfo.readHeader()
+            zinfo = ZipInfo(self.stream, password=self.password)
+            zinfo.stats = self.stats
+            zinfo.check_local_header = self.check_local_header
+            zinfo.limits = self.limits
+            zinfo.readHeader(window)
+            if self.stats is not None:
+                self.stats.emit('header', zinfo)
             self._fileInfos.append(zinfo)
             self._fileInfosDict[zinfo.filename] = zinfo
-
-            offset = stream.tell()
             index += 1
 
+    @timed('_recover', lambda self, result: self.size)
+    def _recover(self):
+        from ziprecover import mapStream, scanEntries
+        data = mapStream(self.stream)
+        headers = []
+        ends = {}
+        try:
+            for zinfo, header, end in scanEntries(data, self.stream, self.password):
+                zinfo.stats = self.stats
+                zinfo.check_local_header = self.check_local_header
+                zinfo.limits = self.limits
+                if self.limits is not None:
+                    self.limits.checkEntries(len(self._fileInfos) + 1)
+                if self.stats is not None:
+                    self.stats.emit('header', zinfo)
+                self._fileInfos.append(zinfo)
+                self._fileInfosDict[zinfo.filename] = zinfo
+                headers.append(header)
+                ends[zinfo.relative_offset_file_header] = end
+        finally:
+            if not isinstance(data, str):
+                data.close()
+        self._raw_headers = headers
+        self._entry_ends = ends
+        self.end_central_dir = DictObject({
+            'total_entries_central_dir': len(headers),
+            'size_central_dir': sum(len(header) for header in headers),
+            'offset_start_central_dir': max(ends.values()) if ends else 0,
+            'zipfile_comment': '',
+        })
+
     def infolist(self):
         return self._fileInfos
 
     def namelist(self):
         return [f.filename for f in self._fileInfos]
 
+    @property
+    def nameindex(self):
+        '''
+        NameIndex of the entry names, built on first use
+        '''
+        if self._name_index is None:
+            self._name_index = NameIndex(self._fileInfosDict)
+        return self._name_index
+
+    def listdir(self, path=''):
+        return self.nameindex.listdir(path)
+
+    def walk(self, top=''):
+        return self.nameindex.walk(top)
+
+    def glob(self, pattern):
+        return self.nameindex.glob(pattern)
+
+    def exists(self, name):
+        return self.nameindex.exists(name)
+
     def getinfo(self, name):
         """Return the instance of ZipInfo given 'name'."""
         info = self._fileInfosDict.get(name)
@@ -141,57 +268,761 @@ class ZipReader(object):
         if isinstance(self.file, basestring):
             self.stream.close()
 
-    def open(self):
-        pass
+    def resolveOffsets(self):
+        '''
+        resolve the data offsets of all entries in one pass over the sorted local
+        file header offsets, later reads go straight to the data
+        '''
+        stream = self.stream
+        with self._lock:
+            for zinfo in sorted(self._fileInfos, key=lambda zinfo: zinfo.relative_offset_file_header):
+                if zinfo.data_offset is not None:
+                    continue
+                if self.check_local_header:
+                    zinfo.dataOffset(stream)
+                else:
+                    stream.seek(zinfo.relative_offset_file_header, os.SEEK_SET)
+                    zinfo.setFixedLocalHeader(stream.read(LOCAL_FIXED_HEADER.size))
+
+    def export_index(self, path):
+        '''
+        write the entry index to path for SharedIndex, see sharedindex.py
+        '''
+        from sharedindex import exportIndex
+        exportIndex(self, path)
+
+    def open(self, item, password=None, seekable=False, span=None, checkpoint_bytes=None):
+        '''
+        returns a ZipExtFile, which streams the content of item.
+        seekable: return a SeekableZipExtFile instead, which bypasses the cache,
+            span and checkpoint_bytes tune its checkpoint index
+        '''
+        if not password:
+            password = self.password
+
+        zinfo = self._getItem(item)
+        if self.limits is not None:
+            # now rather than at the first read of the returned file
+            self.limits.checkEntry(zinfo)
+        if seekable:
+            return SeekableZipExtFile(zinfo, self.stream, password, span=span, checkpoint_bytes=checkpoint_bytes)
+        if self.cache is not None:
+            key = self._cacheKey(zinfo, password)
+            content = self.cache.get(key)
+            if content is None:
+                # another thread reading it into the cache is waited for
+                with self._loading_lock:
+                    loading = self._loading.get(key)
+                if loading is not None:
+                    loading.wait()
+                    content = self.cache.get(key)
+            if content is not None:
+                return ZipExtFile([content], zinfo)
+            if self.cache.admits(zinfo.ucsize):
+                return ZipExtFile(self._cacheChunks(key, self._iterEntry(zinfo, password)), zinfo)
+        return ZipExtFile(self._iterEntry(zinfo, password), zinfo)
 
     def read(self, item, password=None):
         if not password:
             password = self.password
 
+        zinfo = self._getItem(item)
+        if self.cache is None:
+            return zinfo.read(password=password)
+
+        key = self._cacheKey(zinfo, password)
+        content = self.cache.get(key)
+        if content is None:
+            if not self.cache.admits(zinfo.ucsize):
+                return self._readEntry(zinfo, password)
+            content = self._loadEntry(key, zinfo, password)
+        return content
+
+    def _loadEntry(self, key, zinfo, password):
+        '''
+        read zinfo into the cache, threads missing key meanwhile wait for the
+        one reading it instead of decoding it as well
+        '''
+        while True:
+            with self._loading_lock:
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            loading.wait()
+            content = self.cache.get(key)
+            if content is not None:
+                return content
+        try:
+            # it may have been read since the miss
+            content = self.cache.peek(key)
+            if content is None:
+                content = self._readEntry(zinfo, password)
+                self.cache.put(key, content)
+        finally:
+            with self._loading_lock:
+                del self._loading[key]
+            loading.set()
+        return content
+
+    def _readEntry(self, zinfo, password):
+        '''
+        content of zinfo, read on a private stream or under the lock on the
+        shared one, so any number of threads can read at once
+        '''
+        stream = self._openWorkerStream()
+        if stream is self.stream:
+            with self._lock:
+                return zinfo.read(password=password, stream=stream)
+        try:
+            return zinfo.read(password=password, stream=stream)
+        finally:
+            stream.close()
+
+    def _iterEntry(self, zinfo, password):
+        '''
+        `_readEntry` in chunks: iterContent on a private stream, or on the
+        shared one taking the lock for every chunk, which it seeks to itself
+        '''
+        stream = self._openWorkerStream()
+        chunks = zinfo.iterContent(password=password, stream=stream)
+        if stream is self.stream:
+            while True:
+                with self._lock:
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+        try:
+            for chunk in chunks:
+                yield chunk
+        finally:
+            stream.close()
+
+    def _cacheKey(self, zinfo, password):
+        return zinfo.relative_offset_file_header, password
+
+    def _cacheChunks(self, key, chunks):
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        self.cache.put(key, ''.join(parts))
+
+    def _getItem(self, item):
         if isinstance(item, basestring):
             if item not in self._fileInfosDict:
                 raise IOError('file not found', item)
-            item = self._fileInfosDict[item]
+            return self._fileInfosDict[item]
+        return item
+
+    def rawHeaders(self):
+        '''
+        [(zinfo, raw central directory header)] in central directory order
+        '''
+        if self._raw_headers is not None:
+            return zip(self._fileInfos, self._raw_headers)
+        offset = self.end_central_dir.offset_start_central_dir
+        with self._lock:
+            self.stream.seek(offset, os.SEEK_SET)
+            central_dir = self.stream.read(self.end_central_dir.size_central_dir)
+        headers = []
+        start = 0
+        for zinfo in self._fileInfos:
+            fields = CENTRAL_FIXED_HEADER.unpack_from(central_dir, start)
+            end = start + CENTRAL_FIXED_HEADER.size + fields[10] + fields[11] + fields[12]
+            headers.append((zinfo, central_dir[start:end]))
+            start = end
+        return headers
+
+    def _entryEnds(self):
+        '''
+        {relative_offset_file_header: end} of every entry, the end is the start of
+        the following entry or of the central directory, so it covers local header,
+        data and data descriptor.
+        '''
+        if self._entry_ends is None:
+            offsets = sorted(set(zinfo.relative_offset_file_header for zinfo in self._fileInfos))
+            ends = offsets[1:] + [self.end_central_dir.offset_start_central_dir]
+            self._entry_ends = dict(zip(offsets, ends))
+        return self._entry_ends
+
+    def _planReads(self, infos, gap, max_read):
+        '''
+        merges the byte ranges of infos into [(start, end, infos)] reads
+        '''
+        ends = self._entryEnds()
+        reads = []
+        unique = dict((id(zinfo), zinfo) for zinfo in infos).values()
+        for zinfo in sorted(unique, key=lambda zinfo: zinfo.relative_offset_file_header):
+            start = zinfo.relative_offset_file_header
+            end = ends[start]
+            if reads and start - reads[-1][1] <= gap and end - reads[-1][0] <= max_read:
+                reads[-1][1] = max(reads[-1][1], end)
+                reads[-1][2].append(zinfo)
+            else:
+                reads.append([start, end, [zinfo]])
+        return reads
 
-        return item.read(password=password)
+    def read_many(self, items, password=None, order='request', gap=None, max_read=None):
+        '''
+        yields (item, content) of items, reading neighboring entries with a few
+        large reads.
+        order: 'request' yields in the order of items, 'offset' in file order
+        gap, max_read: see READ_MANY_GAP and READ_MANY_MAX
+        '''
+        if not password:
+            password = self.password
+        if order not in ('request', 'offset'):
+            raise ValueError('order must be `request` or `offset`', order)
+        gap = self.READ_MANY_GAP if gap is None else gap
+        max_read = self.READ_MANY_MAX if max_read is None else max_read
+
+        items = list(items)
+        infos = [self._getItem(item) for item in items]
+        if self.limits is not None:
+            # before any window is read
+            for zinfo in infos:
+                self.limits.checkEntry(zinfo)
+        reads = self._planReads(infos, gap, max_read)
+
+        if order == 'offset':
+            items_by_info = {}
+            for item, zinfo in zip(items, infos):
+                items_by_info.setdefault(id(zinfo), []).append(item)
+            for start, end, read_infos in reads:
+                window = self._readWindow(start, end)
+                for zinfo in read_infos:
+                    for item in items_by_info.pop(id(zinfo), []):
+                        yield item, zinfo.read(password=password, stream=window)
+            return
+
+        # request order: keep a window until all of its entries have been yielded
+        read_of_info = {}
+        pending = []
+        for index, (start, end, read_infos) in enumerate(reads):
+            pending.append(0)
+            for zinfo in read_infos:
+                read_of_info[id(zinfo)] = index
+        for zinfo in infos:
+            pending[read_of_info[id(zinfo)]] += 1
+
+        windows = {}
+        for item, zinfo in zip(items, infos):
+            index = read_of_info[id(zinfo)]
+            if index not in windows:
+                start, end, _ = reads[index]
+                windows[index] = self._readWindow(start, end)
+            content = zinfo.read(password=password, stream=windows[index])
+            pending[index] -= 1
+            if not pending[index]:
+                del windows[index]
+            yield item, content
+
+    def _readWindow(self, start, end, stream=None):
+        if stream is None or stream is self.stream:
+            with self._lock:
+                self.stream.seek(start, os.SEEK_SET)
+                return WindowStream(self.stream.read(end - start), start)
+        stream.seek(start, os.SEEK_SET)
+        return WindowStream(stream.read(end - start), start)
+
+    def iter_entries(self, prefetch=8, decode_depth=4, password=None):
+        '''
+        yields (zinfo, content) of all entries in file order. an I/O thread reads
+        the compressed entries ahead into a queue of `prefetch` buffers, a decode
+        thread decrypts, decompresses and checks them into a queue of
+        `decode_depth` results. full queues hold back the stage in front of them.
+        '''
+        if not password:
+            password = self.password
+        infos = sorted(self._fileInfos, key=lambda zinfo: zinfo.relative_offset_file_header)
+        ends = self._entryEnds()
+        raw_queue = Queue.Queue(maxsize=max(prefetch, 1))
+        out_queue = Queue.Queue(maxsize=max(decode_depth, 1))
+        stop = threading.Event()
+        end = object()
+
+        def put(queue, item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Queue.Full:
+                    pass
+            return False
+
+        def readAhead():
+            stream = self._openWorkerStream()
+            try:
+                for zinfo in infos:
+                    if self.limits is not None:
+                        # before its compressed bytes are read
+                        self.limits.checkEntry(zinfo)
+                    start = zinfo.relative_offset_file_header
+                    if not put(raw_queue, (zinfo, self._readWindow(start, ends[start], stream))):
+                        return
+                put(raw_queue, end)
+            except BaseException:
+                put(raw_queue, (None, sys.exc_info()))
+            finally:
+                if stream is not self.stream:
+                    stream.close()
+
+        def decode():
+            while not stop.is_set():
+                item = raw_queue.get()
+                if item is end or item[0] is None:
+                    put(out_queue, item)
+                    return
+                zinfo, window = item
+                try:
+                    item = zinfo, zinfo.read(password=password, stream=window)
+                except BaseException:
+                    item = None, sys.exc_info()
+                if not put(out_queue, item) or item[0] is None:
+                    return
+
+        threads = [threading.Thread(target=readAhead), threading.Thread(target=decode)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            while True:
+                item = out_queue.get()
+                if item is end:
+                    return
+                zinfo, content = item
+                if zinfo is None:
+                    raise content[0], content[1], content[2]
+                yield zinfo, content
+        finally:
+            stop.set()
+            # unblock the decode thread waiting for the I/O thread
+            try:
+                raw_queue.put_nowait(end)
+            except Queue.Full:
+                pass
+            for thread in threads:
+                thread.join()
+
+    def extract(self, member, path=None, password=None):
+        '''
+        extract member into directory path (default: the current one),
+        returns the path of the extracted file
+        '''
+        return self.extractall(path, [member], password=password)[0]
+
+    def extractall(self, path=None, members=None, password=None, workers=1, max_open=None):
+        '''
+        extract members (default: all) into directory path, returns their paths.
+        entries are written in archive order on `workers` threads, with at most
+        max_open output files open. stored unencrypted entries are copied by
+        the kernel (copy_file_range / sendfile) without passing through python,
+        so their crc32 is not checked, see testzip. mtimes are restored once
+        everything is written.
+        '''
+        if not password:
+            password = self.password
+        root = path or os.getcwd()
+        if members is None:
+            infos = list(self._fileInfos)
+            dirnames = [dirpath for dirpath, _, _ in self.nameindex.walk()]
+        else:
+            infos = [self._getItem(member) for member in members]
+            dirnames = set([''])
+            for zinfo in infos:
+                parts = zinfo.filename.split('/')
+                dirnames.update('/'.join(parts[:index]) + '/' for index in range(1, len(parts)))
+            # parents sort before their children
+            dirnames = sorted(dirnames)
+        if self.limits is not None:
+            # the whole extraction is checked against the central directory
+            # before anything is written
+            for zinfo in infos:
+                self.limits.checkEntry(zinfo)
+            self.limits.checkTotal(sum(zinfo.ucsize for zinfo in infos))
+
+        # every directory is created once, before any file
+        for dirname in dirnames:
+            target = self._targetPath(root, dirname)
+            if not os.path.isdir(target):
+                os.makedirs(target)
+
+        self.resolveOffsets()
+        files = sorted((zinfo for zinfo in infos if not zinfo.filename.endswith('/')),
+                       key=lambda zinfo: zinfo.data_offset)
+        slots = threading.BoundedSemaphore(max_open or self.EXTRACT_MAX_OPEN)
+        self._mapEntries(lambda zinfo, stream: self._extractEntry(zinfo, stream, root, password, slots),
+                         files, workers)
+
+        # files first, then directory entries from the deepest up, so creating
+        # their children does not touch the restored mtimes again
+        dirs = sorted((zinfo for zinfo in infos if zinfo.filename.endswith('/')),
+                      key=lambda zinfo: -zinfo.filename.count('/'))
+        for zinfo in files + dirs:
+            try:
+                mtime = time.mktime(zinfo.date_time + (0, 0, -1))
+            except (OverflowError, ValueError):
+                continue
+            os.utime(self._targetPath(root, zinfo.filename), (mtime, mtime))
+        return [self._targetPath(root, zinfo.filename) for zinfo in infos]
+
+    def _targetPath(self, root, name):
+        '''
+        path of entry name under root, without drive, absolute or `..` parts
+        '''
+        parts = [os.path.splitdrive(part)[1] for part in name.replace('\\', '/').split('/')]
+        return os.path.join(root, *[part for part in parts if part not in ('', '.', '..')])
+
+    def _extractEntry(self, zinfo, stream, root, password, slots):
+        if self.limits is not None:
+            # before the output file is created and preallocated
+            self.limits.checkEntry(zinfo)
+        with slots:
+            with open(self._targetPath(root, zinfo.filename), 'wb') as out:
+                preallocate(out.fileno(), zinfo.ucsize)
+                try:
+                    src_fd = stream.fileno()
+                except (AttributeError, IOError, ValueError):
+                    src_fd = None
+                if src_fd is not None and not zinfo.is_encrypted and \
+                        zinfo.compression_method == Compressor.ZIP_STORE:
+                    if self.limits is not None:
+                        size = zinfo.csize or zinfo.local_csize
+                        self.limits.budget(zinfo).add(size, size, 0)
+                    copyRange(src_fd, zinfo.dataOffset(stream), out.fileno(), zinfo.csize or zinfo.local_csize)
+                else:
+                    for chunk in zinfo.iterContent(password=password, stream=stream):
+                        out.write(chunk)
+
+    def search(self, pattern, members=None, workers=1, max_count=None, password=None):
+        '''
+        grep the entries (default: all, else those matching the glob pattern or
+        patterns members) for the regex pattern, a string compiled with
+        re.MULTILINE or a compiled regex. entries are streamed through decrypt
+        and decompress on `workers` threads, nothing is extracted.
+
+        returns [DictObject] of filename, offset (of the first match in the
+        content of the entry), line_number and line for every matching line, in
+        central directory order. the search stops when max_count lines are found.
+        the pattern is meant to match within a line, see `_grepChunks`.
+        '''
+        if not password:
+            password = self.password
+        if isinstance(pattern, basestring):
+            if isinstance(pattern, unicode):
+                pattern = pattern.encode('utf8')
+            pattern = re.compile(pattern, re.MULTILINE)
+        infos = [zinfo for zinfo in self._fileInfos if not zinfo.filename.endswith('/')]
+        if members is not None:
+            if isinstance(members, basestring):
+                members = [members]
+            names = set(name for member in members for name in self.glob(member))
+            infos = [zinfo for zinfo in infos if zinfo.filename in names]
+
+        # entries before done[0] are searched and have done[1] matches, entries
+        # behind them are skipped once that is max_count
+        counts = [None] * len(infos)
+        done = [0, 0]
+        lock = threading.Lock()
+
+        def enough(index):
+            return max_count is not None and done[1] >= max_count and done[0] <= index
+
+        def search(item, stream):
+            index, zinfo = item
+            matches = []
+            if not enough(index):
+                chunks = zinfo.iterContent(password=password, stream=stream)
+                for offset, line_number, line in _grepChunks(chunks, pattern, self.SEARCH_MAX_LINE):
+                    matches.append(DictObject({
+                        'filename': zinfo.filename,
+                        'offset': offset,
+                        'line_number': line_number,
+                        'line': line,
+                    }))
+                    if max_count is not None and (len(matches) >= max_count or enough(index)):
+                        break
+            with lock:
+                counts[index] = len(matches)
+                while done[0] < len(counts) and counts[done[0]] is not None:
+                    done[1] += counts[done[0]]
+                    done[0] += 1
+            return matches
+
+        results = [match for matches in self._mapEntries(search, enumerate(infos), workers) for match in matches]
+        return results if max_count is None else results[:max_count]
+
+    def testzip(self, workers=1, password=None):
+        '''
+        stream every entry through decrypt, decompress and crc32 without keeping
+        the content, and compare local file headers against the central directory.
+        returns a report (DictObject of filename, error, fields, exception) for
+        every bad entry, an empty list when the archive is fine.
+        '''
+        if not password:
+            password = self.password
+
+        def test(zinfo, stream):
+            try:
+                if self.limits is not None:
+                    # before the local file header is read
+                    self.limits.checkEntry(zinfo)
+                mismatched = zinfo.checkLocalHeader(zinfo.readLocalHeader(stream))
+                if mismatched:
+                    return DictObject({
+                        'filename': zinfo.filename,
+                        'error': 'local file header mismatch: ' + ', '.join(mismatched),
+                        'fields': mismatched,
+                    })
+                for _ in zinfo.iterContent(password=password, stream=stream):
+                    pass
+            except Exception as err:
+                return DictObject({
+                    'filename': zinfo.filename,
+                    'error': '{}: {}'.format(err.__class__.__name__, err),
+                    'exception': err,
+                })
+
+        return [report for report in self._mapEntries(test, self._fileInfos, workers) if report is not None]
+
+    def _openWorkerStream(self):
+        '''
+        a private stream for a worker thread, or self.stream when the archive
+        was not given as a path or a ByteSource
+        '''
+        if isinstance(self.file, basestring):
+            return open(self.file, 'rb')
+        if isinstance(self.file, ByteSource):
+            return ByteSourceStream(self.file)
+        return self.stream
+
+    def _mapEntries(self, func, infos, workers=1):
+        '''
+        calls func(zinfo, stream) for every entry on `workers` threads, returns
+        the results in the order of infos. threads without a private stream take
+        turns on self.stream.
+        '''
+        infos = list(infos)
+        if workers <= 1 or len(infos) <= 1:
+            return [func(zinfo, self.stream) for zinfo in infos]
+
+        results = [None] * len(infos)
+        errors = []
+        queue = Queue.Queue()
+        for item in enumerate(infos):
+            queue.put(item)
+
+        def worker():
+            stream = self._openWorkerStream()
+            try:
+                while not errors:
+                    try:
+                        index, zinfo = queue.get_nowait()
+                    except Queue.Empty:
+                        return
+                    if stream is self.stream:
+                        with self._lock:
+                            results[index] = func(zinfo, stream)
+                    else:
+                        results[index] = func(zinfo, stream)
+            except BaseException:
+                errors.append(sys.exc_info())
+            finally:
+                if stream is not self.stream:
+                    stream.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(min(workers, len(infos)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
+        return results
+
+
+def _grepChunks(chunks, regex, max_line):
+    '''
+    yields (offset, line number, line) of the lines of the content in chunks
+    which regex matches, offset is the one of the match. lines are put together
+    across chunks, lines longer than max_line are split at that length. the
+    regex is searched block by block, the complete lines at hand, so a match
+    spanning lines is only found when they are in the same block.
+    '''
+    base = 0
+    line_number = 1
+    buf = ''
+    for chunk in itertools.chain(chunks, [None]):
+        if chunk is None:
+            end = len(buf)
+        else:
+            buf += chunk
+            end = buf.rfind('\n') + 1
+            if not end:
+                if len(buf) < max_line:
+                    continue
+                end = len(buf)
+        block, buf = buf[:end], buf[end:]
+
+        position = 0
+        while position < len(block):
+            match = regex.search(block, position)
+            # an empty match behind the last newline belongs to the next block
+            if match is None or (match.start() >= len(block) and block.endswith('\n')):
+                break
+            start = block.rfind('\n', 0, match.start()) + 1
+            stop = block.find('\n', match.start())
+            if stop < 0:
+                stop = len(block)
+            line_number += block.count('\n', position, start)
+            yield base + match.start(), line_number, block[start:stop]
+            position = stop + 1
+            line_number += 1
+        if position < len(block):
+            line_number += block.count('\n', position)
+        elif position > len(block):
+            # the last line of the block had no newline
+            line_number -= 1
+        base += len(block)
+
+
+def _entryKey(zinfo):
+    '''
+    what diff compares of an entry: the central directory fields which tell
+    its content and metadata, but not its position in the archive
+    '''
+    return (zinfo.crc32, zinfo.csize, zinfo.ucsize, zinfo.compression_method,
+            tuple(zinfo.last_mod_dos_datetime), dropExtra(zinfo.extra_field, ZipExtra.ZIP64))
+
+
+def diff(old, new):
+    '''
+    compare the central directories of the ZipReaders old and new, nothing is
+    read nor decompressed. returns a DictObject of
+        added: [zinfo of new]
+        removed: [zinfo of old]
+        modified: [(zinfo of old, zinfo of new)], same name, other crc32,
+            sizes, method, date time or extra fields
+        renamed: [(zinfo of old, zinfo of new)], a removed and an added entry
+            with the same crc32 and size, empty entries are not matched
+    the lists are in the central directory order of their archive
+    '''
+    old_infos = old._fileInfosDict
+    new_infos = new._fileInfosDict
+    added, removed, modified = [], [], []
+    for zinfo in new.infolist():
+        # later duplicates of a name win like in ZipReader.getinfo
+        if new_infos[zinfo.filename] is not zinfo:
+            continue
+        old_zinfo = old_infos.get(zinfo.filename)
+        if old_zinfo is None:
+            added.append(zinfo)
+        elif _entryKey(old_zinfo) != _entryKey(zinfo):
+            modified.append((old_zinfo, zinfo))
+    for zinfo in old.infolist():
+        if old_infos[zinfo.filename] is zinfo and zinfo.filename not in new_infos:
+            removed.append(zinfo)
+
+    candidates = {}
+    for zinfo in removed:
+        if zinfo.ucsize:
+            candidates.setdefault((zinfo.crc32, zinfo.ucsize), []).append(zinfo)
+    renamed = []
+    for zinfo in added:
+        matches = candidates.get((zinfo.crc32, zinfo.ucsize))
+        if matches:
+            renamed.append((matches.pop(0), zinfo))
+    if renamed:
+        moved = set(id(zinfo) for pair in renamed for zinfo in pair)
+        added = [zinfo for zinfo in added if id(zinfo) not in moved]
+        removed = [zinfo for zinfo in removed if id(zinfo) not in moved]
+    return DictObject({'added': added, 'removed': removed, 'modified': modified, 'renamed': renamed})
 
 
 class ZipWriter(object):
+    # central directory headers are kept in memory up to this many bytes, then
+    # spilled to a temporary file
+    CENTRAL_DIR_SPOOL_SIZE = 1 << 24
+    # chunk size of copying the central directory into the archive on close
+    CENTRAL_DIR_COPY_SIZE = 1 << 20
+    # prepared entry data larger than this waits for its turn in a spool file
+    # of the producer thread instead of in memory
+    SPOOL_ENTRY_SIZE = 1 << 22
+    # headers and small entries are gathered into writes of this many bytes
+    BUFFER_SIZE = 1 << 20
+    # write_tree: entries read and compressed ahead of the one being written,
+    # per worker
+    TREE_READ_AHEAD = 4
 
     KWS_DEFAULT = dict(
         password=None,
         cryption=None,
         compression_method=Compressor.ZIP_DEFLATED,
+        compression_level=None,
+        store_suffixes=None,
         comment=''
     )
     KWS_EXPECT = expect.ExpectDict({
         'password': expect.ExpectStr(noneable=True),
         'cryption': expect.ExpectStr(enum=Crypt.types, noneable=True),
         'compression_method': expect.ExpectInt(),
+        'compression_level': expect.ExpectInt(min=-1, max=10, noneable=True),
+        'store_suffixes': expect.ExpectList(str, noneable=True),
         'comment': expect.ExpectStr(noneable=True),
     }, strict=True)
 
-    def __init__(self, file, **kws):
+    def __init__(self, file, stats=None, buffer_size=None, mode='w', **kws):
         '''
+        stats: True or an util.stats.Stats instance, see `ZipReader.__init__`
+        buffer_size: flush size of the output buffer, BUFFER_SIZE by default,
+            0 writes every header and entry straight to file
+        mode: 'w' creates the archive, 'a' appends entries to an existing one
         kws supports:
             password = bytes
             cryption = 'ZIP', 'AES_128', 'AES_192', 'AES_256'
             compression_method = number
+            compression_level = zlib level, -1 to 9
+            store_suffixes = ['.jpg', ...], names ending with one of them
+                are stored without compression
             zip64 = True | False
             comment = bytes
 
         '''
         self.file = file
+        self.stats = makeStats(stats)
+        if mode not in ('w', 'a'):
+            raise ValueError('mode must be `w` or `a`, got {!r}'.format(mode))
         if isinstance(file, basestring):
             self.filename = file
-            self.stream = open(file, 'wb')
+            self.raw_stream = open(file, 'wb' if mode == 'w' else 'r+b')
         else:
             self.filename = getattr(file, 'name')
-            self.stream = file
+            self.raw_stream = file
 
-        self._fileInfos = []
-        self._fileInfosDict = {}
+        # imported by writers only, readers do without
+        import tempfile
+        # packed central directory headers of the written entries, no ZipInfo
+        # is kept, so memory stays flat whatever the entry count
+        self._central_dir = tempfile.SpooledTemporaryFile(max_size=self.CENTRAL_DIR_SPOOL_SIZE)
+        self.entry_count = 0
         self.is_zip64 = False
+        if mode == 'a':
+            self._openAppend(kws)
+
+        if buffer_size is None:
+            buffer_size = self.BUFFER_SIZE
+        if buffer_size:
+            self.stream = BufferedWriter(self.raw_stream, buffer_size)
+        else:
+            self.stream = self.raw_stream
+
+        # writestr may be called from several threads: entries are compressed
+        # and encrypted in parallel, and appended one at a time under the lock
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._spools = []
 
         # expect
         default = self.KWS_DEFAULT.copy()
@@ -202,23 +1033,87 @@ class ZipWriter(object):
         if self.cryption and not self.password:
             raise Exception('needs password argument')
 
-    def writestr(self, filename, content, comment='', date_time=None):
+    def _openAppend(self, kws):
+        '''
+        take over the central directory of the archive in raw_stream, new
+        entries overwrite it
+        '''
+        reader = ZipReader(self.raw_stream)
+        for zinfo, header in reader.rawHeaders():
+            self._central_dir.write(header)
+            if zinfo.is_zip64:
+                self.is_zip64 = True
+        self.entry_count = len(reader.infolist())
+        if 'comment' not in kws:
+            kws['comment'] = reader.zipfile_comment
+        self.raw_stream.seek(reader.end_central_dir.offset_start_central_dir, os.SEEK_SET)
+        self.raw_stream.truncate()
+
+    def _zipInfo(self, filename, comment=''):
+        method = self.compression_method
+        if self.store_suffixes and filename.lower().endswith(tuple(self.store_suffixes)):
+            method = Compressor.ZIP_STORE
         zipinfo = ZipInfo(self.stream,
                           password=self.password,
                           comment=comment,
                           cryption=self.cryption,
-                          compression_method=self.compression_method)
+                          compression_method=method,
+                          compression_level=self.compression_level)
+        zipinfo.stats = self.stats
+        return zipinfo
+
+    def writestr(self, filename, content, comment='', date_time=None):
+        zipinfo = self._zipInfo(filename, comment=comment)
 
         if date_time is None:
             date_time = time.localtime(time.time())[:6]
-        zipinfo.write(
+        data = zipinfo.prepare(
             filename,
             content=content,
             isdir=False,
             date_time=date_time)
+        if len(data) > self.SPOOL_ENTRY_SIZE:
+            data = self._spool(data)
+        self._commit(zipinfo, data)
+
+    def _encoder(self, filename, comment='', date_time=None):
+        '''
+        an EntryEncoder of content coming in chunks, its data goes to `_commit`
+        '''
+        zipinfo = self._zipInfo(filename, comment=comment)
+        if date_time is None:
+            date_time = time.localtime(time.time())[:6]
+        return EntryEncoder(zipinfo, filename, date_time, self.SPOOL_ENTRY_SIZE)
+
+    def _commit(self, zipinfo, data):
+        '''
+        append the prepared entry, the only step which takes the lock
+        '''
+        with self._lock:
+            zipinfo.commit(data)
+            self._addCentralDirHeader(zipinfo)
+
+    def _spool(self, data):
+        '''
+        the spool file of the current thread, holding data
+        '''
+        spool = getattr(self._local, 'spool', None)
+        if spool is None:
+            import tempfile
+            spool = self._local.spool = tempfile.TemporaryFile()
+            with self._lock:
+                self._spools.append(spool)
+        spool.seek(0, os.SEEK_SET)
+        spool.truncate()
+        spool.write(data)
+        spool.seek(0, os.SEEK_SET)
+        return spool
 
-        self._fileInfos.append(zipinfo)
-        self._fileInfosDict[zipinfo.filename] = zipinfo
+    def _addCentralDirHeader(self, zipinfo):
+        self._central_dir.write(zipinfo.dir_header.pack())
+        self.entry_count += 1
+        if zipinfo.is_zip64:
+            self.is_zip64 = True
 
     def write(self, filename, comment=''):
         st = os.stat(filename)
@@ -232,52 +1127,265 @@ class ZipWriter(object):
 
         self.writestr(filename, content, comment=comment, date_time=date_time)
 
+    def copy_from(self, zipreader, members=None):
+        '''
+        copy entries (default: all) of zipreader as they are: local header,
+        data and data descriptor are not decompressed nor decrypted, only the
+        offset in the central directory header is changed
+        '''
+        names = None if members is None else set(members)
+        ends = zipreader._entryEnds()
+        for zinfo, header in zipreader.rawHeaders():
+            if names is not None and zinfo.filename not in names:
+                continue
+            start = zinfo.relative_offset_file_header
+            end = ends[start]
+            with self._lock:
+                header = self._relocateHeader(header, self.stream.tell())
+                while start < end:
+                    with zipreader._lock:
+                        zipreader.stream.seek(start, os.SEEK_SET)
+                        data = zipreader.stream.read(min(end - start, self.CENTRAL_DIR_COPY_SIZE))
+                    if not data:
+                        raise BadZipfile('unexpected end of archive', zinfo.filename)
+                    self.stream.write(data)
+                    start += len(data)
+                self._central_dir.write(header)
+                self.entry_count += 1
+                if zinfo.is_zip64:
+                    self.is_zip64 = True
+
+    def _relocateHeader(self, header, offset):
+        '''
+        raw central directory header with its local header offset set to offset
+        '''
+        fields = CENTRAL_FIXED_HEADER.unpack_from(header)
+        if fields[16] != 0xFFFFFFFF:
+            if offset >= 0xFFFFFFFF:
+                raise BadZipfile('raw copy at offset {} needs a zip64 extra field'.format(offset))
+            return header[:42] + struct.pack('<L', offset) + header[46:]
+
+        # the offset is in the zip64 extra field, behind the sizes which are
+        # stored there too
+        position = CENTRAL_FIXED_HEADER.size + fields[10]
+        extra_end = position + fields[11]
+        while position + 4 <= extra_end:
+            header_id, length = struct.unpack_from('<HH', header, position)
+            if header_id == 0x0001:
+                field = position + 4 + 8 * [fields[9], fields[8]].count(0xFFFFFFFF)
+                return header[:field] + struct.pack('<Q', offset) + header[field + 8:]
+            position += 4 + length
+        raise BadZipfile('zip64 extra field without local header offset')
+
+    def write_tree(self, root, arcname_prefix='', include=None, exclude=None, workers=4):
+        '''
+        archive the tree under root, entries are named arcname_prefix + the
+        relative path and are written in sorted order. directories empty on
+        disk are written as `dir/` entries, directories which only the filters
+        leave empty are not.
+        include / exclude: glob patterns (see nameindex.translate) matched
+            against relative paths, `dir/` for directories. excluded
+            directories are not scanned, include applies to files and empty
+            directories
+        workers: threads which stat, read and compress files ahead of the one
+            being written
+        '''
+        entries = self._scanTree(root, include, exclude)
+        if arcname_prefix and not arcname_prefix.endswith('/'):
+            arcname_prefix += '/'
+
+        tasks = Queue.Queue()
+        results = {}
+        ready = threading.Condition()
+
+        def worker():
+            while True:
+                task = tasks.get()
+                if task is None:
+                    return
+                index, relpath, path = task
+                try:
+                    result = self._prepareTreeEntry(arcname_prefix + relpath, path)
+                except BaseException:
+                    result = sys.exc_info()
+                with ready:
+                    results[index] = result
+                    ready.notify_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(max(workers, 1))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        window = max(workers, 1) * self.TREE_READ_AHEAD
+        submitted = 0
+        try:
+            for index in xrange(len(entries)):
+                while submitted < len(entries) and submitted < index + window:
+                    tasks.put((submitted,) + entries[submitted])
+                    submitted += 1
+                with ready:
+                    while index not in results:
+                        ready.wait()
+                    result = results.pop(index)
+                if len(result) == 3:
+                    raise result[0], result[1], result[2]
+                zipinfo, data = result
+                with self._lock:
+                    zipinfo.commit(data)
+                    self._addCentralDirHeader(zipinfo)
+                if not isinstance(data, str):
+                    data.close()
+        finally:
+            while True:
+                try:
+                    tasks.get_nowait()
+                except Queue.Empty:
+                    break
+            for thread in threads:
+                tasks.put(None)
+            for thread in threads:
+                thread.join()
+
+    def _scanTree(self, root, include=None, exclude=None):
+        '''
+        sorted [(relpath, path)] of the files and empty directories under root,
+        directories end with `/`. symlinks to directories are not followed,
+        broken symlinks are skipped.
+        '''
+        include = [re.compile(translate(pattern)) for pattern in include or []]
+        exclude = [re.compile(translate(pattern)) for pattern in exclude or []]
+
+        def excluded(relpath):
+            return any(regex.match(relpath) for regex in exclude)
+
+        def included(relpath):
+            return not include or any(regex.match(relpath) for regex in include)
+
+        entries = []
+        stack = ['']
+        while stack:
+            reldir = stack.pop()
+            path = os.path.join(root, reldir) if reldir else root
+            listing = self._listDir(path)
+            for name, isdir in listing:
+                relpath = reldir + name
+                if excluded(relpath) or isdir and excluded(relpath + '/'):
+                    continue
+                if isdir:
+                    stack.append(relpath + '/')
+                elif included(relpath):
+                    entries.append((relpath, os.path.join(path, name)))
+            if reldir and not listing and included(reldir):
+                entries.append((reldir, path))
+        entries.sort()
+        return entries
+
+    def _listDir(self, path):
+        '''
+        [(name, isdir)] of path, from the directory entry types when scandir
+        is available, otherwise from a stat per name. symlinks to directories,
+        broken symlinks and anything but regular files and directories are
+        left out.
+        '''
+        try:
+            from scandir import scandir
+        except ImportError:
+            scandir = None
+        if scandir is not None:
+            return [(entry.name, entry.is_dir(follow_symlinks=False)) for entry in scandir(path)
+                    if entry.is_dir(follow_symlinks=False) or entry.is_file()]
+        listing = []
+        for name in os.listdir(path):
+            child = os.path.join(path, name)
+            isdir = os.path.isdir(child)
+            if isdir and not os.path.islink(child) or os.path.isfile(child):
+                listing.append((name, isdir))
+        return listing
+
+    def _prepareTreeEntry(self, arcname, path):
+        st = os.stat(path)
+        isdir = stat.S_ISDIR(st.st_mode)
+        content = ''
+        if not isdir:
+            with open(path, 'rb') as fd:
+                content = fd.read()
+        zipinfo = self._zipInfo(arcname)
+        data = zipinfo.prepare(arcname, content=content, isdir=isdir,
+                               date_time=time.localtime(st.st_mtime)[:6])
+        if len(data) > self.SPOOL_ENTRY_SIZE:
+            # a spool of its own, the worker goes on with the next entry
+            import tempfile
+            spool = tempfile.TemporaryFile()
+            spool.write(data)
+            spool.seek(0, os.SEEK_SET)
+            data = spool
+        return zipinfo, data
+
     def __enter__(self):
         return self
 
     def __exit__(self, type, value, traceback):
         self.close()
 
+    @timed('close', lambda self, result: self.size_central_dir)
     def close(self):
-        if len(self._fileInfos) > ZIP_FILECOUNT_LIMIT:
-            self.is_zip64 = True
         # write central directory header
         central_directory_header_offset = self.stream.tell()
-        for zipinfo in self._fileInfos:
-            self.stream.write(zipinfo.dir_header.pack())
-            if zipinfo.is_zip64:
-                self.is_zip64 = True
+        central_dir = self._central_dir
+        central_dir.seek(0, os.SEEK_SET)
+        while True:
+            data = central_dir.read(self.CENTRAL_DIR_COPY_SIZE)
+            if not data:
+                break
+            self.stream.write(data)
+        central_dir.close()
+        for spool in self._spools:
+            spool.close()
         size_central_dir = self.stream.tell() - central_directory_header_offset
+        self.size_central_dir = size_central_dir
+        if self.entry_count > ZIP_FILECOUNT_LIMIT or \
+                max(size_central_dir, central_directory_header_offset) >= 0xFFFFFFFF:
+            self.is_zip64 = True
+        # the end records go out in one write
+        records = []
         if self.is_zip64:
             # zip64 end of central directory record
             offset_zip64_central_dir_record = self.stream.tell()
-            self.stream.write(struct_zip64_central_dir_record(
+            records.append(struct_zip64_central_dir_record(
                 data_length=44,
                 version_made_by=(20, 3),
                 version_needed_to_extract=(20, 0),
                 disk_index=0,
                 disk_index_with_start_central_dir=0,
-                total_entries_central_dir_disk=len(self._fileInfos),
-                total_entries_central_dir=len(self._fileInfos),
+                total_entries_central_dir_disk=self.entry_count,
+                total_entries_central_dir=self.entry_count,
                 size_central_dir=size_central_dir,
                 offset_start_central_dir=central_directory_header_offset,
             ).pack())
             # zip64 end of central directory locator
-            self.stream.write(struct_zip64_central_dir_locator(
+            records.append(struct_zip64_central_dir_locator(
                 offset_zip64_central_dir_record=offset_zip64_central_dir_record,
                 disk_total=1,
             ).pack())
 
         # write end of central directory record
         self.end_central_dir = struct_end_central_dir_record(
-            total_entries_central_dir_disk=0xFFFF if self.is_zip64 else len(self._fileInfos),
-            total_entries_central_dir=0xFFFF if self.is_zip64 else len(self._fileInfos),
+            total_entries_central_dir_disk=0xFFFF if self.is_zip64 else self.entry_count,
+            total_entries_central_dir=0xFFFF if self.is_zip64 else self.entry_count,
             size_central_dir=0xFFFFFFFF if self.is_zip64 else size_central_dir,
             offset_start_central_dir=0xFFFFFFFF if self.is_zip64 else central_directory_header_offset,
             zipfile_comment_length=len(self.comment),
             zipfile_comment=self.comment
         )
-        self.stream.write(self.end_central_dir.pack())
+        records.append(self.end_central_dir.pack())
+        self.stream.write(''.join(records))
+        if self.stream is not self.raw_stream:
+            self.stream.flush()
 
         if isinstance(self.file, basestring):
-            self.stream.close()
+            self.raw_stream.close()
+
+
+if __name__ == '__main__':
+    from zipcli import main
+    sys.exit(main())
@@ -0,0 +1,225 @@
+#!coding=utf8
+"""
+Rebuild the central directory of a truncated or damaged archive from its local
+file headers, see `ZipReader(file, recover=True)`.
+"""
+import os
+import mmap
+import zlib
+import struct
+
+from util.compress import Compressor
+from util.stream import WindowStream
+from zipextra import ZipExtra, dropExtra
+from zipinfo import ZipInfo, LOCAL_FIXED_HEADER, ZIP64_FILESIZE_LIMIT, localSizes
+
+from struct_def import *
+
+
+# signatures allowed right behind an entry
+NEXT_SIGNATURES = (Signature.FILE_HEADER, Signature.CENTRAL_HEADER,
+                   Signature.ZIP64_RECORD, Signature.CENTRAL_RECORD)
+# deflate data of unknown size is inflated in chunks of this size to find its end
+INFLATE_CHUNK_SIZE = 1 << 20
+
+
+class _Truncated(Exception):
+    '''
+    the entry would run past the end of the file: it is cut off, or it is no
+    entry at all but a damaged header with sizes out of range
+    '''
+
+
+def mapStream(stream):
+    '''
+    read-only mmap of the file behind stream, the content of in-memory streams
+    without file descriptor
+    '''
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    try:
+        fileno = stream.fileno()
+    except (AttributeError, IOError):
+        fileno = None
+    if fileno is None or not size:
+        stream.seek(0, os.SEEK_SET)
+        return stream.read()
+    return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+
+
+def scanEntries(data, stream=None, password=None):
+    '''
+    yields (zinfo, raw central directory header, end) for every intact entry
+    of data, a mmap or str of the whole archive, in one forward pass. local
+    file headers are looked up with find and the data of an accepted entry is
+    skipped at once, an entry counts when its header parses, its end is known
+    from the sizes or the data descriptor and a signature or the end of the
+    file follows it. a candidate running past the end of the file is passed
+    over like any other non-entry, intact entries behind it are still found.
+    zinfo reads from stream.
+    '''
+    offset = data.find(Signature.FILE_HEADER)
+    while offset >= 0:
+        try:
+            entry = _checkEntry(data, offset)
+        except _Truncated:
+            entry = None
+        if entry is None:
+            offset = data.find(Signature.FILE_HEADER, offset + 1)
+            continue
+
+        file_header, crc32, csize, ucsize, data_offset, end = entry
+        header = centralHeader(file_header, offset, crc32, csize, ucsize)
+        zinfo = ZipInfo(stream, password=password)
+        zinfo.readHeader(WindowStream(header))
+        zinfo.data_offset = data_offset
+        zinfo.local_csize = csize
+        yield zinfo, header, end
+        offset = data.find(Signature.FILE_HEADER, end)
+
+
+def _checkEntry(data, offset):
+    '''
+    (file_header, crc32, csize, ucsize, data_offset, end) of the entry at
+    offset, None if there is no entry
+    '''
+    size = len(data)
+    if offset + LOCAL_FIXED_HEADER.size > size:
+        raise _Truncated()
+    fields = LOCAL_FIXED_HEADER.unpack(data[offset:offset + LOCAL_FIXED_HEADER.size])
+    version, flag, method = fields[1:4]
+    filename_length, extra_length = fields[9:11]
+    if (version & 0xFF) > 63 or not filename_length:
+        return None
+    if method not in Compressor._dict_ and method != Compressor.AES_ENCRYPTED:
+        return None
+    if method == Compressor.AES_ENCRYPTED and not flag & 0x1:
+        return None
+    data_offset = offset + LOCAL_FIXED_HEADER.size + filename_length + extra_length
+    if data_offset > size:
+        raise _Truncated()
+
+    try:
+        file_header = struct_local_file_header.parseStream(WindowStream(data[offset:data_offset], offset))
+        extra = ZipExtra(file_header.extra_field)
+        if flag & 0x800:
+            file_header.filename.decode('utf-8')
+        csize, ucsize = localSizes(file_header)
+    except Exception:
+        return None
+    crc32 = file_header.crc32
+
+    if flag & 0x8:
+        is_zip64 = extra.getExtra(ZipExtra.ZIP64) is not None
+        if method == Compressor.ZIP_DEFLATED and not flag & 0x1:
+            descriptor = _inflateEnd(data, data_offset)
+            if descriptor is None:
+                return None
+            crc32, csize, ucsize, end = _readDescriptor(data, descriptor, is_zip64)
+            if csize != descriptor - data_offset:
+                return None
+        else:
+            crc32, csize, ucsize, end = _findDescriptor(data, data_offset, is_zip64)
+    else:
+        end = data_offset + csize
+        if end > size:
+            raise _Truncated()
+
+    if end < size and data[end:end + 4] not in NEXT_SIGNATURES:
+        return None
+    return file_header, crc32, csize, ucsize, data_offset, end
+
+
+def _inflateEnd(data, start):
+    '''
+    end of the deflate stream at start, None if it is not one
+    '''
+    decompressor = zlib.decompressobj(-15)
+    position = start
+    try:
+        while position < len(data):
+            chunk = data[position:position + INFLATE_CHUNK_SIZE]
+            # output is dropped, max_length keeps it small whatever the ratio
+            decompressor.decompress(chunk, INFLATE_CHUNK_SIZE)
+            # python 2 leaves the input behind the end of the stream in
+            # unconsumed_tail as well
+            while decompressor.unconsumed_tail and not decompressor.unused_data:
+                decompressor.decompress(decompressor.unconsumed_tail, INFLATE_CHUNK_SIZE)
+            if decompressor.unused_data:
+                return position + len(chunk) - len(decompressor.unused_data)
+            position += len(chunk)
+    except zlib.error:
+        return None
+    raise _Truncated()
+
+
+def _readDescriptor(data, position, is_zip64):
+    '''
+    (crc32, csize, ucsize, end) of the data descriptor at position, whose
+    signature is optional
+    '''
+    if data[position:position + 4] == Signature.DATA_DESCRIPTOR:
+        position += 4
+    descriptor = struct.Struct('<LQQ' if is_zip64 else '<LLL')
+    if position + descriptor.size > len(data):
+        raise _Truncated()
+    crc32, csize, ucsize = descriptor.unpack(data[position:position + descriptor.size])
+    return crc32, csize, ucsize, position + descriptor.size
+
+
+def _findDescriptor(data, start, is_zip64):
+    '''
+    (crc32, csize, ucsize, end) of the first data descriptor behind start
+    whose compressed size matches its distance, stored and encrypted data
+    tell no end of their own so the descriptor signature is required here
+    '''
+    position = data.find(Signature.DATA_DESCRIPTOR, start)
+    while position >= 0:
+        crc32, csize, ucsize, end = _readDescriptor(data, position, is_zip64)
+        if csize == position - start:
+            return crc32, csize, ucsize, end
+        position = data.find(Signature.DATA_DESCRIPTOR, position + 1)
+    raise _Truncated()
+
+
+def centralHeader(file_header, offset, crc32, csize, ucsize):
+    '''
+    packed central directory header of the local file_header at offset, with
+    the sizes found by the scan and a zip64 extra field laid out like the one
+    of ZipInfo.commit
+    '''
+    zip64_fields = []
+    values = {'ucsize': ucsize, 'csize': csize, 'relative_offset_file_header': offset}
+    for key in ['ucsize', 'csize', 'relative_offset_file_header']:
+        if values[key] > ZIP64_FILESIZE_LIMIT:
+            zip64_fields.append(values[key])
+            values[key] = 0xFFFFFFFF
+
+    # the local zip64 extra field holds both sizes, it is replaced
+    extra_field = dropExtra(file_header.extra_field, Signature.EXTRA_ZIP64)
+    if zip64_fields:
+        extra_field += struct_extra_zip64(
+            data_length=len(zip64_fields) * 8,
+            data=pack_zip64_data(zip64_fields)
+        ).pack()
+
+    filename = file_header.filename
+    return struct_central_dir_header(
+        version_made_by=(20, 3),
+        version_needed_to_extract=file_header.version_needed_to_extract,
+        general_purpose_bit_flag=file_header.general_purpose_bit_flag,
+        compression_method=file_header.compression_method,
+        last_mod_dos_datetime=file_header.last_mod_dos_datetime,
+        crc32=crc32,
+        filename_length=len(filename),
+        extra_field_length=len(extra_field),
+        file_comment_length=0,
+        internal_file_attributes=0,
+        # MS-DOS directory attribute
+        external_file_attributes=0x10 if filename.endswith('/') else 0,
+        filename=filename,
+        extra_field=extra_field,
+        file_comment='',
+        **values
+    ).pack()
+
@@ -0,0 +1,313 @@
+#!coding=utf8
+"""
+Serve entries of ZIP files over HTTP, without extracting them.
+
+    python zipserver.py assets=assets.zip docs=docs.zip --port 8000
+
+GET /assets/css/site.css serves entry `css/site.css` of assets.zip. Range
+requests are served from the data of stored entries and through a seekable
+inflater for deflated ones. ETags come from crc32 and size. Clients accepting
+`deflate` get the data of deflated entries passed through in the zlib format,
+which get ETags of their own.
+"""
+import os
+import re
+import sys
+import zlib
+import struct
+import urllib
+import argparse
+import mimetypes
+import threading
+import BaseHTTPServer
+import SocketServer
+from collections import OrderedDict
+
+from util.compress import Compressor, inflate
+from zippkg import ZipReader
+from zipextfile import SeekableZipExtFile, CheckpointIndex
+
+# zlib header of deflate data with a 32K window, `Content-Encoding: deflate`
+# is the zlib format of RFC 1950 around the raw deflate data of the entry
+ZLIB_HEADER = '\x78\x01'
+
+
+class ZipHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    verbose = False
+    # range requests on compressed entries resume from the checkpoints left
+    # by earlier ones, kept for this many entries of this many bytes each
+    RANGE_INDEXES = 16
+    RANGE_CHECKPOINT_BYTES = 4 << 20
+
+    def __init__(self, address, readers, password=None):
+        '''
+        readers: {mount: ZipReader}, mount '' serves at the root
+        '''
+        BaseHTTPServer.HTTPServer.__init__(self, address, ZipRequestHandler)
+        self.readers = readers
+        self.password = password
+        # {zinfo: CheckpointIndex} in least recently used order
+        self._indexes = OrderedDict()
+        self._indexes_lock = threading.Lock()
+
+    def checkpointIndex(self, zinfo):
+        '''
+        the CheckpointIndex of zinfo shared by its range requests
+        '''
+        with self._indexes_lock:
+            index = self._indexes.pop(zinfo, None)
+            if index is None:
+                index = CheckpointIndex(SeekableZipExtFile.SPAN, self.RANGE_CHECKPOINT_BYTES)
+            self._indexes[zinfo] = index
+            while len(self._indexes) > self.RANGE_INDEXES:
+                self._indexes.popitem(last=False)
+        return index
+
+    def lookup(self, path):
+        '''
+        (reader, zinfo) of an url path, (None, None) when there is no such entry,
+        UnicodeDecodeError when the path is not utf8
+        '''
+        path = urllib.unquote(path.split('?', 1)[0]).decode('utf8').lstrip('/')
+        for mount, reader in self.readers.iteritems():
+            if not mount:
+                name = path
+            elif path.startswith(mount + '/'):
+                name = path[len(mount) + 1:]
+            else:
+                continue
+            zinfo = reader._fileInfosDict.get(name)
+            if zinfo is not None and not name.endswith('/'):
+                return reader, zinfo
+        return None, None
+
+
+class ZipRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers go out one write each, keep them from waiting on delayed acks
+    disable_nagle_algorithm = True
+    RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+    CHUNK_SIZE = 1 << 16
+
+    def do_HEAD(self):
+        self.serve(send_body=False)
+
+    def do_GET(self):
+        self.serve(send_body=True)
+
+    def serve(self, send_body):
+        try:
+            reader, zinfo = self.server.lookup(self.path)
+        except UnicodeDecodeError:
+            return self.sendEmpty(400)
+        if zinfo is None:
+            return self.sendEmpty(404)
+
+        etag = '"{:08x}-{:x}"'.format(zinfo.crc32, zinfo.ucsize)
+        byte_range = self.parseRange(zinfo.ucsize, etag)
+        deflate = byte_range is None and self.acceptsDeflate() and not zinfo.is_encrypted and \
+            zinfo.compression_method == Compressor.ZIP_DEFLATED
+        if deflate:
+            etag = '"{:08x}-{:x}-deflate"'.format(zinfo.crc32, zinfo.ucsize)
+        if self.notModified(etag):
+            return self.sendEmpty(304, etag)
+
+        if byte_range is False:
+            self.send_response(416)
+            self.send_header('Content-Range', 'bytes */{}'.format(zinfo.ucsize))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        stream = reader._openWorkerStream()
+        shared = stream is reader.stream
+        # archives not opened from a path have a single stream, requests take
+        # turns on it for every read, never while writing to their client
+        lock = reader._lock if shared else _NoLock()
+        try:
+            self.sendEntry(zinfo, stream, lock, etag, byte_range, deflate, send_body)
+        finally:
+            if not shared:
+                stream.close()
+
+    def sendEntry(self, zinfo, stream, lock, etag, byte_range, deflate, send_body):
+        if byte_range is not None:
+            self.sendRange(zinfo, stream, lock, etag, byte_range, send_body)
+        elif deflate:
+            self.sendDeflated(zinfo, stream, lock, etag, send_body)
+        else:
+            self.sendHeaders(200, zinfo, etag, zinfo.ucsize)
+            if not send_body:
+                return
+            # iterContent seeks for every chunk itself
+            chunks = zinfo.iterContent(password=self.server.password, stream=stream)
+            while True:
+                with lock:
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                self.wfile.write(chunk)
+
+    def sendEmpty(self, code, etag=None):
+        self.send_response(code)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def sendHeaders(self, code, zinfo, etag, length, **headers):
+        self.send_response(code)
+        content_type = mimetypes.guess_type(zinfo.filename)[0] or 'application/octet-stream'
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(length))
+        self.send_header('ETag', etag)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Vary', 'Accept-Encoding')
+        for key, value in headers.iteritems():
+            self.send_header(key.replace('_', '-'), value)
+        self.end_headers()
+
+    def parseRange(self, size, etag):
+        '''
+        (start, end) of a single byte range request, None to send the whole
+        entry, False when it is not satisfiable. several ranges are answered
+        with the whole entry, which the spec allows.
+        '''
+        header = self.headers.get('Range')
+        if not header:
+            return None
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range != etag:
+            return None
+        match = self.RANGE.match(header.strip())
+        if match is None:
+            return None
+        first, last = match.groups()
+        if not first and not last:
+            return None
+        if not first:
+            start, end = max(size - int(last), 0), size
+        else:
+            start = int(first)
+            end = min(int(last) + 1, size) if last else size
+        if start >= size or start >= end:
+            return False
+        return start, end
+
+    def notModified(self, etag):
+        tags = self.headers.get('If-None-Match', '')
+        return any(tag.strip() in (etag, '*') for tag in tags.split(','))
+
+    def acceptsDeflate(self):
+        encodings = self.headers.get('Accept-Encoding', '')
+        return 'deflate' in [e.split(';')[0].strip() for e in encodings.split(',')]
+
+    def sendRange(self, zinfo, stream, lock, etag, byte_range, send_body):
+        start, end = byte_range
+        self.sendHeaders(206, zinfo, etag, end - start,
+                         Content_Range='bytes {}-{}/{}'.format(start, end - 1, zinfo.ucsize))
+        if not send_body:
+            return
+        if not zinfo.is_encrypted and zinfo.compression_method == Compressor.ZIP_STORE:
+            # stored data is the content itself
+            with lock:
+                offset = zinfo.dataOffset(stream)
+            self.sendRaw(stream, lock, offset + start, end - start)
+            return
+        # the SeekableZipExtFile seeks for every read itself
+        with lock:
+            fd = SeekableZipExtFile(zinfo, stream, self.server.password,
+                                    index=self.server.checkpointIndex(zinfo))
+        fd.seek(start)
+        remain = end - start
+        while remain > 0:
+            with lock:
+                data = fd.read(min(self.CHUNK_SIZE, remain))
+            if not data:
+                break
+            self.wfile.write(data)
+            remain -= len(data)
+
+    def sendDeflated(self, zinfo, stream, lock, etag, send_body):
+        '''
+        pass the deflate data through between a zlib header and the adler32
+        trailer, which the data is inflated for on the way as the entry only
+        tells the crc32 of its content
+        '''
+        csize = zinfo.csize
+        self.sendHeaders(200, zinfo, etag, len(ZLIB_HEADER) + csize + 4, Content_Encoding='deflate')
+        if not send_body:
+            return
+        decompressor = zlib.decompressobj(-15)
+        checksum = [zlib.adler32('')]
+
+        def update(data):
+            for piece in inflate(decompressor, data, self.CHUNK_SIZE):
+                checksum[0] = zlib.adler32(piece, checksum[0])
+
+        with lock:
+            offset = zinfo.dataOffset(stream)
+        self.wfile.write(ZLIB_HEADER)
+        self.sendRaw(stream, lock, offset, csize, update)
+        checksum[0] = zlib.adler32(decompressor.flush(), checksum[0])
+        self.wfile.write(struct.pack('>L', checksum[0] & 0xffffffff))
+
+    def sendRaw(self, stream, lock, offset, length, update=None):
+        '''
+        send length bytes of stream at offset, update is called with every
+        chunk sent
+        '''
+        while length > 0:
+            with lock:
+                stream.seek(offset, os.SEEK_SET)
+                data = stream.read(min(self.CHUNK_SIZE, length))
+            if not data:
+                break
+            offset += len(data)
+            self.wfile.write(data)
+            if update is not None:
+                update(data)
+            length -= len(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class _NoLock(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('archives', nargs='+', help='[mount=]archive.zip')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--password', default=None)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    readers = {}
+    for archive in args.archives:
+        mount, _, path = archive.rpartition('=')
+        readers[mount.strip('/')] = ZipReader(path, password=args.password)
+    server = ZipHTTPServer((args.host, args.port), readers, password=args.password)
+    server.verbose = args.verbose
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for reader in readers.itervalues():
+            reader.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
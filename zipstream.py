@@ -0,0 +1,188 @@
+#!coding=utf8
+"""
+Read ZIP files forward-only from non-seekable streams.
+"""
+import zlib
+import struct
+
+from util import BadZipfile
+from util.compress import Compressor, inflate
+from util.stats import makeStats
+from util.stream import PushbackStream
+from zipinfo import ZipInfo
+
+from struct_def import *
+
+
+class ZipStreamReader(object):
+    '''
+    walks the local file headers of any readable stream (pipe, socket, http
+    upload) and yields (zinfo, chunks) for every entry, chunks iterates over
+    the decrypted and decompressed content.
+
+        for zinfo, chunks in ZipStreamReader(sys.stdin, password='pwd'):
+            for chunk in chunks:
+                ...
+
+    chunks must be consumed before the next entry, what is left of them is
+    decoded and dropped when iteration goes on.
+
+    limits: an util.limits.Limits for untrusted uploads, sizes and ratios of
+    entries with a data descriptor are checked against the bytes consumed
+    '''
+
+    def __init__(self, file, password=None, chunk_size=ZipInfo.CHUNK_SIZE, stats=None, limits=None):
+        self.file = file
+        self.password = password
+        self.chunk_size = chunk_size
+        self.stats = makeStats(stats)
+        self.limits = limits
+        self.stream = PushbackStream(file)
+
+    def __iter__(self):
+        stream = self.stream
+        count = 0
+        while True:
+            offset = stream.tell()
+            signature = stream.read(4)
+            if signature in (Signature.CENTRAL_HEADER, Signature.ZIP64_RECORD, Signature.CENTRAL_RECORD):
+                return
+            elif signature != Signature.FILE_HEADER:
+                raise BadZipfile("unexpected signature {!r} at {}".format(signature, offset))
+
+            count += 1
+            if self.limits is not None:
+                self.limits.checkEntries(count)
+            stream.unread(signature)
+            zinfo = ZipInfo(stream, password=self.password)
+            zinfo.stats = self.stats
+            zinfo.limits = self.limits
+            zinfo.readLocalInfo(struct_local_file_header.parseStream(stream), offset)
+            chunks = self._iterContent(zinfo)
+            yield zinfo, chunks
+            for _ in chunks:
+                pass
+
+    def _read(self, size):
+        data = self.stream.read(size)
+        if len(data) != size:
+            raise BadZipfile('unexpected end of file')
+        return data
+
+    def _iterContent(self, zinfo):
+        budget = self.limits.budget(zinfo) if self.limits is not None else None
+        header_length, trailer_length = zinfo._cryptLengths()
+        decrypter = None
+        if zinfo.is_encrypted:
+            decrypter = zinfo._openDecrypter(self._read(header_length), self.password)
+        decompressor = zinfo.compressor.decompressobj()
+
+        has_descriptor = zinfo.general_purpose_bit_flag & 0x8
+        if not has_descriptor:
+            raw_chunks = self._iterSized(zinfo.csize - header_length - trailer_length)
+        elif zinfo.compression_method == Compressor.ZIP_DEFLATED:
+            # the deflate stream tells its own end
+            raw_chunks = self._iterGreedy()
+        else:
+            raw_chunks = self._iterStored(header_length, trailer_length)
+
+        crc = 0
+        ucsize = 0
+        csize = header_length + trailer_length
+        for raw in raw_chunks:
+            data = raw
+            if trailer_length:
+                # AES data is authenticated after the end of the deflate stream is known
+                data = decrypter.decrypt(raw, authenticate=False)
+            elif decrypter:
+                data = decrypter.decrypt(raw)
+            for data in inflate(decompressor, data, self.chunk_size, budget):
+                crc = zlib.crc32(data, crc)
+                ucsize += len(data)
+                yield data
+            unused_length = len(decompressor.unused_data)
+            if unused_length:
+                # bytes read past the deflate stream go back to the stream
+                self.stream.unread(raw[-unused_length:])
+                raw = raw[:-unused_length]
+            if trailer_length:
+                decrypter.authenticate(raw)
+            csize += len(raw)
+            if unused_length:
+                break
+
+        data = decompressor.flush()
+        if data:
+            if budget is not None:
+                budget.add(len(data), 0, 0)
+            crc = zlib.crc32(data, crc)
+            ucsize += len(data)
+            yield data
+
+        if trailer_length:
+            decrypter.verify(self._read(trailer_length))
+        if has_descriptor:
+            self._readDataDescriptor(zinfo)
+        if zinfo.crc32 != 0 and zinfo.crc32 != crc & 0xffffffff:
+            raise BadZipfile('crc32 check failed', zinfo.filename)
+        if (zinfo.csize, zinfo.ucsize) != (csize, ucsize):
+            raise BadZipfile('file size check failed', zinfo.filename)
+        if self.stats is not None:
+            self.stats.emit('read', zinfo, ucsize=ucsize, csize=csize)
+
+    def _iterSized(self, remain):
+        while remain > 0:
+            data = self._read(min(self.chunk_size, remain))
+            remain -= len(data)
+            yield data
+
+    def _iterGreedy(self):
+        while True:
+            data = self.stream.read(self.chunk_size)
+            if not data:
+                raise BadZipfile('unexpected end of file')
+            yield data
+
+    def _iterStored(self, header_length, trailer_length):
+        '''
+        stored data of unknown size ends at a data descriptor whose compressed
+        size matches the bytes read so far. the descriptor signature is optional
+        in the spec but required here, there is no other way to find the end.
+        '''
+        signature = Signature.DATA_DESCRIPTOR
+        # a signature and the crc32 / compressed size behind it, plus the AES
+        # authentication code in front of it, are held back until decided
+        keep = trailer_length + len(signature) + 8 - 1
+        emitted = 0
+        buf = ''
+        while True:
+            data = self.stream.read(self.chunk_size)
+            if not data:
+                raise BadZipfile('data descriptor not found')
+            buf += data
+
+            index = buf.find(signature)
+            while index >= 0 and index + 12 <= len(buf):
+                csize = struct.unpack('<L', buf[index + 8:index + 12])[0]
+                if csize == (header_length + emitted + index) & 0xffffffff:
+                    if index > trailer_length:
+                        yield buf[:index - trailer_length]
+                    self.stream.unread(buf[index - trailer_length:])
+                    return
+                index = buf.find(signature, index + 1)
+
+            if len(buf) > keep:
+                yield buf[:-keep]
+                emitted += len(buf) - keep
+                buf = buf[-keep:]
+
+    def _readDataDescriptor(self, zinfo):
+        data = self._read(4)
+        if data == Signature.DATA_DESCRIPTOR:
+            data = self._read(4)
+        dir_header = zinfo.dir_header
+        dir_header.crc32 = struct.unpack('<L', data)[0]
+        if zinfo.is_zip64:
+            dir_header.csize, dir_header.ucsize = struct.unpack('<QQ', self._read(16))
+        else:
+            dir_header.csize, dir_header.ucsize = struct.unpack('<LL', self._read(8))